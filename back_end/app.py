@@ -1,10 +1,163 @@
-from flask import Flask, request, jsonify
-from pathlib import Path
-import tempfile
+from flask import Flask, Response, request, jsonify, stream_with_context, g
+from concurrent.futures import as_completed
+import json
+import os
+import threading
+import time
 
-from two_marker_detect import calculate_two_markers
+import cv2 as cv
+import numpy as np
+from image_io import decode_image, jpeg_size
+from two_marker_detect import ALGORITHM_VERSION, calculate_two_markers, calculate_windows
+from result_cache import ResultCache
+from two_marker_classes import TwoMarkerDetector
+from jobs import JobQueue, JobQueueFull
+from marker_tracking import MarkerTracker
+from metrics import MetricsRegistry
+import concurrency
+import custom_exceptions
+import interfaces
+import one_marker_detect_v2
+import pipeline
+import workers
+
+# Largest accepted request body. Flask answers larger uploads with 413.
+MAX_UPLOAD_MB = int(os.environ.get("PAINFUL_PREP_MAX_UPLOAD_MB", 25))
+
+# Largest body of a /detect/stream request, which carries many frames. Each
+# frame on its own is still limited to MAX_UPLOAD_MB.
+MAX_STREAM_MB = int(os.environ.get("PAINFUL_PREP_MAX_STREAM_MB", 1024))
+
+# Jobs that run at the same time, and jobs that may wait or run before new ones are refused.
+JOB_WORKERS = int(os.environ.get("PAINFUL_PREP_JOB_WORKERS", concurrency.process_tasks()))
+MAX_PENDING_JOBS = int(os.environ.get("PAINFUL_PREP_MAX_PENDING_JOBS", 16))
+
+# Longest side in pixels at which one marker jobs look for the window.
+ONE_MARKER_WORKING_SIZE = int(os.environ.get("PAINFUL_PREP_ONE_MARKER_WORKING_SIZE", one_marker_detect_v2.WORKING_SIZE))
+
+# SQLite file through which every worker process can answer polls for jobs
+# started by the others. gunicorn.conf.py always sets it.
+JOBS_PATH = os.environ.get("PAINFUL_PREP_JOBS_PATH") or None
+
+# Result cache settings. Set PAINFUL_PREP_CACHE_PATH to a SQLite file to share
+# results between worker processes.
+CACHE_ENTRIES = int(os.environ.get("PAINFUL_PREP_CACHE_ENTRIES", 256))
+CACHE_TTL_S = float(os.environ.get("PAINFUL_PREP_CACHE_TTL_S", 3600))
+CACHE_PATH = os.environ.get("PAINFUL_PREP_CACHE_PATH")
+
+# Directory where each worker process writes its metrics for /metrics to add
+# up. Without it /metrics only reports the process that answers the scrape.
+METRICS_DIR = os.environ.get("PAINFUL_PREP_METRICS_DIR")
+
+# Shortest time between two writes of this process's metrics file. Counters and
+# the in-flight gauge seen by other workers lag by at most this much.
+METRICS_FLUSH_S = float(os.environ.get("PAINFUL_PREP_METRICS_FLUSH_S", 0.25))
 
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024
+
+job_queue = JobQueue(max_workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS, shared_path=JOBS_PATH)
+result_cache = ResultCache(max_entries=CACHE_ENTRIES, ttl_s=CACHE_TTL_S, shared_path=CACHE_PATH)
+metrics = MetricsRegistry(directory=METRICS_DIR, flush_interval_s=METRICS_FLUSH_S)
+
+# Set once this process has run its warm-up detection. /healthz reports the
+# process as not ready until then.
+ready = threading.Event()
+
+def warm_up():
+    'Build the marker detectors and run a synthetic detection, then report ready.'
+    workers.warm_up()
+    ready.set()
+
+def run_pipeline(data: bytes, marker_size: int, marker_type: str) -> dict:
+    'Decode an uploaded image and measure it with the two marker pipeline.'
+    with concurrency.detection_slots():
+        image = decode_image(data)
+        detector = TwoMarkerDetector(marker_size, marker_type, interfaces.StageContext(), pyramid=True)
+        width, height = pipeline.Pipeline(detector, detector, detector).run(image)
+    return {
+        "width_in": round(width, 2),
+        "height_in": round(height, 2)
+    }
+
+def run_one_marker(data: bytes) -> dict:
+    'Decode an uploaded image and measure the window around its single ArUco marker.'
+    with concurrency.detection_slots():
+        image = decode_image(data, cv.IMREAD_GRAYSCALE)
+        width, height = one_marker_detect_v2.measure_window(image, ONE_MARKER_WORKING_SIZE)
+    return {
+        "width_in": round(width, 2),
+        "height_in": round(height, 2)
+    }
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.inc("painful_prep_requests_in_flight", {"endpoint": g.metrics_endpoint})
+    metrics.flush()
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    'Count the request by outcome and record how long it took.'
+    if "request_start" not in g:
+        return
+    # Streamed responses are torn down once when the view returns and again
+    # when the stream ends. Only the second time is the request finished.
+    if g.pop("stream_pending", False):
+        return
+    status = 500 if error is not None else g.get("response_status", 500)
+    outcome = g.get("outcome") or outcome_for_status(status)
+    labels = {"endpoint": g.metrics_endpoint}
+    metrics.dec("painful_prep_requests_in_flight", labels)
+    metrics.inc("painful_prep_requests_total", {**labels, "outcome": outcome})
+    metrics.observe("painful_prep_request_duration_seconds", labels, time.perf_counter() - g.request_start)
+    metrics.flush()
+
+def stream_ndjson(lines) -> Response:
+    'Stream an iterable of NDJSON lines, counting the request in the metrics once the stream ends.'
+    g.stream_pending = True
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+def outcome_for_status(status: int) -> str:
+    'Name the outcome of a request that did not set g.outcome.'
+    if status < 400:
+        return "success"
+    if status < 500:
+        return "bad_request"
+    return "error"
+
+def outcome_for_exception(e: Exception) -> str:
+    'Name the outcome of a detection that raised e.'
+    if isinstance(e, custom_exceptions.MarkerNotFoundError):
+        return "MarkerNotFoundError"
+    if isinstance(e, ValueError):
+        return "ValueError"
+    return "error"
+
+def observe_image(data: bytes, image: np.ndarray | None = None):
+    'Record the size and, if it is known without decoding, the resolution of an upload.'
+    metrics.observe("painful_prep_image_bytes", None, len(data))
+    size = (image.shape[1], image.shape[0]) if image is not None else jpeg_size(data)
+    if size is not None:
+        metrics.observe("painful_prep_image_megapixels", None, size[0] * size[1] / 1e6)
+
+def observe_stages(timings: dict[str, dict[str, float]]):
+    'Record StageContext timings in the stage latency histogram.'
+    for name, timing in timings.items():
+        metrics.observe("painful_prep_stage_duration_seconds", {"stage": name}, timing["wall_ms"] / 1000)
+
+def format_timings(timings: dict[str, dict[str, float]]) -> str:
+    'Format StageContext timings as JSON with times rounded to tenths of a millisecond.'
+    return json.dumps({
+        name: {"wall_ms": round(timing["wall_ms"], 1), "cpu_ms": round(timing["cpu_ms"], 1)}
+        for name, timing in timings.items()
+    }, separators=(",", ":"))
 
 @app.route('/detect', methods=['POST'])
 def detect_window_dimensions():
@@ -12,26 +165,310 @@ def detect_window_dimensions():
         return jsonify({"error": "Missing required parameters"}), 400
 
     image_file = request.files['image']
-    marker_size = 20
 
     try:
-        marker_size = int(marker_size)
+        marker_size = int(request.form['marker_size'])
     except ValueError:
         return jsonify({"error": "marker_size must be an integer"}), 400
 
-    # Save the uploaded image to a temporary file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_file:
-        image_file.save(tmp_file.name)
-        image_path = Path(tmp_file.name)
+    # Steps are always timed for /metrics. Clients that pass ?timings=1 also
+    # get the times in X-Stage-Timings.
+    context = interfaces.StageContext(record_timings=True)
+
+    with context.span("read"):
+        data = image_file.read()
+    cache_key = ResultCache.make_key(data, marker_size, "AprilTag", ALGORITHM_VERSION)
 
+    image = None
     try:
-        width, height = calculate_two_markers(image_path, marker_size, "AprilTag")
-        return jsonify({
+        with context.span("cache"):
+            dimensions = result_cache.get(cache_key)
+        if dimensions is None:
+            with concurrency.detection_slots():
+                # Decode the upload straight from memory.
+                with context.span("decode"):
+                    image = decode_image(data)
+                dimensions = calculate_two_markers(image, marker_size, "AprilTag", pyramid=True, context=context)
+            result_cache.put(cache_key, dimensions)
+        width, height = dimensions
+        response = jsonify({
             "width_in": round(width, 2),
             "height_in": round(height, 2)
         })
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
+        g.outcome = outcome_for_exception(e)
+        response = jsonify({"error": str(e)})
+        response.status_code = 400
+
+    observe_image(data, image)
+    observe_stages(context.timings)
+    if request.args.get("timings") == "1":
+        response.headers["X-Stage-Timings"] = format_timings(context.timings)
+    return response
+
+@app.route('/detect/windows', methods=['POST'])
+def detect_windows():
+    """
+    Measure every marked window in one photo, such as a facade with several
+    windows. The image is decoded and searched for markers once. Markers with
+    IDs 2k and 2k + 1 belong to the same window, and any others are paired with
+    their nearest unpaired marker.
+    """
+    if 'image' not in request.files or 'marker_size' not in request.form:
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    try:
+        marker_size = int(request.form['marker_size'])
+    except ValueError:
+        return jsonify({"error": "marker_size must be an integer"}), 400
+
+    marker_type = request.form.get('marker_type', "AprilTag")
+    if marker_type not in ("ArUco", "AprilTag"):
+        return jsonify({"error": "marker_type must be ArUco or AprilTag"}), 400
+
+    context = interfaces.StageContext(record_timings=True)
+    with context.span("read"):
+        data = request.files['image'].read()
+
+    image = None
+    try:
+        with concurrency.detection_slots():
+            with context.span("decode"):
+                image = decode_image(data)
+            windows = calculate_windows(image, marker_size, marker_type, context=context)
+        response = jsonify({"windows": windows})
+    except Exception as e:
+        g.outcome = outcome_for_exception(e)
+        response = jsonify({"error": str(e)})
+        response.status_code = 400
+
+    observe_image(data, image)
+    observe_stages(context.timings)
+    if request.args.get("timings") == "1":
+        response.headers["X-Stage-Timings"] = format_timings(context.timings)
+    return response
+
+def read_exactly(stream, size: int) -> bytes:
+    'Read size bytes from a stream, or fewer if it ends first.'
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def read_frames(stream, max_frame_bytes: int):
+    'Yield the frames of a /detect/stream body, each preceded by its length as a 4 byte big-endian integer.'
+    while True:
+        header = read_exactly(stream, 4)
+        if not header:
+            return
+        if len(header) < 4:
+            raise ValueError("Stream ended inside a frame header.")
+        size = int.from_bytes(header, "big")
+        if size > max_frame_bytes:
+            raise ValueError(f"Frame is larger than {MAX_UPLOAD_MB} MB.")
+        data = read_exactly(stream, size)
+        if len(data) < size:
+            raise ValueError("Stream ended inside a frame.")
+        yield data
+
+@app.route('/detect/stream', methods=['POST'])
+def detect_stream():
+    """
+    Measure a live preview. The body is a sequence of frames, each an encoded
+    image preceded by its length as a 4 byte big-endian integer, and may be sent
+    with chunked transfer encoding while the customer moves the phone. One NDJSON
+    line is streamed back per frame as soon as it is measured. Markers found in
+    one frame are tracked into the next with optical flow, and only detected
+    again when tracking becomes unreliable.
+    marker_size and marker_type are query parameters.
+    """
+    try:
+        marker_size = int(request.args['marker_size'])
+    except KeyError:
+        return jsonify({"error": "Missing required parameters"}), 400
+    except ValueError:
+        return jsonify({"error": "marker_size must be an integer"}), 400
+
+    marker_type = request.args.get('marker_type', "AprilTag")
+    if marker_type not in ("ArUco", "AprilTag"):
+        return jsonify({"error": "marker_type must be ArUco or AprilTag"}), 400
+
+    request.max_content_length = MAX_STREAM_MB * 1024 * 1024
+    tracker = MarkerTracker(marker_size, marker_type)
+
+    def generate():
+        try:
+            for index, data in enumerate(read_frames(request.stream, MAX_UPLOAD_MB * 1024 * 1024)):
+                context = interfaces.StageContext(record_timings=True)
+                try:
+                    with concurrency.detection_slots():
+                        with context.span("decode"):
+                            frame = decode_image(data, cv.IMREAD_GRAYSCALE)
+                        result = tracker.process(frame, context)
+                except ValueError as e:
+                    result = {"error": str(e)}
+                observe_stages(context.timings)
+                yield json.dumps({"frame": index, **result}) + "\n"
+        except ValueError as e:
+            g.outcome = "ValueError"
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return stream_ndjson(generate())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    'Return request, latency and image metrics of every worker process in the Prometheus text format.'
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    'Readiness probe. Answers 503 until this worker has warmed up.'
+    if not ready.is_set():
+        return jsonify({"status": "warming up"}), 503
+    return jsonify({"status": "ready", "pid": os.getpid()})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    'Return hit and miss counters of the /detect result cache in this process.'
+    return jsonify(result_cache.stats())
+
+@app.route('/detect/batch', methods=['POST'])
+def detect_batch():
+    """
+    Measure several images at once. Each image may have its own marker_size and
+    marker_type, given as repeated form fields in the same order as the images.
+    A single value applies to every image. Results are streamed back as NDJSON
+    in the order they finish, each tagged with the index of its image.
+    """
+    images = request.files.getlist('images')
+    marker_sizes = request.form.getlist('marker_size')
+    marker_types = request.form.getlist('marker_type') or ["AprilTag"]
+
+    if not images or not marker_sizes:
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    if len(marker_sizes) == 1:
+        marker_sizes = marker_sizes * len(images)
+    if len(marker_types) == 1:
+        marker_types = marker_types * len(images)
+    if len(marker_sizes) != len(images) or len(marker_types) != len(images):
+        return jsonify({"error": "marker_size and marker_type must be given once or once per image"}), 400
+
+    try:
+        marker_sizes = [int(size) for size in marker_sizes]
+    except ValueError:
+        return jsonify({"error": "marker_size must be an integer"}), 400
+
+    if any(marker_type not in ("ArUco", "AprilTag") for marker_type in marker_types):
+        return jsonify({"error": "marker_type must be ArUco or AprilTag"}), 400
+
+    uploads = []
+    for index, (image_file, marker_size, marker_type) in enumerate(zip(images, marker_sizes, marker_types)):
+        data = image_file.read()
+        observe_image(data)
+        uploads.append((index, image_file.filename, data, marker_size, marker_type))
+
+    def result_line(future, index, filename):
+        return json.dumps({"index": index, "filename": filename, **workers.task_result(future)}) + "\n"
+
+    def generate():
+        # Images are submitted as detection slots free up, see concurrency.py,
+        # and results are streamed as soon as they are ready.
+        pool = workers.get_pool()
+        futures = {}
+        for index, filename, data, marker_size, marker_type in uploads:
+            futures[workers.submit_detect(pool, data, marker_size, marker_type)] = (index, filename)
+            for future in [future for future in futures if future.done()]:
+                yield result_line(future, *futures.pop(future))
+        for future in as_completed(futures):
+            yield result_line(future, *futures[future])
+
+    return stream_ndjson(generate())
+
+@app.route('/detect/burst', methods=['POST'])
+def detect_burst():
+    """
+    Measure one window from several frames taken in quick succession, so that
+    one blurry frame does not force a retake. Frames are measured concurrently
+    and their widths and heights fused with a median. Frames still waiting are
+    skipped once enough results agree within the half inch rounding.
+    """
+    images = request.files.getlist('images')
+    if not images or 'marker_size' not in request.form:
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    try:
+        marker_size = int(request.form['marker_size'])
+    except ValueError:
+        return jsonify({"error": "marker_size must be an integer"}), 400
+
+    marker_type = request.form.get('marker_type', "AprilTag")
+    if marker_type not in ("ArUco", "AprilTag"):
+        return jsonify({"error": "marker_type must be ArUco or AprilTag"}), 400
+
+    frames = []
+    for image_file in images:
+        frames.append(image_file.read())
+        observe_image(frames[-1])
+
+    result = workers.measure_burst(frames, marker_size, marker_type)
+    if "error" in result:
+        return jsonify(result), 400
+    return jsonify(result)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a measurement and return its job ID straight away. Poll
+    GET /jobs/<job_id> for the result.
+
+    method selects the detector: two_marker, the default, which needs
+    marker_size and marker_type, or one_marker, which finds the window edges
+    around a single 100 mm ArUco marker and can take several seconds.
+    """
+    method = request.form.get('method', "two_marker")
+    if method not in ("two_marker", "one_marker"):
+        return jsonify({"error": "method must be two_marker or one_marker"}), 400
+
+    if 'image' not in request.files or (method == "two_marker" and 'marker_size' not in request.form):
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    if method == "two_marker":
+        try:
+            marker_size = int(request.form['marker_size'])
+        except ValueError:
+            return jsonify({"error": "marker_size must be an integer"}), 400
+
+        marker_type = request.form.get('marker_type', "AprilTag")
+        if marker_type not in ("ArUco", "AprilTag"):
+            return jsonify({"error": "marker_type must be ArUco or AprilTag"}), 400
+
+    try:
+        data = request.files['image'].read()
+        observe_image(data)
+        if method == "one_marker":
+            job = job_queue.submit(run_one_marker, data)
+        else:
+            job = job_queue.submit(run_pipeline, data, marker_size, marker_type)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify(job.to_dict()), 202, {"Location": f"/jobs/{job.job_id}"}
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    'Return the status of a job, and its result once it has finished.'
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
 
 if __name__ == '__main__':
+    # Development server. In production run gunicorn from back_end, which reads
+    # gunicorn.conf.py.
+    warm_up()
     app.run(host='0.0.0.0', port=5000, debug=True)
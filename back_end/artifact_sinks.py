@@ -0,0 +1,53 @@
+"""
+@file artifact_sinks.py
+@brief Destinations for debug artifacts rendered through StageContext.
+
+Each sink implements interfaces.ArtifactSink. Sinks can be shared between
+contexts, for example so that every stage of a Pipeline writes into the same
+directory.
+
+Usage:
+    context = interfaces.StageContext(
+        debug_level=interfaces.DEBUG_RESULTS,
+        sink=artifact_sinks.PreviewSink(artifact_sinks.DirectorySink("debug"))
+    )
+"""
+
+from pathlib import Path
+import cv2 as cv
+import numpy as np
+import interfaces
+
+class MemorySink:
+    'Keeps artifacts in a dictionary keyed by name.'
+
+    def __init__(self):
+        self.images: dict[str, np.ndarray] = {}
+
+    def write(self, name: str, image: np.ndarray) -> None:
+        self.images[name] = image
+
+class DirectorySink:
+    'Writes each artifact to <directory>/<name><extension>.'
+
+    def __init__(self, directory: str | Path, extension: str = ".jpg"):
+        self.directory = Path(directory)
+        self.extension = extension
+
+    def write(self, name: str, image: np.ndarray) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        cv.imwrite(str(self.directory / f"{name}{self.extension}"), image)
+
+class PreviewSink:
+    'Shrinks artifacts so their longest side is at most max_side before passing them on.'
+
+    def __init__(self, sink: interfaces.ArtifactSink, max_side: int = 1024):
+        self.sink = sink
+        self.max_side = max_side
+
+    def write(self, name: str, image: np.ndarray) -> None:
+        longest = max(image.shape[:2])
+        if longest > self.max_side:
+            scale = self.max_side / longest
+            image = cv.resize(image, None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+        self.sink.write(name, image)
@@ -0,0 +1,174 @@
+"""
+@file aruco_registry.py
+@brief Builds each marker detector once per process and hands it out for reuse.
+
+Creating the marker dictionary and detector parameters costs more than it
+looks, and every detection used to repeat it. Detectors here are built on first
+use for each (marker type, parameter profile) pair and then shared. Detection
+on cv.aruco.ArucoDetector is a const call, so one instance can serve several
+threads at once.
+
+detect_markers_pyramid is a faster alternative for full resolution photos. It
+looks for markers on a downscaled copy of the image and then runs detection at
+full resolution only in small windows around what it found.
+
+Usage:
+    corners, ids, rejected = aruco_registry.detect_markers(image, "AprilTag")
+    corners, ids, rejected = aruco_registry.detect_markers_pyramid(image, "AprilTag", min_markers=2)
+"""
+
+from typing import Literal
+import threading
+import cv2 as cv
+import numpy as np
+
+MarkerType = Literal["ArUco", "AprilTag"]
+
+DICTIONARIES = {
+    "ArUco": cv.aruco.DICT_4X4_50,
+    "AprilTag": cv.aruco.DICT_APRILTAG_16H5
+}
+
+# DetectorParameters overrides for each (marker type, profile) pair. The coarse
+# profiles are only used to find candidates on the downscaled pyramid level.
+PARAMETER_PROFILES = {
+    ("ArUco", "default"): {},
+    ("ArUco", "coarse"): {},
+    ("AprilTag", "default"): {
+        "markerBorderBits": 2,
+        "adaptiveThreshWinSizeStep": 1
+    },
+    ("AprilTag", "coarse"): {
+        "markerBorderBits": 2,
+        "adaptiveThreshWinSizeStep": 4
+    }
+}
+
+# Longest side in pixels of the downscaled level searched by detect_markers_pyramid.
+PYRAMID_MAX_SIDE = 1600
+
+# Candidates smaller than this on the downscaled level are too small to be a
+# marker that the full resolution pass could decode.
+PYRAMID_MIN_CANDIDATE_PX = 20
+
+# Margin around a candidate, relative to its size, that is searched at full resolution.
+PYRAMID_WINDOW_MARGIN = 0.5
+
+_detectors: dict[tuple[str, str], cv.aruco.ArucoDetector] = {}
+_lock = threading.Lock()
+
+def get_detector(marker_type: MarkerType, profile: str = "default") -> cv.aruco.ArucoDetector:
+    """
+    @brief Returns the shared detector for a marker type and parameter profile.
+
+    @param marker_type Marker family to detect.
+    @param profile Name of the parameter profile in PARAMETER_PROFILES.
+
+    @return Detector that is built on the first call and reused afterwards.
+    """
+    key = (marker_type, profile)
+    detector = _detectors.get(key)
+    if detector is not None:
+        return detector
+
+    if key not in PARAMETER_PROFILES:
+        raise ValueError(f"Unknown marker type {marker_type} or profile {profile}.")
+
+    with _lock:
+        if key not in _detectors:
+            dictionary = cv.aruco.getPredefinedDictionary(DICTIONARIES[marker_type])
+            params = cv.aruco.DetectorParameters()
+            for name, value in PARAMETER_PROFILES[key].items():
+                setattr(params, name, value)
+            _detectors[key] = cv.aruco.ArucoDetector(dictionary, params)
+        return _detectors[key]
+
+def detect_markers(
+        image: np.ndarray,
+        marker_type: MarkerType,
+        profile: str = "default"
+    ) -> tuple[tuple[np.ndarray, ...], np.ndarray | None, tuple[np.ndarray, ...]]:
+    """
+    @brief Detects markers with the shared detector.
+
+    @param image Grayscale or BGR image.
+    @param marker_type Marker family to detect.
+    @param profile Name of the parameter profile in PARAMETER_PROFILES.
+
+    @return Tuple (corners, ids, rejected) in the same form as cv.aruco.detectMarkers.
+    """
+    return get_detector(marker_type, profile).detectMarkers(image)
+
+def detect_markers_pyramid(
+        image: np.ndarray,
+        marker_type: MarkerType,
+        profile: str = "default",
+        min_markers: int = 1,
+        max_side: int = PYRAMID_MAX_SIDE
+    ) -> tuple[tuple[np.ndarray, ...], np.ndarray | None, tuple[np.ndarray, ...]]:
+    """
+    @brief Detects markers coarse to fine on a two level image pyramid.
+
+    Markers and rejected candidates of a plausible size are found on a copy of
+    the image whose longest side is max_side. Detection is then repeated at full
+    resolution in a small window around each candidate, so the returned corners
+    come from full resolution pixels. If fewer than min_markers are found this
+    way, the whole image is searched at full resolution instead.
+
+    @param image Grayscale or BGR image.
+    @param marker_type Marker family to detect.
+    @param profile Name of the parameter profile used at full resolution.
+    @param min_markers Number of markers below which the full image is searched.
+    @param max_side Longest side of the downscaled level.
+
+    @return Tuple (corners, ids, rejected) in the same form as cv.aruco.detectMarkers.
+    """
+    if len(image.shape) == 3:
+        image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+
+    height, width = image.shape
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return detect_markers(image, marker_type, profile)
+
+    small = cv.resize(image, None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+    small_corners, _, small_rejected = detect_markers(small, marker_type, "coarse")
+
+    candidates = list(small_corners) + [
+        quad for quad in small_rejected
+        if PYRAMID_MIN_CANDIDATE_PX <= _mean_side(quad) <= max_side / 4
+    ]
+
+    corners = []
+    ids = []
+    for quad in candidates:
+        # Map pixel centres from the downscaled level back to full resolution.
+        quad = (quad.reshape(-1, 2) + 0.5) / scale - 0.5
+        margin = _mean_side(quad) * PYRAMID_WINDOW_MARGIN
+        x0, y0 = np.maximum(quad.min(axis=0) - margin, 0).astype(int)
+        x1, y1 = np.minimum(quad.max(axis=0) + margin + 1, (width, height)).astype(int)
+
+        window_corners, window_ids, _ = detect_markers(image[y0:y1, x0:x1], marker_type, profile)
+        if window_ids is None:
+            continue
+
+        for marker_corners, marker_id in zip(window_corners, window_ids):
+            marker_corners = marker_corners + np.array([x0, y0], dtype=np.float32)
+            # Windows of neighbouring candidates can overlap and find the same marker.
+            if any(np.abs(marker_corners - found).max() < 2 for found in corners):
+                continue
+            corners.append(marker_corners)
+            ids.append(marker_id)
+
+    if len(ids) < min_markers:
+        return detect_markers(image, marker_type, profile)
+
+    rejected = tuple(
+        ((quad + 0.5) / scale - 0.5).astype(np.float32) for quad in small_rejected
+    )
+    return tuple(corners), np.array(ids, dtype=np.int32).reshape(-1, 1), rejected
+
+def _mean_side(quad: np.ndarray) -> float:
+    'Average side length of a quadrilateral given as four points.'
+    quad = quad.reshape(-1, 2)
+    return float(np.mean(np.linalg.norm(quad - np.roll(quad, 1, axis=0), axis=1)))
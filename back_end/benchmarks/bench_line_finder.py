@@ -0,0 +1,83 @@
+"""
+@file bench_line_finder.py
+@brief Compares vectorized line_finder geometry with the line by line versions.
+
+Times angle filtering, window edge selection and pairwise intersections for a
+growing number of random segments, using the reference implementations from
+tests/test_line_finder.py as the baseline. Then reports time and peak memory
+of the vectorized intersections alone for several thousand lines, where the
+line by line version is too slow to wait for.
+
+Usage: python bench_line_finder.py [line_count ...]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tests")))
+
+import line_finder
+import test_line_finder as reference
+
+DEFAULT_LINE_COUNTS = [50, 100, 250, 500, 1000, 2000]
+LARGE_LINE_COUNTS = [3000, 5000]
+
+def best_time(fn, *args, repeat=3) -> float:
+    'Return the fastest of several runs of fn(*args) in seconds.'
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def peak_memory(fn, *args) -> int:
+    'Return the most memory in bytes allocated at once while running fn(*args).'
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or DEFAULT_LINE_COUNTS
+    image = np.zeros((3024, 4032), dtype=np.uint8)
+
+    print(f"{'lines':>6} {'stage':<14} {'loop (ms)':>10} {'vector (ms)':>12} {'speedup':>8}")
+    for count in counts:
+        lines = reference.random_lines(0, count)
+        ref_angle = line_finder.line_angle(lines[0])
+        line_list = list(lines)
+
+        stages = [
+            ("filter",
+             lambda: reference.reference_filter_lines_by_angle(lines, ref_angle, 12),
+             lambda: line_finder.filter_lines_by_angle(lines, ref_angle, 12)),
+            ("window edges",
+             lambda: reference.reference_select_window_edges(line_list, image, 800),
+             lambda: line_finder.select_window_edges(line_list, image, 800)),
+            ("intersections",
+             lambda: reference.reference_get_intersections(line_list),
+             lambda: line_finder.get_intersections(line_list)),
+        ]
+
+        for name, loop, vector in stages:
+            loop_s = best_time(loop, repeat=1 if count > 500 else 3)
+            vector_s = best_time(vector)
+            print(f"{count:>6} {name:<14} {loop_s * 1000:>10.2f} {vector_s * 1000:>12.2f} {loop_s / vector_s:>7.1f}x")
+
+    print()
+    print(f"{'lines':>6} {'pairs':>10} {'intersections (ms)':>19} {'peak (MiB)':>11}")
+    for count in LARGE_LINE_COUNTS:
+        line_list = list(reference.random_lines(0, count))
+        vector_s = best_time(line_finder.get_intersections, line_list, repeat=1)
+        peak = peak_memory(line_finder.get_intersections, line_list)
+        print(f"{count:>6} {count * (count - 1) // 2:>10} {vector_s * 1000:>19.1f} {peak / 2**20:>11.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+@file bench_marker_tracking.py
+@brief Compares full marker detection on every frame with marker_tracking.MarkerTracker.
+
+Builds a preview-like sequence from one two-marker photo by slowly shifting,
+rotating and zooming it, then measures every frame once with
+calculate_two_markers and once with a MarkerTracker. Reports frames per
+second for each, how many full detections the tracker needed, and the
+largest difference between the two measurements.
+
+Usage: python bench_marker_tracking.py [image_path] [marker_size] [marker_type] [frames] [longest_side]
+"""
+
+import os
+import sys
+import time
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import marker_tracking
+from image_io import resize_to_working_size
+from two_marker_detect import calculate_two_markers
+
+DEFAULT_IMAGE = os.path.join(os.path.dirname(__file__), "..", "tests", "test-images", "img_036.JPG")
+
+def preview_sequence(image: np.ndarray, frames: int) -> list[np.ndarray]:
+    'Return frames of image drifting by a few pixels, a tenth of a degree and 0.2% zoom each.'
+    height, width = image.shape[:2]
+    sequence = []
+    for i in range(frames):
+        motion = cv.getRotationMatrix2D((width / 2, height / 2), 0.1 * i, 1 + 0.002 * i)
+        motion[:, 2] += (3 * i, 2 * i)
+        sequence.append(cv.warpAffine(image, motion, (width, height), borderMode=cv.BORDER_REPLICATE))
+    return sequence
+
+def main():
+    args = sys.argv[1:]
+    path = args[0] if len(args) > 0 else DEFAULT_IMAGE
+    marker_size = int(args[1]) if len(args) > 1 else 20
+    marker_type = args[2] if len(args) > 2 else "AprilTag"
+    frames = int(args[3]) if len(args) > 3 else 60
+    longest_side = int(args[4]) if len(args) > 4 else 2016
+
+    image, _ = resize_to_working_size(cv.imread(path, cv.IMREAD_GRAYSCALE), longest_side)
+    sequence = preview_sequence(image, frames)
+
+    start = time.perf_counter()
+    detected = []
+    for frame in sequence:
+        try:
+            detected.append(calculate_two_markers(frame, marker_size, marker_type, pyramid=True))
+        except ValueError:
+            detected.append(None)
+    full_s = time.perf_counter() - start
+
+    tracker = marker_tracking.MarkerTracker(marker_size, marker_type)
+    start = time.perf_counter()
+    tracked = [tracker.process(frame) for frame in sequence]
+    tracked_s = time.perf_counter() - start
+
+    differences = [
+        max(abs(result["width_in"] - full[0]), abs(result["height_in"] - full[1]))
+        for result, full in zip(tracked, detected)
+        if full is not None and "width_in" in result
+    ]
+
+    print(f"{frames} frames of {image.shape[1]} x {image.shape[0]} px")
+    print(f"full detection: {frames / full_s:7.1f} frames/s, {detected.count(None)} frames without two markers")
+    print(f"tracking:       {frames / tracked_s:7.1f} frames/s, {tracker.detections} full detections, "
+          f"{sum('error' in result for result in tracked)} frames without two markers")
+    print(f"speed up: {full_s / tracked_s:.1f}x, largest difference {max(differences, default=0):.2f} in")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+@file bench_scale_space.py
+@brief Compares the DoG passes of one_marker_detect_v2 with and without a shared scale space.
+
+Runs the three DoG passes of find_windowpane on one photo at several working
+sizes, once with exact cv.GaussianBlur calls and once with blurs taken from
+scale_space.ScaleSpace, and reports the time of each and how many pixels of
+the thresholded edge map differ.
+
+Usage: python bench_scale_space.py [image_path] [working_size ...]
+"""
+
+import os
+import sys
+import time
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import image_io
+import scale_space
+import one_marker_detect_v2 as v2
+
+DEFAULT_IMAGE = os.path.join(os.path.dirname(__file__), "..", "tests", "test-images", "img_001.JPG")
+DEFAULT_WORKING_SIZES = [4032, 2016, 1512, 1008]
+
+def dog_passes(image: np.ndarray, scale: float, shared: bool) -> np.ndarray:
+    'Run the DoG passes of find_windowpane and return the thresholded edge map.'
+    space = scale_space.ScaleSpace(image) if shared else None
+    dog_pass_1 = v2.apply_dog(image, 4.0 * scale, 7.0 * scale, space)
+    dog_pass_2 = v2.apply_dog(image, 20.0 * scale, 25.0 * scale, space)
+    dog_combined = cv.addWeighted(dog_pass_1, 0.6, dog_pass_2, 0.4, 0)
+    space = scale_space.ScaleSpace(dog_combined) if shared else None
+    dog_combined = v2.apply_dog(dog_combined, 10.0 * scale, 13.0 * scale, space)
+    _, edges = cv.threshold(dog_combined, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
+    return edges
+
+def best_time(fn, repeat=3) -> tuple[float, np.ndarray]:
+    'Return the fastest of several runs of fn in seconds, and its result.'
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    args = sys.argv[1:]
+    path = args.pop(0) if args and not args[0].isdigit() else DEFAULT_IMAGE
+    sizes = [int(arg) for arg in args] or DEFAULT_WORKING_SIZES
+    full = image_io.load_image(path, cv.IMREAD_GRAYSCALE)
+
+    print(f"{'size':>6} {'exact (ms)':>11} {'shared (ms)':>12} {'speedup':>8} {'edge diff':>10}")
+    for size in sizes:
+        image, _ = image_io.resize_to_working_size(full, size)
+        scale = max(image.shape) / v2.REFERENCE_SIZE
+        exact_s, exact = best_time(lambda: dog_passes(image, scale, False))
+        shared_s, shared = best_time(lambda: dog_passes(image, scale, True))
+        print(f"{max(image.shape):>6} {exact_s * 1000:>11.1f} {shared_s * 1000:>12.1f} "
+              f"{exact_s / shared_s:>7.1f}x {np.mean(exact != shared):>9.2%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+@file bench_thread_budget.py
+@brief Sweeps how the cores are split between parallel detections and OpenCV threads.
+
+For every split of the cores into parallel tasks x OpenCV threads per task, a
+fresh pool with one process per task measures the labelled photos of one
+detector. As many photos are kept in flight as there are tasks, as a server
+with that many busy workers would see. Reports throughput in images per second
+and p50 and p95 latency from submitting a photo to getting its result.
+
+Use the split with the best throughput for a busy server, and the one with the
+best p95 latency that still keeps up with the expected load otherwise. Set it
+with PAINFUL_PREP_OPENCV_THREADS, see concurrency.py.
+
+Usage:
+    python bench_thread_budget.py [--detector two_marker] [--cores 8] [--limit 10] [--repeat 2]
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tests")))
+
+import concurrency
+import corpus
+import interfaces
+import workers
+from run_benchmarks import summarize
+
+def splits(cores: int) -> list[tuple[int, int]]:
+    'Return every (parallel tasks, OpenCV threads) pair that uses all cores, fewest threads first.'
+    return [(cores // threads, threads) for threads in range(1, cores + 1) if cores % threads == 0]
+
+def init_worker(opencv_threads: int):
+    'Warm the worker up, then give OpenCV the threads of this split.'
+    workers.warm_up()
+    concurrency.set_opencv_threads(opencv_threads)
+
+@lru_cache
+def photos(name: str) -> list[corpus.CorpusImage]:
+    'Return the photos a detector applies to, reading the manifest once per process.'
+    return corpus.select(corpus.load_manifest(), corpus.DETECTORS[name].marker_quantity)
+
+def measure(name: str, index: int) -> bool:
+    'Decode and measure one photo of a detector, returning whether it succeeded.'
+    detector = corpus.DETECTORS[name]
+    image = photos(name)[index]
+    try:
+        detector.measure(corpus.decode(image, detector), image, interfaces.StageContext())
+        return True
+    except Exception:
+        return False
+
+def run_split(name: str, tasks: int, opencv_threads: int, requests: list[int]) -> dict:
+    """
+    @brief Measures the photos with one split of the cores.
+
+    @param name Key of the detector in corpus.DETECTORS.
+    @param tasks Number of worker processes, and of photos kept in flight.
+    @param opencv_threads OpenCV threads in each worker process.
+    @param requests Indices of the photos to measure, in order.
+
+    @return Summary with throughput, failures and latency.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(tasks, mp_context=context, initializer=init_worker, initargs=(opencv_threads,)) as pool:
+        # Start every process, and finish its warm up, before timing.
+        wait([pool.submit(measure, name, requests[0]) for _ in range(tasks)])
+
+        latencies = []
+        failures = 0
+        pending = {}
+        next_request = 0
+        start = time.perf_counter()
+        while next_request < len(requests) or pending:
+            while next_request < len(requests) and len(pending) < tasks:
+                pending[pool.submit(measure, name, requests[next_request])] = time.perf_counter()
+                next_request += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            finished = time.perf_counter()
+            for future in done:
+                latencies.append((finished - pending.pop(future)) * 1000)
+                failures += not future.result()
+        elapsed = time.perf_counter() - start
+
+    return {
+        "tasks": tasks,
+        "opencv_threads": opencv_threads,
+        "throughput_ips": round(len(requests) / elapsed, 3),
+        "failures": failures,
+        **summarize(latencies)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the split between parallel detections and OpenCV threads.")
+    parser.add_argument("--detector", default="two_marker", choices=sorted(corpus.DETECTORS))
+    parser.add_argument("--cores", type=int, default=concurrency.CPU_CORES, help="cores to split")
+    parser.add_argument("--limit", type=int, help="only use the first LIMIT photos")
+    parser.add_argument("--repeat", type=int, default=2, help="times every photo is measured per split")
+    args = parser.parse_args()
+
+    count = len(photos(args.detector)[:args.limit])
+    if count == 0:
+        print(f"No photos for {args.detector}.")
+        return
+    requests = list(range(count)) * args.repeat
+
+    print(f"{args.detector}: {len(requests)} measurements on {args.cores} cores")
+    print(f"{'tasks':>5} {'threads':>7} {'images/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'failures':>8}")
+    for tasks, opencv_threads in splits(args.cores):
+        result = run_split(args.detector, tasks, opencv_threads, requests)
+        print(f"{tasks:>5} {opencv_threads:>7} {result['throughput_ips']:>9.2f} "
+              f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['failures']:>8}")
+
+if __name__ == "__main__":
+    main()
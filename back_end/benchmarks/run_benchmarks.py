@@ -0,0 +1,212 @@
+"""
+@file run_benchmarks.py
+@brief Times every detector over the labelled test photos and gates on a baseline.
+
+Each detector runs in a fresh process over the photos it applies to, so the
+peak RSS reported is its own. For each detector the runner reports p50, p95
+and max latency of the whole measurement and of every StageContext span,
+throughput in images per second, and peak RSS.
+
+With --save the results become the baseline. With --check they are compared
+with the baseline, and the script exits with status 1 if any latency or peak
+RSS grew, or any throughput fell, by more than its threshold. Thresholds are
+stored in the baseline and can be overridden on the command line.
+
+Usage:
+    python run_benchmarks.py --save
+    python run_benchmarks.py --check
+    python run_benchmarks.py --detectors two_marker --limit 5 --repeat 3
+"""
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tests")))
+
+import corpus
+import interfaces
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+# Largest allowed relative change before --check fails.
+DEFAULT_THRESHOLDS = {
+    "latency": 0.25,
+    "throughput": 0.20,
+    "peak_rss": 0.20
+}
+
+# Latency changes smaller than this are timer noise, whatever their ratio.
+MIN_LATENCY_CHANGE_MS = 5.0
+
+def summarize(samples_ms: list[float]) -> dict[str, float]:
+    'Return the p50, p95 and max of a list of latencies in milliseconds.'
+    values = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "max_ms": round(float(values.max()), 2)
+    }
+
+def benchmark_detector(name: str, limit: int | None = None, repeat: int = 1) -> dict:
+    """
+    @brief Runs one detector over its photos and summarizes the timings.
+
+    The first photo is measured once before timing starts, so one-off set up
+    such as building marker detectors is not counted.
+
+    @param name Key of the detector in corpus.DETECTORS.
+    @param limit Only use the first limit photos.
+    @param repeat Number of timed runs per photo.
+
+    @return Summary with the number of images and runs, failures, latency of
+            the whole measurement and of each stage, throughput and peak RSS.
+    """
+    detector = corpus.DETECTORS[name]
+    images = corpus.select(corpus.load_manifest(), detector.marker_quantity)[:limit]
+
+    if images:
+        try:
+            detector.measure(corpus.decode(images[0], detector), images[0], interfaces.StageContext())
+        except Exception:
+            pass
+
+    totals = []
+    stages = defaultdict(list)
+    failures = 0
+    for image in images:
+        for _ in range(repeat):
+            context = interfaces.StageContext(record_timings=True)
+            start = time.perf_counter()
+            try:
+                with context.span("decode"):
+                    frame = corpus.decode(image, detector)
+                detector.measure(frame, image, context)
+            except Exception:
+                failures += 1
+            totals.append((time.perf_counter() - start) * 1000)
+            for stage, timing in context.timings.items():
+                stages[stage].append(timing["wall_ms"])
+
+    if not totals:
+        return {"images": 0, "runs": 0, "failures": 0}
+
+    return {
+        "images": len(images),
+        "runs": len(totals),
+        "failures": failures,
+        "total": summarize(totals),
+        "throughput_ips": round(len(totals) / (sum(totals) / 1000), 3),
+        # ru_maxrss is in kilobytes on Linux.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stages": {stage: summarize(samples) for stage, samples in sorted(stages.items())}
+    }
+
+def run_isolated(name: str, limit: int | None, repeat: int) -> dict:
+    'Run benchmark_detector in a new process so that its peak RSS is its own.'
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(benchmark_detector, name, limit, repeat).result()
+
+def compare(current: dict, baseline: dict, thresholds: dict[str, float]) -> list[str]:
+    """
+    @brief Lists every metric that regressed beyond its threshold.
+
+    Only detectors and stages present in both results are compared.
+
+    @param current Results of this run, keyed by detector.
+    @param baseline Results to compare against, keyed by detector.
+    @param thresholds Largest allowed relative change for latency, throughput
+           and peak_rss.
+
+    @return One line describing each regression. Empty if there are none.
+    """
+    regressions = []
+
+    def check_latency(label, new, old):
+        for key in ("p50_ms", "p95_ms", "max_ms"):
+            if key not in new or key not in old:
+                continue
+            if new[key] - old[key] > MIN_LATENCY_CHANGE_MS and new[key] > old[key] * (1 + thresholds["latency"]):
+                regressions.append(f"{label} {key}: {old[key]:.1f} -> {new[key]:.1f}")
+
+    for name, new in current.items():
+        old = baseline.get(name)
+        if not old or not new.get("runs") or not old.get("runs"):
+            continue
+        check_latency(f"{name} total", new["total"], old["total"])
+        for stage, timing in new["stages"].items():
+            if stage in old["stages"]:
+                check_latency(f"{name} {stage}", timing, old["stages"][stage])
+        if new["throughput_ips"] < old["throughput_ips"] * (1 - thresholds["throughput"]):
+            regressions.append(f"{name} throughput_ips: {old['throughput_ips']:.3f} -> {new['throughput_ips']:.3f}")
+        if new["peak_rss_mb"] > old["peak_rss_mb"] * (1 + thresholds["peak_rss"]):
+            regressions.append(f"{name} peak_rss_mb: {old['peak_rss_mb']:.1f} -> {new['peak_rss_mb']:.1f}")
+
+    return regressions
+
+def print_report(name: str, result: dict):
+    'Print the summary of one detector as a table.'
+    if not result.get("runs"):
+        print(f"{name}: no images\n")
+        return
+    print(f"{name}: {result['images']} images, {result['runs']} runs, {result['failures']} failures, "
+          f"{result['throughput_ips']:.2f} images/s, peak RSS {result['peak_rss_mb']:.0f} MB")
+    print(f"  {'stage':<32} {'p50 (ms)':>10} {'p95 (ms)':>10} {'max (ms)':>10}")
+    for stage, timing in [("total", result["total"]), *result["stages"].items()]:
+        print(f"  {stage:<32} {timing['p50_ms']:>10.1f} {timing['p95_ms']:>10.1f} {timing['max_ms']:>10.1f}")
+    print()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the detectors over the test photos.")
+    parser.add_argument("--detectors", nargs="+", choices=list(corpus.DETECTORS), default=list(corpus.DETECTORS))
+    parser.add_argument("--limit", type=int, help="only use the first LIMIT photos of each detector")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per photo")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="fail if the results regressed from the baseline")
+    parser.add_argument("--output", type=Path, help="also write the results to this JSON file")
+    for metric, threshold in DEFAULT_THRESHOLDS.items():
+        parser.add_argument(f"--{metric.replace('_', '-')}-threshold", type=float, dest=metric,
+                            help=f"allowed relative change in {metric}, {threshold} by default")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.detectors:
+        results[name] = run_isolated(name, args.limit, args.repeat)
+        print_report(name, results[name])
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else None
+    thresholds = {**DEFAULT_THRESHOLDS, **(baseline or {}).get("thresholds", {})}
+    thresholds.update({metric: getattr(args, metric) for metric in DEFAULT_THRESHOLDS if getattr(args, metric) is not None})
+
+    report = {"thresholds": thresholds, "detectors": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.check:
+        if baseline is None:
+            print(f"No baseline at {args.baseline}, run with --save first.")
+            sys.exit(1)
+        regressions = compare(results, baseline["detectors"], thresholds)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+    if args.save:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Saved baseline to {args.baseline}")
+
+if __name__ == "__main__":
+    main()
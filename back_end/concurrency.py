@@ -0,0 +1,81 @@
+"""
+@file concurrency.py
+@brief One budget of CPU cores shared by parallel detections and OpenCV's own threads.
+
+Every detection may use OPENCV_THREADS threads inside OpenCV, so at most
+PARALLEL_TASKS = CPU_CORES // OPENCV_THREADS detections run at once without
+oversubscribing the cores. The server splits those tasks between its worker
+processes. Each process then sizes its batch pool, job queue and pipeline
+threads from process_tasks(), and sets OpenCV's thread count with
+set_opencv_threads() before its first detection.
+
+A server process has more threads than detections it may run: request
+threads, job threads, and the batch pool processes. Every detection it starts
+therefore holds one of the process_tasks() slots of detection_slots() while it
+runs, whether it runs inline, in a job or in the batch pool. At most
+WEB_WORKERS x process_tasks() detections run on the machine at once, each with
+OPENCV_THREADS threads. That is at most CPU_CORES busy threads, unless there
+are more web workers than PARALLEL_TASKS, in which case every worker still
+runs one detection at a time.
+
+Many small detections at once give the best throughput. Fewer detections with
+more OpenCV threads each give lower latency on a quiet server.
+benchmarks/bench_thread_budget.py measures both for every split.
+"""
+
+import os
+import threading
+import cv2 as cv
+
+# Cores the backend may use on this machine.
+CPU_CORES = int(os.environ.get("PAINFUL_PREP_CPU_CORES", os.cpu_count() or 1))
+
+# Threads OpenCV may use inside one detection.
+OPENCV_THREADS = int(os.environ.get("PAINFUL_PREP_OPENCV_THREADS", 1))
+
+# Detections that may run at once on this machine.
+PARALLEL_TASKS = max(1, CPU_CORES // OPENCV_THREADS)
+
+# Worker processes of the production server, see gunicorn.conf.py.
+WEB_WORKERS = int(os.environ.get("PAINFUL_PREP_WEB_WORKERS", PARALLEL_TASKS))
+
+_server_processes = 1
+_slots: threading.BoundedSemaphore | None = None
+_slots_lock = threading.Lock()
+
+def share_between(processes: int) -> None:
+    """
+    @brief Splits PARALLEL_TASKS between this many server processes.
+
+    Must be called before the modules that size their pools from
+    process_tasks() are imported. The development server is a single process
+    and does not need to call it.
+
+    @param processes Number of processes serving requests on this machine.
+    """
+    global _server_processes
+    _server_processes = max(1, processes)
+
+def process_tasks() -> int:
+    'Return the number of detections one server process may run at once.'
+    return max(1, PARALLEL_TASKS // _server_processes)
+
+def detection_slots() -> threading.BoundedSemaphore:
+    """
+    @brief Returns the semaphore every detection in this process holds while it runs.
+
+    It has process_tasks() slots and is created on first use, after
+    share_between has been called.
+
+    @return Semaphore to use as a context manager, or to acquire before
+            submitting work elsewhere and release once it is done.
+    """
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(process_tasks())
+        return _slots
+
+def set_opencv_threads(threads: int = OPENCV_THREADS) -> None:
+    'Limit the threads OpenCV uses inside one detection in this process.'
+    cv.setNumThreads(threads)
@@ -0,0 +1,64 @@
+"""
+@file gunicorn.conf.py
+@brief Production server configuration for app.py.
+
+Usage, from back_end:
+    gunicorn
+
+The app is imported once in the master process, so cv2, numpy and the
+detection modules are loaded before the workers are forked and their pages are
+shared. Each worker then builds its marker detectors and runs a synthetic
+detection before it accepts connections, so the first customer request on a
+fresh worker does not pay for the cold start. /healthz answers 503 until a
+worker has warmed up.
+"""
+
+import os
+import tempfile
+
+import concurrency
+
+wsgi_app = "app:app"
+bind = os.environ.get("PAINFUL_PREP_BIND", "0.0.0.0:5000")
+
+# Worker processes, and threads per worker. Threads let a worker keep serving
+# while one of its requests streams /detect/stream or /detect/batch. They do not
+# add to the core budget: a worker runs at most concurrency.process_tasks()
+# detections at once, however many threads are handling requests.
+workers = concurrency.WEB_WORKERS
+worker_class = "gthread"
+threads = int(os.environ.get("PAINFUL_PREP_WEB_THREADS", 4))
+
+preload_app = True
+
+# The workers split the cores of the thread budget between them. This runs
+# before the app is imported, which sizes its pools from each worker's share.
+concurrency.share_between(workers)
+
+# A large photo can take a few seconds to measure. Workers that are silent for
+# longer than this are restarted.
+timeout = int(os.environ.get("PAINFUL_PREP_WEB_TIMEOUT_S", 60))
+graceful_timeout = 30
+
+# /metrics adds up the files every worker writes here. This runs before the app
+# is imported, which is when app.py reads the setting.
+os.environ.setdefault("PAINFUL_PREP_METRICS_DIR", os.path.join(tempfile.gettempdir(), "painful-prep-metrics"))
+
+# A job runs in the worker that accepted it, and its status is shared through
+# this file so that a poll reaching any worker can answer it.
+os.environ.setdefault("PAINFUL_PREP_JOBS_PATH", os.path.join(tempfile.gettempdir(), "painful-prep-jobs.sqlite"))
+
+accesslog = "-"
+
+def on_starting(server):
+    'Remove the metrics, and the jobs no worker will finish, of an earlier run of the server.'
+    import jobs
+    import metrics
+    metrics.clear_directory(os.environ["PAINFUL_PREP_METRICS_DIR"])
+    jobs.clear_unfinished(os.environ.get("PAINFUL_PREP_JOBS_PATH"))
+
+def post_worker_init(worker):
+    'Warm the worker up before it accepts connections.'
+    import app
+    app.warm_up()
+    worker.log.info("Worker %s warmed up", worker.pid)
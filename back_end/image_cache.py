@@ -0,0 +1,108 @@
+"""
+@file image_cache.py
+@brief Disk cache of decoded images that later runs memory map instead of decoding.
+
+Decoding a 12 megapixel JPEG takes longer than some detection steps, and the
+test photos are decoded again on every harness and benchmark run. This cache
+stores each decoded image as an uncompressed .npy file named after the SHA-256
+of the encoded file and the imread flags, so colour, grayscale and reduced
+decodes of one photo are separate entries. Hits are opened with
+np.load(mmap_mode="r"), so a hit costs a page cache lookup and every process
+reading the same image shares its pages.
+
+The directory is bounded in bytes. Opening an entry touches its modification
+time, and the least recently used entries are deleted first.
+
+Usage:
+    cache = DecodedImageCache("/tmp/painful_prep_images", max_bytes=2 * 1024 ** 3)
+    image = cache.load("tests/test-images/img_001.JPG", cv.IMREAD_GRAYSCALE)
+"""
+
+from pathlib import Path
+import hashlib
+import os
+import threading
+import cv2 as cv
+import numpy as np
+
+from image_io import load_image
+
+def file_digest(path: str | Path) -> str:
+    'Return the SHA-256 of a file as hex.'
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+class DecodedImageCache:
+    def __init__(self, directory: str | Path, max_bytes: int = 2 * 1024 ** 3):
+        """
+        @param directory Directory the .npy files are kept in. It is created if needed.
+        @param max_bytes Largest total size of the cached files.
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, digest: str, flags: int) -> Path:
+        'Return where the decode of the file with this digest is stored.'
+        return self.directory / f"{digest}_{flags}.npy"
+
+    def load(self, path: str | Path, flags: int = cv.IMREAD_COLOR_BGR) -> np.ndarray:
+        """
+        @brief Returns the decoded image, decoding and storing it on a miss.
+
+        Hits are read only memory maps, so callers must copy before drawing on
+        the image.
+
+        @param path Path to the encoded image.
+        @param flags OpenCV imread flags to decode with.
+
+        @return The decoded image.
+        """
+        entry = self.path_for(file_digest(path), flags)
+        try:
+            image = np.load(entry, mmap_mode="r")
+            os.utime(entry)
+        except (OSError, ValueError):
+            # Missing, evicted by another process, or a half written file.
+            image = None
+
+        if image is not None:
+            with self._lock:
+                self.hits += 1
+            return image
+
+        image = load_image(path, flags)
+        temporary = self.directory / f"{entry.stem}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as file:
+            np.save(file, image)
+        os.replace(temporary, entry)
+        with self._lock:
+            self.misses += 1
+        self.evict()
+        return image
+
+    def evict(self) -> None:
+        'Delete the least recently used entries until the directory fits in max_bytes.'
+        entries = []
+        for entry in self.directory.glob("*.npy"):
+            try:
+                status = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((status.st_mtime, status.st_size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Processes that already mapped the file keep their pages.
+            entry.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> dict:
+        'Return hit and miss counters for this process.'
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,140 @@
+"""
+@file image_io.py
+@brief Helpers for getting images into memory.
+
+Detection functions accept either a path to an image file or an image that has
+already been decoded. These helpers keep that decision in one place and let
+callers such as app.py decode uploaded bytes without touching the disk.
+"""
+
+from pathlib import Path
+import cv2 as cv
+import numpy as np
+
+ImageSource = str | Path | np.ndarray
+
+def decode_image(data: bytes, flags: int = cv.IMREAD_COLOR_BGR) -> np.ndarray:
+    """
+    @brief Decodes an encoded image held in memory.
+
+    @param data Encoded image bytes, for example the body of an uploaded JPEG.
+    @param flags OpenCV imread flags to decode with.
+
+    @return The decoded image.
+    """
+    if not data:
+        raise ValueError("Image is empty, please take or upload another image.")
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    image = cv.imdecode(buffer, flags)
+
+    if image is None:
+        raise ValueError("Unable to decode image, please take or upload another image.")
+
+    return image
+
+def load_image(source: ImageSource, flags: int = cv.IMREAD_COLOR_BGR) -> np.ndarray:
+    """
+    @brief Returns a decoded image from either a file path or an image array.
+
+    Arrays are returned as they are so that callers that have already decoded
+    an image do not pay for a second decode.
+
+    @param source Path to an image file or an already decoded image.
+    @param flags OpenCV imread flags used when source is a path.
+
+    @return The decoded image.
+    """
+    if isinstance(source, np.ndarray):
+        return source
+
+    image = cv.imread(str(source), flags)
+
+    if image is None:
+        raise ValueError(f"Unable to read image {source}, please take or upload another image.")
+
+    return image
+
+def jpeg_size(data: bytes) -> tuple[int, int] | None:
+    """
+    @brief Reads the width and height of a JPEG from its header without decoding it.
+
+    @param data Encoded image bytes.
+
+    @return Tuple (width, height) as stored in the file, or None if data is not
+            a JPEG or has no frame header.
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        # Skip fill bytes and markers that carry no length field.
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        # Start of frame markers, excluding DHT, JPG and DAC which share the range.
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+
+    return None
+
+def resize_to_working_size(image: np.ndarray, working_size: int) -> tuple[np.ndarray, float]:
+    """
+    @brief Shrinks an image so that its longest side is at most working_size.
+
+    @param image Image to shrink. Smaller images are returned unchanged.
+    @param working_size Longest side of the result in pixels.
+
+    @return Tuple (image, factor) where multiplying coordinates in the result by
+            factor gives coordinates in the original image.
+    """
+    longest = max(image.shape[:2])
+    if longest <= working_size:
+        return image, 1.0
+
+    scale = working_size / longest
+    resized = cv.resize(image, None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+    return resized, longest / max(resized.shape[:2])
+
+def read_grayscale_at_size(path: str | Path, working_size: int) -> tuple[np.ndarray, float]:
+    """
+    @brief Decodes an image file to grayscale with its longest side at most working_size.
+
+    For JPEGs the decoder is asked for a 1/2, 1/4 or 1/8 scale image, which is
+    much cheaper than decoding every pixel and shrinking afterwards. The result
+    is then resized to the exact working size.
+
+    @param path Path to the image file.
+    @param working_size Longest side of the result in pixels.
+
+    @return Tuple (image, factor) where multiplying coordinates in the result by
+            factor gives coordinates in the full resolution image.
+    """
+    data = Path(path).read_bytes()
+    size = jpeg_size(data)
+
+    flags = cv.IMREAD_GRAYSCALE
+    if size is not None:
+        for reduction, reduced_flags in (
+            (8, cv.IMREAD_REDUCED_GRAYSCALE_8),
+            (4, cv.IMREAD_REDUCED_GRAYSCALE_4),
+            (2, cv.IMREAD_REDUCED_GRAYSCALE_2)
+        ):
+            if max(size) / reduction >= working_size:
+                flags = reduced_flags
+                break
+
+    image = decode_image(data, flags)
+    full_longest = max(size) if size is not None else max(image.shape)
+    image, _ = resize_to_working_size(image, working_size)
+    return image, full_longest / max(image.shape)
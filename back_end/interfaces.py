@@ -6,9 +6,27 @@ Interfaces declares several protocols and classes that make code more modular
 and testable.
 """
 
-from typing import Protocol, Literal
+from contextlib import contextmanager, nullcontext
+from typing import Protocol, Literal, Callable, ContextManager, Iterator
+import time
 import numpy as np
 
+# Debug levels for StageContext. Artifacts are only rendered when the context's
+# debug level is at least the level they are added with.
+DEBUG_OFF = 0
+DEBUG_RESULTS = 1
+DEBUG_PASSES = 2
+
+# Returned by StageContext.span when timings are off, so that a disabled span
+# costs one attribute check.
+_NO_SPAN = nullcontext()
+
+class ArtifactSink(Protocol):
+    'Protocol to define where rendered debug artifacts go.'
+
+    def write(self, name: str, image: np.ndarray) -> None:
+        ...
+
 class StageContext:
     """
     Context class that provides Pipeline stages access to image transformations
@@ -17,14 +35,87 @@ class StageContext:
     information into StageContext objects when they are given one. Outside of the
     stage, the main program can then dictate what to do with stage metadata/
     transformations.
+
+    Debug images are added as callables through add_artifact and are only
+    rendered when debug_level is high enough, so a context with debugging off
+    costs nothing beyond the call. Rendered artifacts go to sink, or into
+    images when there is no sink.
+
+    With record_timings on, span adds the wall clock and thread CPU time of a
+    block to timings, keyed by span name.
     """
     def __init__(
         self, 
         images: dict | None = None, 
-        intermediates: dict | None = None
+        intermediates: dict | None = None,
+        debug_level: int = DEBUG_OFF,
+        sink: ArtifactSink | None = None,
+        record_timings: bool = False
         ):
-        self.images = images
-        self.intermediates = intermediates
+        self.images = images if images is not None else {}
+        self.intermediates = intermediates if intermediates is not None else {}
+        self.debug_level = debug_level
+        self.sink = sink
+        self.record_timings = record_timings
+        self.timings: dict[str, dict[str, float]] = {}
+
+    def span(self, name: str) -> ContextManager:
+        """
+        @brief Times a block of a stage.
+
+        Spans with the same name add up, so a span inside a loop reports the
+        total. Nest spans by giving them dotted names, for example
+        "process_lines.hough".
+
+        @param name Name to record the time under.
+        @return Context manager to wrap the block in.
+        """
+        if not self.record_timings:
+            return _NO_SPAN
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str) -> Iterator[None]:
+        'Add the wall clock and thread CPU time of the block to timings[name].'
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            timing = self.timings.setdefault(name, {"wall_ms": 0.0, "cpu_ms": 0.0, "count": 0})
+            timing["wall_ms"] += (time.perf_counter() - wall_start) * 1000
+            timing["cpu_ms"] += (time.thread_time() - cpu_start) * 1000
+            timing["count"] += 1
+
+    def debug_enabled(self, level: int = DEBUG_RESULTS) -> bool:
+        'Return True if artifacts added at level would be rendered.'
+        return self.debug_level >= level
+
+    def add_artifact(
+        self,
+        name: str,
+        render: Callable[[], np.ndarray],
+        level: int = DEBUG_RESULTS
+        ) -> None:
+        """
+        @brief Renders a debug image and passes it to the sink if level is enabled.
+
+        @param name Name of the artifact, used by sinks as a key or file name.
+        @param render Callable taking no arguments that returns the image.
+        @param level Debug level the artifact belongs to.
+        """
+        if not self.debug_enabled(level):
+            return
+
+        image = render()
+        if self.sink is not None:
+            self.sink.write(name, image)
+        else:
+            self.images[name] = image
+
+# Stages may also have a stage_dependencies attribute mapping a stage name,
+# "marker_detector" or "window_detector", to the names of the stages that must
+# finish first. Stages without one are independent of each other.
 
 class MarkerDetector(Protocol):
     'Protocol to define what a MarkerDetector should look like.'
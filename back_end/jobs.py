@@ -0,0 +1,214 @@
+"""
+@file jobs.py
+@brief Bounded in-process job queue for slow detections.
+
+Clients submit work and get a job ID back straight away, then poll for the
+result. Work runs on a fixed number of threads, OpenCV releases the GIL in its
+heavy calls, and the number of jobs waiting or running is capped so a burst of
+uploads cannot grow memory without limit.
+
+Jobs run in the process that accepted them. With a shared SQLite file, every
+change of status is also written there, so any worker process on the host can
+answer a poll for any job. A job whose process has died is reported as failed.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Literal
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+
+JobStatus = Literal["queued", "running", "done", "failed"]
+
+# Error of a job whose worker process stopped before finishing it, for example
+# when it ran out of memory or was restarted after a timeout.
+WORKER_DIED_ERROR = "The worker running this job stopped, please submit it again."
+
+class JobQueueFull(Exception):
+    'Raised when a job is submitted while the queue is at capacity.'
+
+@dataclass
+class Job:
+    job_id: str
+    status: JobStatus = "queued"
+    result: dict | None = None
+    error: str | None = None
+    created: float = field(default_factory=time.monotonic)
+    finished: float | None = None
+
+    def to_dict(self) -> dict:
+        'Return the job in the shape sent to clients.'
+        job = {"job_id": self.job_id, "status": self.status}
+        if self.result is not None:
+            job["result"] = self.result
+        if self.error is not None:
+            job["error"] = self.error
+        return job
+
+class JobQueue:
+    def __init__(
+            self,
+            max_workers: int = 2,
+            max_pending: int = 16,
+            ttl_s: float = 600,
+            shared_path: str | None = None
+        ):
+        """
+        @param max_workers Number of jobs that run at the same time.
+        @param max_pending Largest number of jobs that may be queued or running
+               in this process.
+        @param ttl_s Seconds a finished job is kept for polling.
+        @param shared_path Path of the SQLite file jobs are shared through, or
+               None to only answer polls for jobs of this process.
+        """
+        self.max_pending = max_pending
+        self.ttl_s = ttl_s
+        self.shared_path = shared_path
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+        if self.shared_path is not None:
+            with self._connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs "
+                    "(job_id TEXT PRIMARY KEY, status TEXT, result TEXT, error TEXT, expires REAL, pid INTEGER)"
+                )
+                # Files written before jobs recorded their process lack the column.
+                columns = {row[1] for row in connection.execute("PRAGMA table_info(jobs)")}
+                if "pid" not in columns:
+                    connection.execute("ALTER TABLE jobs ADD COLUMN pid INTEGER")
+
+    def submit(self, fn: Callable[..., dict], *args) -> Job:
+        """
+        @brief Queues fn(*args) and returns its job without waiting for it.
+
+        @param fn Callable returning a JSON serializable dictionary.
+
+        @return The queued job.
+        """
+        with self._lock:
+            self._purge_expired()
+            pending = sum(1 for job in self._jobs.values() if job.status in ("queued", "running"))
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} jobs already pending, please try again later.")
+
+            job = Job(job_id=uuid.uuid4().hex)
+            self._jobs[job.job_id] = job
+
+        try:
+            self._share(job)
+            self._executor.submit(self._run, job, fn, args)
+        except Exception:
+            # The job will never run, so it must not count against max_pending.
+            with self._lock:
+                del self._jobs[job.job_id]
+            raise
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        'Return the job with the given ID, or None if it is unknown or expired.'
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(job_id)
+        if job is None and self.shared_path is not None:
+            job = self._get_shared(job_id)
+        return job
+
+    def shutdown(self):
+        'Stop accepting work and wait for running jobs to finish.'
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, job: Job, fn: Callable[..., dict], args: tuple):
+        job.status = "running"
+        self._share(job)
+        try:
+            job.result = fn(*args)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished = time.monotonic()
+            self._share(job)
+
+    def _share(self, job: Job):
+        'Write the current state of a job to the shared file, if there is one.'
+        if self.shared_path is None:
+            return
+        # The shared file is read by other processes, so it uses wall clock time.
+        now = time.time()
+        expires = now + self.ttl_s if job.finished is not None else None
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, status, result, error, expires, pid) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    job.job_id, job.status, json.dumps(job.result) if job.result is not None else None,
+                    job.error, expires, os.getpid()
+                )
+            )
+            connection.execute("DELETE FROM jobs WHERE expires <= ?", (now,))
+
+    def _get_shared(self, job_id: str) -> Job | None:
+        now = time.time()
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT status, result, error, pid FROM jobs "
+                "WHERE job_id = ? AND (expires IS NULL OR expires > ?)",
+                (job_id, now)
+            ).fetchone()
+            if row is None:
+                return None
+            status, result, error, pid = row
+            # Only the process that accepted a job finishes it. If that process
+            # is gone the job is failed, and kept for polling like any other.
+            if status in ("queued", "running") and pid is not None and not metrics._process_alive(pid):
+                status, error = "failed", WORKER_DIED_ERROR
+                connection.execute(
+                    "UPDATE jobs SET status = ?, error = ?, expires = ? WHERE job_id = ?",
+                    (status, error, now + self.ttl_s, job_id)
+                )
+        return Job(
+            job_id=job_id,
+            status=status,
+            result=json.loads(result) if result is not None else None,
+            error=error
+        )
+
+    @contextmanager
+    def _connect(self):
+        # SQLite connections cannot be shared between threads, so open one per call.
+        connection = sqlite3.connect(self.shared_path, timeout=5)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished is not None and now - job.finished > self.ttl_s
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+def clear_unfinished(shared_path: str | None) -> None:
+    'Remove jobs an earlier run of the service left queued or running, since no process will finish them.'
+    if not shared_path or not os.path.exists(shared_path):
+        return
+    connection = sqlite3.connect(shared_path, timeout=5)
+    try:
+        with connection:
+            connection.execute("DELETE FROM jobs WHERE expires IS NULL")
+    finally:
+        connection.close()
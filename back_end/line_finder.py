@@ -1,13 +1,52 @@
 """
 @file line_finder.py
 @brief Takes provides the function process_lines for finding a quadrilateral from a processed image.
+
+HoughLinesP can return thousands of segments on textured facades, so the
+geometry below works on the whole (N, 4) segment array at once instead of
+line by line. Each vectorized function gives exactly the same result as the
+scalar line_angle, line_intersection and line_midpoint helpers.
 """
 
 
 import cv2 as cv
 import numpy as np
 import math
-from collections import Counter
+import interfaces
+
+# Pairs of lines get_intersections solves at once. Each pair takes a few hundred
+# bytes of temporary arrays, so this bounds its memory to tens of megabytes.
+INTERSECTION_CHUNK_PAIRS = 1 << 16
+
+
+def as_segments(lines):
+    """Return lines given as [[x1,y1,x2,y2]] or [x1,y1,x2,y2] items as an (N,4) float64 array."""
+    return np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+
+
+def segment_lengths(segments):
+    """Euclidean length of every row of an (N,4) segment array."""
+    dx = segments[:, 2] - segments[:, 0]
+    dy = segments[:, 3] - segments[:, 1]
+    # Matches math.hypot exactly for the integer endpoints HoughLinesP returns.
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def segment_angles(segments):
+    """Angle in degrees (0-180) of every row of an (N,4) segment array."""
+    dx = segments[:, 2] - segments[:, 0]
+    dy = segments[:, 3] - segments[:, 1]
+    # np.arctan2 may use SIMD code that differs from math.atan2 in the last bit.
+    # Angles are compared against tolerances and rounded, so use math.atan2 to
+    # keep decisions identical to line_angle.
+    radians = np.fromiter(map(math.atan2, dy.tolist(), dx.tolist()), dtype=np.float64, count=len(dx))
+    angles = np.degrees(radians)
+    return np.where(angles >= 0, angles, angles + 180)
+
+
+def segment_midpoints(segments):
+    """Midpoint of every row of an (N,4) segment array as two arrays (x, y)."""
+    return (segments[:, 0] + segments[:, 2]) / 2, (segments[:, 1] + segments[:, 3]) / 2
 
 
 def line_length(line):
@@ -35,15 +74,15 @@ def filter_lines_by_angle(lines, angle_ref, tolerance=5):
     @param tolerance tolerance in degrees
     @return filtered lines
     """
-    filtered = []
-    for line in lines:
-        ang = line_angle(line)
-        # Compute difference to reference angle and its perpendicular.
-        diff1 = min(abs(ang - angle_ref), 180 - abs(ang - angle_ref))
-        diff2 = min(abs(ang - (angle_ref + 90) % 180), 180 - abs(ang - (angle_ref + 90) % 180))
-        if diff1 <= tolerance or diff2 <= tolerance:
-            filtered.append(line)
-    return filtered
+    if len(lines) == 0:
+        return []
+
+    ang = segment_angles(as_segments(lines))
+    # Compute difference to reference angle and its perpendicular.
+    diff1 = np.minimum(np.abs(ang - angle_ref), 180 - np.abs(ang - angle_ref))
+    diff2 = np.minimum(np.abs(ang - (angle_ref + 90) % 180), 180 - np.abs(ang - (angle_ref + 90) % 180))
+    keep = (diff1 <= tolerance) | (diff2 <= tolerance)
+    return [lines[i] for i in np.flatnonzero(keep)]
 
 
 def point_line_distance(point, line_pt1, line_pt2):
@@ -106,6 +145,10 @@ def get_four_intersections(intersections, image_shape):
     if len(intersections) < 4:
         return None
 
+    points = np.asarray(intersections).reshape(-1, 2)
+    x = points[:, 0]
+    y = points[:, 1]
+
     # Filter out extreme outliers
     h, w = image_shape[:2]
     buffer_ratio = 0.1
@@ -117,54 +160,102 @@ def get_four_intersections(intersections, image_shape):
     min_y = -buffer_y
     max_y = h + buffer_y
 
-    intersections = [
-        (x, y)
-        for (x, y) in intersections
-        if min_x <= x <= max_x and min_y <= y <= max_y
-    ]
+    inside = (min_x <= x) & (x <= max_x) & (min_y <= y) & (y <= max_y)
+    points = points[inside]
+    x = x[inside]
+    y = y[inside]
+    if len(points) == 0:
+        return None
 
     # Get center point from average
-    cx = sum(p[0] for p in intersections)/len(intersections)
-    cy = sum(p[1] for p in intersections)/len(intersections)
-
-    quadrants = {
-        "tl": [],
-        "tr": [],
-        "br": [],
-        "bl": []
-    }
-
-    for x, y in intersections:
-        if x < cx and y < cy:
-            quadrants["tl"].append((x, y))
-        elif x >= cx and y < cy:
-            quadrants["tr"].append((x, y))
-        elif x >= cx and y >= cy:
-            quadrants["br"].append((x, y))
-        elif x < cx and y >= cy:
-            quadrants["bl"].append((x, y))
+    cx = x.sum()/len(points)
+    cy = y.sum()/len(points)
+
+    quadrants = [
+        (x < cx) & (y < cy),    # TL
+        (x >= cx) & (y < cy),   # TR
+        (x >= cx) & (y >= cy),  # BR
+        (x < cx) & (y >= cy)    # BL
+    ]
+    distances = (x - cx)**2 + (y - cy)**2
 
     selected_points = []
-    for key in ["tl", "tr", "br", "bl"]:
-        points = quadrants[key]
-        if not points:
+    for in_quadrant in quadrants:
+        if not in_quadrant.any():
             return None
         # Pick the one closest to center
-        closest = min(points, key=lambda p: (p[0] - cx)**2 + (p[1] - cy)**2)
-        selected_points.append(closest)
+        candidates = np.flatnonzero(in_quadrant)
+        closest = points[candidates[np.argmin(distances[candidates])]]
+        selected_points.append(tuple(closest))
 
     return selected_points  # In order: TL, TR, BR, BL
 
 
 def get_intersections(lines):
-    """Find intersections for each pair of lines (if they intersect within image bounds)."""
-    intersections = []
-    for i in range(len(lines)):
-        for j in range(i + 1, len(lines)):
-            pt = line_intersection(lines[i], lines[j])
-            if pt is not None:
-                intersections.append(pt)
-    return np.array(intersections)
+    """
+    @brief Find intersections for each pair of lines.
+
+    Pairs are solved by broadcasting, with the same scaling and parallel line
+    test as line_intersection, and in the same pair order as a double loop over
+    i < j. They are taken a few rows of i at a time, so that memory stays
+    bounded when there are thousands of lines.
+
+    @param lines lines defined as [[x1,y1,x2,y2]]
+    @return (K,2) array of integer intersection points, or an empty array
+    """
+    segments = as_segments(lines)
+    count = len(segments)
+    rows_per_chunk = max(1, INTERSECTION_CHUNK_PAIRS // max(count, 1))
+
+    # Every pair may intersect, so the result is at most this large. Chunks are
+    # written straight into it rather than joined at the end.
+    intersections = np.empty((count * (count - 1) // 2, 2), dtype=np.int64)
+    found = 0
+    for row in range(0, count - 1, rows_per_chunk):
+        rows = np.arange(row, min(row + rows_per_chunk, count - 1))
+        # Row major order of the mask keeps the pairs in double loop order.
+        first, second = np.nonzero(np.arange(count) > rows[:, None])
+        points = pair_intersections(segments[rows[first]], segments[second])
+        intersections[found:found + len(points)] = points
+        found += len(points)
+
+    if found == 0:
+        return np.array([])
+    return intersections[:found]
+
+
+def pair_intersections(a, b):
+    """
+    @brief Intersect row k of one (K,4) segment array with row k of another.
+
+    @param a first segment of every pair
+    @param b second segment of every pair
+    @return (M,2) array of integer intersection points of the pairs that are
+            not nearly parallel
+    """
+    # Scale factor (normalize coordinates), per pair
+    scale_factor = np.maximum(np.maximum(np.abs(a).max(axis=1), np.abs(b).max(axis=1)), 1)
+
+    x1, y1, x2, y2 = (a / scale_factor[:, None]).T
+    x3, y3, x4, y4 = (b / scale_factor[:, None]).T
+
+    # Compute determinant and drop nearly parallel pairs
+    denom = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+    valid = np.abs(denom) >= 1e-6
+
+    x1, y1, x2, y2, x3, y3, x4, y4, denom, scale_factor = (
+        v[valid] for v in (x1, y1, x2, y2, x3, y3, x4, y4, denom, scale_factor)
+    )
+
+    # Compute intersection (in scaled space)
+    intersect_x = ((x1 * y2 - y1 * x2) * (x3 - x4) - (x1 - x2) * (x3 * y4 - y3 * x4)) / denom
+    intersect_y = ((x1 * y2 - y1 * x2) * (y3 - y4) - (y1 - y2) * (x3 * y4 - y3 * x4)) / denom
+
+    # Scale back up and truncate like int()
+    intersect_x = np.trunc(intersect_x * scale_factor).astype(np.int64)
+    intersect_y = np.trunc(intersect_y * scale_factor).astype(np.int64)
+
+    return np.stack([intersect_x, intersect_y], axis=1)
 
 
 def fit_quadrilateral(intersections):
@@ -201,16 +292,16 @@ def angular_distance(a, b):
 
 
 def average_line_midpoint(lines, length_thresh=100):
-    mids = []
-    for l in lines:
-        x1, y1, x2, y2 = l[0]
-        if math.hypot(x2 - x1, y2 - y1) < length_thresh:
-            continue
-        mids.append(line_midpoint((x1, y1, x2, y2)))
-    if not mids:
+    if len(lines) == 0:
         return None
-    cx = sum(p[0] for p in mids) / len(mids)
-    cy = sum(p[1] for p in mids) / len(mids)
+    segments = as_segments(lines)
+    segments = segments[segment_lengths(segments) >= length_thresh]
+    if len(segments) == 0:
+        return None
+    mid_x, mid_y = segment_midpoints(segments)
+    # Sum in order with Python floats; NumPy's pairwise sum can round differently.
+    cx = sum(mid_x.tolist()) / len(segments)
+    cy = sum(mid_y.tolist()) / len(segments)
     return cx, cy
 
 
@@ -230,49 +321,48 @@ def select_window_edges(lines, image, length_thresh=100, angle_tolerance=45):
     # Estimate the window center by averaging midpoints of long lines
     cx, cy = average_line_midpoint(lines, length_thresh)
 
+    raw = np.asarray(lines).reshape(-1, 4)
+    segments = raw.astype(np.float64)
+    x1, y1, x2, y2 = segments.T
+    mid_x, mid_y = segment_midpoints(segments)
+    ang = segment_angles(segments)
+
     # Split lines into four regions
-    regions = {"top": [], "right": [], "bottom": [], "left": []}
-    for l in lines:
-        x1,y1,x2,y2 = l[0]
-        mp = line_midpoint((x1,y1,x2,y2))
-        ang = line_angle((x1,y1,x2,y2))
-
-        if y1 < cy and y2 < cy:
-            regions["top"].append((l[0], ang, mp))
-        if x1 > cx and x2 > cx:
-            regions["right"].append((l[0], ang, mp))
-        if y1 > cy and y2 > cy:
-            regions["bottom"].append((l[0], ang, mp))
-        if x1 < cx and x2 < cx:
-            regions["left"].append((l[0], ang, mp))
+    regions = {
+        "top": (y1 < cy) & (y2 < cy),
+        "right": (x1 > cx) & (x2 > cx),
+        "bottom": (y1 > cy) & (y2 > cy),
+        "left": (x1 < cx) & (x2 < cx)
+    }
 
     selected = {}
-    for region, items in regions.items():
+    for region, in_region in regions.items():
         # Determine expected angle for this region
         expected = 0 if region in ("top", "bottom") else 90
 
         # Filter to only those within angle_tolerance of expected
-        items = [itm for itm in items if angular_distance(itm[1], expected) <= angle_tolerance]
-
-        if items:
-            # Compute mode angle (integer binning)
-            angles = [int(round(a)) for (_, a, _) in items]
-            mode_angle = Counter(angles).most_common(1)[0][0]
+        diff = np.abs(ang - expected) % 180
+        in_region = in_region & (np.minimum(diff, 180 - diff) <= angle_tolerance)
+        items = np.flatnonzero(in_region)
+
+        if len(items):
+            # Compute mode angle (integer binning). Ties go to the angle seen
+            # first, as with Counter.most_common.
+            angles = np.rint(ang[items]).astype(np.int64)
+            values, first_seen, counts = np.unique(angles, return_index=True, return_counts=True)
+            most = counts == counts.max()
+            mode_angle = values[most][np.argmin(first_seen[most])]
 
             # Candidates matching mode_angle (±1°)
-            candidates = [(l, mp) for (l, a, mp) in items
-                          if abs(int(round(a)) - mode_angle) <= 1]
+            candidates = items[np.abs(angles - mode_angle) <= 1]
 
-            if candidates:
-                # Pick the one farthest from center along region axis
-                if region in ("top", "bottom"):
-                    best = max(candidates, key=lambda t: abs(t[1][1] - cy))
-                else:
-                    best = max(candidates, key=lambda t: abs(t[1][0] - cx))
-
-                selected[region] = best[0]
+            # Pick the one farthest from center along region axis
+            if region in ("top", "bottom"):
+                best = candidates[np.argmax(np.abs(mid_y[candidates] - cy))]
             else:
-                selected[region] = None  # Mark as empty
+                best = candidates[np.argmax(np.abs(mid_x[candidates] - cx))]
+
+            selected[region] = raw[best]
         else:
             selected[region] = None  # Mark as empty
 
@@ -312,68 +402,89 @@ def select_window_edges(lines, image, length_thresh=100, angle_tolerance=45):
 # -------------------------
 # Main processing pipeline:
 # Assume combined_image is your binary edge image from DoG/Canny combination.
-def process_lines(combined_image, show_output=False):
+def process_lines(combined_image, show_output=False, scale=1.0, context=None):
     """
     @brief Takes a processed image of a window and returns lines of its edges
 
     @param combined_image processed image of window
     @param show_output show output of each pass in a seperate window
-    @return list of 4 lines
+    @param scale size of combined_image relative to the 4032 px photos the pixel
+           parameters were tuned on
+    @param context StageContext that times each step under process_lines.*
+    @return tuple (quad, lines) of the fitted quadrilateral, or None if none was
+            found, and the window edge lines it was fitted to
     """
+    context = context or interfaces.StageContext()
 
     # Detect lines using HoughLinesP
-    lines = cv.HoughLinesP(
-        image=combined_image,
-        rho=1,
-        theta=np.pi / 180,
-        threshold=10,
-        minLineLength=750,
-        maxLineGap=55
-    )
+    with context.span("process_lines.hough"):
+        lines = cv.HoughLinesP(
+            image=combined_image,
+            rho=1,
+            theta=np.pi / 180,
+            threshold=max(1, round(10 * scale)),
+            minLineLength=750 * scale,
+            maxLineGap=55 * scale
+        )
     if lines is None:
         print("No lines detected")
         return None, None
 
-    # Find the longest line to determine the reference angle.
-    longest_line = max(lines, key=line_length)
-    ref_angle = line_angle(longest_line)
+    with context.span("process_lines.filter"):
+        # Find the longest line to determine the reference angle.
+        longest_line = lines[np.argmax(segment_lengths(as_segments(lines)))]
+        ref_angle = line_angle(longest_line)
 
-    # Filter lines: keep lines that are within the tolerance value of ref_angle or ref_angle+90
-    filtered_lines = filter_lines_by_angle(lines, ref_angle, tolerance=12)
+        # Filter lines: keep lines that are within the tolerance value of ref_angle or ref_angle+90
+        filtered_lines = filter_lines_by_angle(lines, ref_angle, tolerance=12)
     if show_output is True:
         show_lines(filtered_lines, combined_image)
 
     # Find edge lines in each half of the image
-    result = select_window_edges(filtered_lines, combined_image, length_thresh=max(combined_image.shape)/5)
-    if result is not None:
-        midpoint, merged_lines = result
-    else:
-        merged_lines = filtered_lines
-        midpoint = average_line_midpoint(filtered_lines)
+    with context.span("process_lines.edges"):
+        result = select_window_edges(filtered_lines, combined_image, length_thresh=max(combined_image.shape)/5)
+        if result is not None:
+            midpoint, merged_lines = result
+        else:
+            merged_lines = filtered_lines
+            midpoint = average_line_midpoint(filtered_lines, length_thresh=100 * scale)
 
     if show_output is True:
         show_lines(merged_lines, combined_image, intersections=[midpoint])
 
-    # Draw merged lines into an image for visualization (optional)
-    lines_img = np.zeros_like(combined_image, dtype=np.uint8)
-    for line in merged_lines:
-        x1, y1, x2, y2 = line[0]
-        cv.line(lines_img, (x1, y1), (x2, y2), 255, 1)
-
     # Find intersection points from merged lines
-    intersections = get_intersections(merged_lines)
+    with context.span("process_lines.intersections"):
+        intersections = get_intersections(merged_lines)
     if show_output is True:
         show_lines(None, combined_image, intersections=intersections)
 
-    # Reduce to four intersections to find quad
-    reduced_intersections = get_four_intersections(intersections, combined_image.shape)
+    with context.span("process_lines.fit"):
+        # Reduce to four intersections to find quad
+        reduced_intersections = get_four_intersections(intersections, combined_image.shape)
 
-    # Fit a quadrilateral using the intersection points
-    quad = fit_quadrilateral(reduced_intersections)
+        # Fit a quadrilateral using the intersection points
+        quad = fit_quadrilateral(reduced_intersections)
     if show_output is True:
         show_lines(None, combined_image, quad=quad)
 
-    return quad, lines_img
+    return quad, merged_lines
+
+
+def draw_lines(shape, lines, thickness=1):
+    """
+    @brief Draws line segments in white on a black image, for debug output.
+
+    @param shape shape of the image to draw on
+    @param lines lines as returned by process_lines
+    @param thickness line thickness in pixels
+    @return the drawn image
+    """
+    lines_img = np.zeros(shape[:2], dtype=np.uint8)
+    if lines is not None:
+        for line in lines:
+            x1, y1, x2, y2 = line[0]
+            cv.line(lines_img, (int(x1), int(y1)), (int(x2), int(y2)), 255, thickness)
+    return lines_img
 
 
 def show_lines(lines, image, intersections=None, quad=None):
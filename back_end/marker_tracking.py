@@ -0,0 +1,216 @@
+"""
+@file marker_tracking.py
+@brief Measures a window live from a stream of frames by tracking its two markers.
+
+Full marker detection on every preview frame is too slow for a live
+measurement. MarkerTracker runs full detection once, then follows the eight
+marker corners from frame to frame with pyramidal Lucas-Kanade optical flow.
+Each corner is also tracked back to the previous frame; corners that do not
+come back to where they started are unreliable. The share of reliable corners
+is the tracking confidence. When it drops below a threshold, when a marker
+keeps fewer than two reliable corners, or after a fixed number of tracked
+frames, the next frame gets a full detection again.
+
+Usage:
+    python marker_tracking.py <frames_directory> <marker_size> [ArUco|AprilTag]
+
+Frames are read in file name order and one JSON line is printed per frame.
+
+@note The marker size must be provided in millimeters (mm).
+"""
+
+from pathlib import Path
+from typing import Literal
+import json
+import sys
+import time
+import cv2 as cv
+import numpy as np
+
+import aruco_registry
+import interfaces
+from two_marker_detect import window_size_from_corners
+
+# Search window and number of pyramid levels of the optical flow.
+FLOW_WINDOW = (21, 21)
+FLOW_LEVELS = 3
+
+# Flow is only computed in a window this much larger than each marker on every
+# side, about the largest motion the pyramid can follow.
+FLOW_MARGIN_PX = FLOW_WINDOW[0] * 2 ** FLOW_LEVELS
+
+# A corner tracked forward and back must land this close to where it started.
+MAX_ROUND_TRIP_PX = 1.0
+
+# Share of reliable corners below which the markers are detected again.
+MIN_CONFIDENCE = 0.75
+
+# Tracked frames after which the markers are detected again, so that drift
+# cannot build up.
+REDETECT_INTERVAL = 60
+
+FRAME_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+class MarkerTracker:
+    'Keeps the two markers of a window located across the frames of one stream.'
+
+    def __init__(
+            self,
+            marker_size_mm: int,
+            marker_type: Literal["ArUco", "AprilTag"] = "AprilTag",
+            border_offset_in: float = 0,
+            pyramid: bool = True,
+            min_confidence: float = MIN_CONFIDENCE,
+            redetect_interval: int = REDETECT_INTERVAL
+        ):
+        """
+        @param marker_size_mm Known size of the markers in millimeters.
+        @param marker_type Marker family in the frames.
+        @param border_offset_in Size of the white border around each marker in inches.
+        @param pyramid Detect markers coarse to fine, see aruco_registry.detect_markers_pyramid.
+        @param min_confidence Share of reliable corners needed to keep tracking.
+        @param redetect_interval Largest number of tracked frames between two detections.
+        """
+        self.marker_size_mm = marker_size_mm
+        self.marker_type = marker_type
+        self.border_offset_in = border_offset_in
+        self.pyramid = pyramid
+        self.min_confidence = min_confidence
+        self.redetect_interval = redetect_interval
+        self.detections = 0
+        self._corners: tuple[np.ndarray, ...] | None = None
+        self._previous: np.ndarray | None = None
+        self._tracked_frames = 0
+
+    def reset(self) -> None:
+        'Forget the markers, so the next frame gets a full detection.'
+        self._corners = None
+        self._previous = None
+        self._tracked_frames = 0
+
+    def process(self, frame: np.ndarray, context: interfaces.StageContext | None = None) -> dict:
+        """
+        @brief Locates the markers in the next frame and measures the window.
+
+        @param frame BGR or grayscale frame.
+        @param context StageContext to record the time of each step in, if it records timings.
+
+        @return Dictionary with whether the markers were tracked rather than
+                detected, the tracking confidence, and width_in and height_in,
+                or error if the markers could not be found.
+        """
+        context = context or interfaces.StageContext()
+
+        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+        corners, confidence, tracked = None, 0.0, False
+        if (self._corners is not None and self._previous.shape == gray.shape
+                and self._tracked_frames < self.redetect_interval):
+            with context.span("track_markers"):
+                corners, confidence = self._track(gray)
+            tracked = corners is not None
+
+        if corners is None:
+            with context.span("detect_markers"):
+                corners = self._detect(gray)
+            confidence = 1.0 if corners is not None else 0.0
+            self.detections += 1
+            self._tracked_frames = 0
+        else:
+            self._tracked_frames += 1
+
+        self._corners = corners
+        self._previous = gray
+
+        result = {"tracked": tracked, "confidence": round(confidence, 2)}
+        if corners is None:
+            result["error"] = "Unable to detect two markers, please take or upload another image."
+            return result
+
+        with context.span("geometry"):
+            width, height = window_size_from_corners(corners, self.marker_size_mm, self.border_offset_in)
+        result["width_in"] = round(width, 2)
+        result["height_in"] = round(height, 2)
+        return result
+
+    def _detect(self, gray: np.ndarray) -> tuple[np.ndarray, ...] | None:
+        'Run full marker detection, returning the corners if exactly two markers are found.'
+        if self.pyramid:
+            corners, ids, _ = aruco_registry.detect_markers_pyramid(gray, self.marker_type, min_markers=2)
+        else:
+            corners, ids, _ = aruco_registry.detect_markers(gray, self.marker_type)
+        if ids is None or len(ids) != 2:
+            return None
+        return tuple(np.asarray(marker, dtype=np.float32).reshape(1, 4, 2) for marker in corners)
+
+    def _track(self, gray: np.ndarray) -> tuple[tuple[np.ndarray, ...] | None, float]:
+        """
+        @brief Follows the corners of the previous frame into the current one.
+
+        Unreliable corners are placed by moving their marker's four previous
+        corners with the rotation, scale and shift fitted to its reliable ones.
+
+        @param gray Current frame in grayscale.
+
+        @return Tuple (corners, confidence). corners is None if tracking failed.
+        """
+        height, width = gray.shape
+        tracks = []
+        for marker in self._corners:
+            quad = marker.reshape(-1, 2)
+            x0, y0 = np.maximum(np.floor(quad.min(axis=0)) - FLOW_MARGIN_PX, 0).astype(int)
+            x1, y1 = np.minimum(np.ceil(quad.max(axis=0)) + FLOW_MARGIN_PX + 1, (width, height)).astype(int)
+            previous, current = self._previous[y0:y1, x0:x1], gray[y0:y1, x0:x1]
+            offset = np.array([x0, y0], dtype=np.float32)
+
+            points = (quad - offset).reshape(-1, 1, 2)
+            forward, forward_status, _ = cv.calcOpticalFlowPyrLK(
+                previous, current, points, None, winSize=FLOW_WINDOW, maxLevel=FLOW_LEVELS
+            )
+            backward, backward_status, _ = cv.calcOpticalFlowPyrLK(
+                current, previous, forward, None, winSize=FLOW_WINDOW, maxLevel=FLOW_LEVELS
+            )
+            round_trip = np.linalg.norm((points - backward).reshape(-1, 2), axis=1)
+            reliable = (forward_status.ravel() == 1) & (backward_status.ravel() == 1) & (round_trip < MAX_ROUND_TRIP_PX)
+            tracks.append((points + offset, forward + offset, reliable))
+
+        confidence = float(np.mean(np.concatenate([reliable for _, _, reliable in tracks])))
+        if confidence < self.min_confidence:
+            return None, confidence
+
+        corners = []
+        for points, forward, reliable in tracks:
+            if reliable.all():
+                corners.append(forward.reshape(1, 4, 2))
+                continue
+            if reliable.sum() < 2:
+                return None, confidence
+            motion, _ = cv.estimateAffinePartial2D(points[reliable], forward[reliable])
+            if motion is None:
+                return None, confidence
+            corners.append(cv.transform(points, motion).reshape(1, 4, 2).astype(np.float32))
+
+        return tuple(corners), confidence
+
+def frame_paths(directory: str | Path) -> list[Path]:
+    'Return the image files in a directory in file name order.'
+    return sorted(path for path in Path(directory).iterdir() if path.suffix.lower() in FRAME_EXTENSIONS)
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4) or not Path(sys.argv[1]).is_dir() or not sys.argv[2].isdigit():
+        print(__doc__)
+        exit()
+
+    tracker = MarkerTracker(int(sys.argv[2]), sys.argv[3] if len(sys.argv) == 4 else "AprilTag")
+    paths = frame_paths(sys.argv[1])
+    start = time.perf_counter()
+    for path in paths:
+        frame = cv.imread(str(path), cv.IMREAD_GRAYSCALE)
+        if frame is None:
+            print(json.dumps({"file": path.name, "error": "Unable to read frame."}))
+            continue
+        print(json.dumps({"file": path.name, **tracker.process(frame)}))
+
+    elapsed = time.perf_counter() - start
+    if paths:
+        print(f"{len(paths)} frames in {elapsed:.2f} s ({len(paths) / elapsed:.1f} frames/s), {tracker.detections} full detections")
@@ -0,0 +1,208 @@
+"""
+@file metrics.py
+@brief Counters, gauges and histograms exported in the Prometheus text format.
+
+Each process keeps its metrics in memory. When a directory is given, flush
+writes them to <directory>/<pid>.json, and render adds up the files of every
+process so that a scrape of any worker reports the whole service. Gauges are
+only summed over processes that are still running, since the last value of a
+dead worker is meaningless. Clear the directory when the service starts.
+With a flush interval, flush rewrites the file at most once per interval, and
+a flush that was skipped is done by a timer at the end of the interval, so the
+file is never more than one interval behind.
+
+Usage:
+    registry = MetricsRegistry(directory="/tmp/painful_prep_metrics")
+    registry.inc("painful_prep_requests_total", {"endpoint": "/detect", "outcome": "success"})
+    registry.observe("painful_prep_request_duration_seconds", {"endpoint": "/detect"}, 0.42)
+    registry.flush()
+    text = registry.render()
+"""
+
+from pathlib import Path
+import json
+import math
+import os
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+IMAGE_BYTES_BUCKETS = tuple(2 ** power for power in range(16, 26))
+MEGAPIXEL_BUCKETS = (0.5, 1, 2, 4, 8, 12, 16, 24, 48)
+
+# Name: (type, help text, histogram buckets).
+METRICS = {
+    "painful_prep_requests_total": (
+        "counter", "Requests handled, by endpoint and outcome.", None),
+    "painful_prep_requests_in_flight": (
+        "gauge", "Requests currently being handled, by endpoint.", None),
+    "painful_prep_request_duration_seconds": (
+        "histogram", "Time to handle a request, by endpoint.", LATENCY_BUCKETS),
+    "painful_prep_stage_duration_seconds": (
+        "histogram", "Wall clock time of each detection step, by stage.", LATENCY_BUCKETS),
+    "painful_prep_image_bytes": (
+        "histogram", "Size of uploaded images in bytes.", IMAGE_BYTES_BUCKETS),
+    "painful_prep_image_megapixels": (
+        "histogram", "Resolution of uploaded images in megapixels.", MEGAPIXEL_BUCKETS),
+}
+
+def label_key(labels: dict[str, str] | None) -> str:
+    'Format labels the way they appear between the braces of a sample.'
+    if not labels:
+        return ""
+    return ",".join(f'{name}="{_escape(str(value))}"' for name, value in sorted(labels.items()))
+
+class MetricsRegistry:
+    def __init__(self, directory: str | None = None, metrics: dict = METRICS, flush_interval_s: float = 0):
+        """
+        @param directory Directory shared by every worker process, or None to
+               only report this process.
+        @param metrics Definitions of the metrics that may be recorded.
+        @param flush_interval_s Shortest time between two writes of this
+               process's file. 0 writes on every flush.
+        """
+        self.directory = Path(directory) if directory else None
+        self.metrics = metrics
+        self.flush_interval_s = flush_interval_s
+        self._lock = threading.Lock()
+        self._state = {"counter": {}, "gauge": {}, "histogram": {}}
+        self._last_flush = -math.inf
+        self._timer: threading.Timer | None = None
+
+    def _series(self, name: str, labels: dict | None):
+        'Return the type of a metric and its samples, keyed by label string.'
+        if name not in self.metrics:
+            raise ValueError(f"Unknown metric {name}.")
+        kind = self.metrics[name][0]
+        return kind, self._state[kind].setdefault(name, {}), label_key(labels)
+
+    def inc(self, name: str, labels: dict | None = None, amount: float = 1) -> None:
+        'Add amount to a counter or gauge.'
+        with self._lock:
+            _, series, key = self._series(name, labels)
+            series[key] = series.get(key, 0) + amount
+
+    def dec(self, name: str, labels: dict | None = None, amount: float = 1) -> None:
+        'Subtract amount from a gauge.'
+        self.inc(name, labels, -amount)
+
+    def observe(self, name: str, labels: dict | None, value: float) -> None:
+        'Record one value in a histogram.'
+        buckets = self.metrics[name][2]
+        with self._lock:
+            _, series, key = self._series(name, labels)
+            sample = series.setdefault(key, {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    sample["buckets"][i] += 1
+            sample["sum"] += value
+            sample["count"] += 1
+
+    def flush(self, force: bool = False) -> None:
+        """
+        @brief Writes the metrics of this process to the shared directory, if there is one.
+
+        @param force Write now, even if the last write was less than
+               flush_interval_s ago.
+        """
+        if self.directory is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            remaining = self._last_flush + self.flush_interval_s - now
+            if not force and remaining > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(remaining, self._flush_later)
+                    self._timer.start()
+                return
+            self._last_flush = now
+            data = json.dumps(self._state)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{os.getpid()}.json"
+        temporary = self.directory / f"{os.getpid()}.{threading.get_ident()}.tmp"
+        temporary.write_text(data)
+        os.replace(temporary, path)
+
+    def _flush_later(self) -> None:
+        'Do a flush that was skipped because the last write was too recent.'
+        with self._lock:
+            self._timer = None
+        self.flush(force=True)
+
+    def collect(self) -> dict:
+        'Return the metrics of every process added together.'
+        if self.directory is None:
+            with self._lock:
+                return json.loads(json.dumps(self._state))
+
+        self.flush(force=True)
+        total = {"counter": {}, "gauge": {}, "histogram": {}}
+        for path in self.directory.glob("*.json"):
+            try:
+                state = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            alive = _process_alive(int(path.stem)) if path.stem.isdigit() else False
+            for kind, metrics in state.items():
+                if kind == "gauge" and not alive:
+                    continue
+                for name, series in metrics.items():
+                    merged = total[kind].setdefault(name, {})
+                    for key, sample in series.items():
+                        if kind == "histogram":
+                            into = merged.setdefault(key, {"buckets": [0] * len(sample["buckets"]), "sum": 0.0, "count": 0})
+                            into["buckets"] = [a + b for a, b in zip(into["buckets"], sample["buckets"])]
+                            into["sum"] += sample["sum"]
+                            into["count"] += sample["count"]
+                        else:
+                            merged[key] = merged.get(key, 0) + sample
+        return total
+
+    def render(self) -> str:
+        'Return every metric in the Prometheus text exposition format.'
+        state = self.collect()
+        lines = []
+        for name, (kind, help_text, buckets) in self.metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, sample in sorted(state[kind].get(name, {}).items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{_braces(key)} {_number(sample)}")
+                    continue
+                separator = "," if key else ""
+                for bound, count in zip(buckets, sample["buckets"]):
+                    lines.append(f'{name}_bucket{{{key}{separator}le="{_number(bound)}"}} {count}')
+                lines.append(f'{name}_bucket{{{key}{separator}le="+Inf"}} {sample["count"]}')
+                lines.append(f"{name}_sum{_braces(key)} {_number(sample['sum'])}")
+                lines.append(f"{name}_count{_braces(key)} {sample['count']}")
+        return "\n".join(lines) + "\n"
+
+def clear_directory(directory: str | None) -> None:
+    'Remove the files left by earlier runs, so counters start from zero.'
+    if not directory or not os.path.isdir(directory):
+        return
+    for path in Path(directory).glob("*.json"):
+        path.unlink(missing_ok=True)
+
+def _process_alive(pid: int) -> bool:
+    'Return True if a process with this pid is running.'
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _escape(value: str) -> str:
+    'Escape a label value as the text format requires.'
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _braces(key: str) -> str:
+    return f"{{{key}}}" if key else ""
+
+def _number(value: float) -> str:
+    'Format a sample value, writing whole numbers without a decimal point.'
+    if isinstance(value, float) and math.isfinite(value) and value.is_integer():
+        return str(int(value))
+    return repr(value)
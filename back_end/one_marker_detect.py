@@ -2,6 +2,10 @@
 @file demo_tool.py
 @brief Gets dimensions for window in a picture file.
 
+Both functions accept either a file path or an already decoded grayscale
+image. measure_window decodes the file once and shares that frame between
+window finding and marker scaling.
+
 Usage: python demo_tool.py <file_path>
 """
 
@@ -9,94 +13,26 @@ import cv2 as cv
 import numpy as np
 import sys
 from pathlib import Path
+import aruco_registry
+import image_io
+import interfaces
+import artifact_sinks
+from image_io import ImageSource
 
 MARKER_LENGTH_MM = 100
 MM_IN_RATIO = 25.4
 
-def find_windowpane(path: Path) -> np.ndarray:
-    """
-    @brief Finds the window in an image.
-    
-    @param path File path to picture containing the window.
-    @return Coordinates of corners of the detected window as a numpy.ndarray.
+def draw_window_candidate(image: np.ndarray, window_candidate: np.ndarray | None) -> np.ndarray:
     """
-    image = cv.imread(path, cv.IMREAD_COLOR_RGB)
-    grayscale_image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
-
-    canny_image = cv.Canny(
-        image       =grayscale_image, 
-        threshold1  =200, 
-        threshold2  =255
-        )
-    
-    canny_image = cv.dilate(
-        src         =canny_image, 
-        kernel      =np.ones((5, 5), np.uint8), 
-        iterations  =2
-        )
-    
-    canny_image = cv.morphologyEx(
-        src         =canny_image, 
-        op          =cv.MORPH_CLOSE, 
-        kernel      =np.ones((5, 5), np.uint8), 
-        iterations  =2
-        )
-
-    if __name__ == "__main__":
-        cv.imwrite("canny.jpg", canny_image)
-
-    height, width = grayscale_image.shape
-    lines_image = np.zeros(
-        shape=(height, width), 
-        dtype=np.uint8
-        )
-
-    lines = cv.HoughLinesP(
-        image           =canny_image, 
-        rho             =1, 
-        theta           =np.pi / 180, 
-        threshold       =25, 
-        minLineLength   =1000, 
-        maxLineGap      =55
-        )
-    
-    for line in lines:
-        x1, y1, x2, y2 = line[0]  # Extract line endpoints
-        cv.line(
-            img         =lines_image, 
-            pt1         =(x1, y1), 
-            pt2         =(x2, y2), 
-            color       =255, 
-            thickness   =1
-            )
-        
-    lines_image = cv.morphologyEx(
-        src         =lines_image,
-        op          =cv.MORPH_CLOSE,
-        kernel      =np.ones((5, 5), np.uint8),
-        iterations  =2
-    )
-    
-    if __name__ == "__main__":
-        cv.imwrite("lines_image.jpg", lines_image)
-    
-    contours, _ = cv.findContours(
-        image   =lines_image, 
-        mode    =cv.RETR_EXTERNAL, 
-        method  =cv.CHAIN_APPROX_SIMPLE
-        )
-    
-    window_candidate = None
-    contours = sorted(contours, key=cv.contourArea, reverse=True)
-    if contours:
-        contour = contours[0]
-
-        window_candidate = cv.approxPolyDP(
-            curve   =contour,
-            epsilon =0.015 * cv.arcLength(curve=contour, closed=True),
-            closed  =True
-        )
+    @brief Draws a window candidate on a colour copy of an image.
 
+    @param image Grayscale image the candidate was found in.
+    @param window_candidate Polygon found by find_windowpane, or None.
+    @return BGR copy of image with the candidate outlined in green, and again
+            in red if it has four sides.
+    """
+    image = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    if window_candidate is not None:
         cv.polylines(
             img         =image,
             pts         =[window_candidate],
@@ -114,26 +50,113 @@ def find_windowpane(path: Path) -> np.ndarray:
                 color       =(0, 0, 255),
                 thickness   =10
             )
+    return image
+
+def find_windowpane(path: ImageSource, context: interfaces.StageContext | None = None) -> np.ndarray:
+    """
+    @brief Finds the window in an image.
     
-    if __name__ == "__main__":
-        cv.imwrite("contours.jpg", image)
+    @param path File path to picture containing the window, or the picture
+           already decoded to grayscale.
+    @param context Receives debug images of the window and, at DEBUG_PASSES,
+           of the edge and line passes, and timings of each step if it
+           records them. Nothing is drawn without one.
+    @return Coordinates of corners of the detected window as a numpy.ndarray.
+    """
+    context = context or interfaces.StageContext()
+    grayscale_image = image_io.load_image(path, cv.IMREAD_GRAYSCALE)
+
+    with context.span("find_windowpane.canny"):
+        canny_image = cv.Canny(
+            image       =grayscale_image, 
+            threshold1  =200, 
+            threshold2  =255
+            )
+    
+        canny_image = cv.dilate(
+            src         =canny_image, 
+            kernel      =np.ones((5, 5), np.uint8), 
+            iterations  =2
+            )
+    
+        canny_image = cv.morphologyEx(
+            src         =canny_image, 
+            op          =cv.MORPH_CLOSE, 
+            kernel      =np.ones((5, 5), np.uint8), 
+            iterations  =2
+            )
+
+    context.add_artifact("canny", lambda: canny_image, interfaces.DEBUG_PASSES)
+
+    with context.span("find_windowpane.hough"):
+        height, width = grayscale_image.shape
+        lines_image = np.zeros(
+            shape=(height, width), 
+            dtype=np.uint8
+            )
+
+        lines = cv.HoughLinesP(
+            image           =canny_image, 
+            rho             =1, 
+            theta           =np.pi / 180, 
+            threshold       =25, 
+            minLineLength   =1000, 
+            maxLineGap      =55
+            )
+    
+        for line in lines:
+            x1, y1, x2, y2 = line[0]  # Extract line endpoints
+            cv.line(
+                img         =lines_image, 
+                pt1         =(x1, y1), 
+                pt2         =(x2, y2), 
+                color       =255, 
+                thickness   =1
+                )
+        
+        lines_image = cv.morphologyEx(
+            src         =lines_image,
+            op          =cv.MORPH_CLOSE,
+            kernel      =np.ones((5, 5), np.uint8),
+            iterations  =2
+        )
+
+    context.add_artifact("lines_image", lambda: lines_image, interfaces.DEBUG_PASSES)
+    
+    with context.span("find_windowpane.contours"):
+        contours, _ = cv.findContours(
+            image   =lines_image, 
+            mode    =cv.RETR_EXTERNAL, 
+            method  =cv.CHAIN_APPROX_SIMPLE
+            )
+    
+        window_candidate = None
+        contours = sorted(contours, key=cv.contourArea, reverse=True)
+        if contours:
+            contour = contours[0]
+
+            window_candidate = cv.approxPolyDP(
+                curve   =contour,
+                epsilon =0.015 * cv.arcLength(curve=contour, closed=True),
+                closed  =True
+            )
+
+    context.add_artifact("contours", lambda: draw_window_candidate(grayscale_image, window_candidate))
 
     return window_candidate
 
-def get_window_dimensions(path: str, quadrilateral: np.ndarray) -> tuple:
+def get_window_dimensions(path: ImageSource, quadrilateral: np.ndarray) -> tuple:
     """
     @brief Computes the width and height of a detected window.
     
-    @param path File path to the image containing the window.
+    @param path File path to the image containing the window, or the image
+           already decoded to grayscale.
     @param quadrilateral Coordinates of the detected window corners.
     @return Tuple containing the width and height of the window in inches.
     """
-    image = cv.imread(path, cv.IMREAD_GRAYSCALE)
+    image = image_io.load_image(path, cv.IMREAD_GRAYSCALE)
 
-    aruco_corners, ids, _ = cv.aruco.detectMarkers(
-        image,
-        cv.aruco.getPredefinedDictionary(cv.aruco.DICT_4X4_50)
-        )
+    aruco_corners, ids, _ = aruco_registry.detect_markers(image, "ArUco")
     
     marker_detect_success = False
     marker_corners = None
@@ -172,6 +195,22 @@ def get_window_dimensions(path: str, quadrilateral: np.ndarray) -> tuple:
     
     return window_width_in, window_height_in
 
+def measure_window(path: ImageSource, context: interfaces.StageContext | None = None) -> tuple:
+    """
+    @brief Finds the window in an image and computes its dimensions.
+
+    @param path File path to picture containing the window, or the picture
+           already decoded to grayscale.
+    @param context Receives debug images and timings, see find_windowpane.
+    @return Tuple containing the width and height of the window in inches.
+    """
+    context = context or interfaces.StageContext()
+    with context.span("decode"):
+        grayscale_image = image_io.load_image(path, cv.IMREAD_GRAYSCALE)
+    windowpane = find_windowpane(grayscale_image, context)
+    with context.span("get_window_dimensions"):
+        return get_window_dimensions(grayscale_image, windowpane)
+
 if __name__ == "__main__":
     if len(sys.argv) != 2:
         print(__doc__)
@@ -180,7 +219,10 @@ if __name__ == "__main__":
         print(__doc__)
         exit()
 
-    windowpane = find_windowpane(sys.argv[1])
-    width, height = get_window_dimensions(sys.argv[1], windowpane)
+    context = interfaces.StageContext(
+        debug_level=interfaces.DEBUG_PASSES,
+        sink=artifact_sinks.DirectorySink(".")
+    )
+    width, height = measure_window(sys.argv[1], context)
     print(f"Width: {height:.2f} in")
     print(F"Height: {width:.2f} in")
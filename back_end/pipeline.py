@@ -5,11 +5,92 @@
 Pipeline is a class that loosely couples separate stages of image processing.
 The Pipeline should make code more testable and easier to replace individual
 components.
+
+Marker detection and window detection both read the same frame. A stage that
+needs another stage to run first says so in its stage_dependencies, for
+example {"window_detector": ("marker_detector",)}. With concurrent=True,
+stages whose dependencies are met run at the same time on a shared thread
+pool. OpenCV releases the GIL in its heavy calls, so they overlap.
+
+With timings=True each stage is timed in its own StageContext, and
+stage_timings returns the result of the last run.
 """
 
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 from dataclasses import dataclass
+from typing import Callable
+import os
+import threading
 import numpy as np
 from interfaces import *
+import concurrency
+
+# Number of threads in the pool shared by concurrent pipelines. Defaults to the
+# detections this process may run at once, see concurrency.py.
+PIPELINE_THREADS = int(os.environ.get("PAINFUL_PREP_PIPELINE_THREADS", concurrency.process_tasks()))
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    'Return the thread pool shared by concurrent pipelines, starting it on first use.'
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PIPELINE_THREADS, thread_name_prefix="pipeline")
+        return _executor
+
+def run_stages(
+        stages: dict[str, Callable[[], object]],
+        dependencies: dict[str, tuple[str, ...]],
+        executor: ThreadPoolExecutor | None = None
+    ) -> dict[str, object]:
+    """
+    @brief Runs stages once their dependencies have finished.
+
+    A stage is only submitted when every stage it depends on has returned, so
+    no pool thread ever blocks waiting on another stage.
+
+    @param stages Callables taking no arguments, keyed by stage name.
+    @param dependencies Names of the stages each stage needs to run first.
+    @param executor Pool to run stages on, or None to run them one at a time in
+           the calling thread.
+
+    @return Result of each stage keyed by stage name.
+    """
+    for name, needs in dependencies.items():
+        unknown = [need for need in needs if need not in stages]
+        if name in stages and unknown:
+            raise ValueError(f"Stage {name} depends on unknown stages {unknown}.")
+
+    results = {}
+    pending = dict(stages)
+    running: dict[Future, str] = {}
+    try:
+        while pending or running:
+            ready = [
+                name for name in pending
+                if all(need in results for need in dependencies.get(name, ()))
+            ]
+            if not ready and not running:
+                raise ValueError(f"Stages {list(pending)} have circular dependencies.")
+
+            for name in ready:
+                stage = pending.pop(name)
+                if executor is None:
+                    results[name] = stage()
+                else:
+                    running[executor.submit(stage)] = name
+
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+    finally:
+        for future in running:
+            future.cancel()
+
+    return results
 
 @dataclass
 class PipelineContext:
@@ -22,12 +103,18 @@ class Pipeline:
         self,
         marker_detector: MarkerDetector,
         window_detector: WindowDetector | None,
-        dimension_calculator: DimensionCalculator
+        dimension_calculator: DimensionCalculator,
+        debug_level: int = DEBUG_OFF,
+        sink: ArtifactSink | None = None,
+        concurrent: bool = False,
+        executor: ThreadPoolExecutor | None = None,
+        timings: bool = False
         ):
+        # Stages share the sink, so debug images from every stage end up together.
         self.contexts = PipelineContext(
-            marker_detector_context=StageContext(),
-            window_detector_context=StageContext(),
-            dimension_calculator_context=StageContext()
+            marker_detector_context=StageContext(debug_level=debug_level, sink=sink, record_timings=timings),
+            window_detector_context=StageContext(debug_level=debug_level, sink=sink, record_timings=timings),
+            dimension_calculator_context=StageContext(debug_level=debug_level, sink=sink, record_timings=timings)
             )
 
         self.marker_detector = marker_detector
@@ -38,11 +125,51 @@ class Pipeline:
 
         self.dimension_calculator = dimension_calculator
         self.dimension_calculator.context = self.contexts.dimension_calculator_context
+
+        self.concurrent = concurrent
+        self.executor = executor
+
+        # Each stage declares what it needs, and one object may fill several roles.
+        self.dependencies: dict[str, tuple[str, ...]] = {}
+        for name, stage in (
+            ("marker_detector", marker_detector),
+            ("window_detector", window_detector)
+        ):
+            declared = getattr(stage, "stage_dependencies", {}).get(name, ())
+            self.dependencies[name] = tuple(declared)
     
     def run(self, image: np.ndarray) -> tuple[float, float]:
         'Run the pipeline.'
-        scale = self.marker_detector.get_scale(image)
-        corners = self.window_detector.detect(image)
+        marker_context = self.contexts.marker_detector_context
+        window_context = self.contexts.window_detector_context
+        dimension_context = self.contexts.dimension_calculator_context
+        for context in (marker_context, window_context, dimension_context):
+            context.timings = {}
+
+        def get_scale():
+            with marker_context.span("get_scale"):
+                return self.marker_detector.get_scale(image)
+
+        def detect():
+            with window_context.span("detect"):
+                return self.window_detector.detect(image)
+
+        results = run_stages(
+            {"marker_detector": get_scale, "window_detector": detect},
+            self.dependencies,
+            (self.executor or get_executor()) if self.concurrent else None
+        )
+        scale = results["marker_detector"]
+        corners = results["window_detector"]
         self.dimension_calculator.scale_mm = scale
-        height, width = self.dimension_calculator.calculate(corners)
-        return height, width
\ No newline at end of file
+        with dimension_context.span("calculate"):
+            height, width = self.dimension_calculator.calculate(corners)
+        return height, width
+
+    def stage_timings(self) -> dict[str, dict[str, dict[str, float]]]:
+        'Return the span timings of the last run, keyed by stage and then by span name.'
+        return {
+            "marker_detector": self.contexts.marker_detector_context.timings,
+            "window_detector": self.contexts.window_detector_context.timings,
+            "dimension_calculator": self.contexts.dimension_calculator_context.timings
+        }
\ No newline at end of file
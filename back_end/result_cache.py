@@ -0,0 +1,143 @@
+"""
+@file result_cache.py
+@brief LRU and TTL cache for detection results keyed on image content.
+
+A result is keyed on the SHA-256 of the encoded image together with every
+input that changes the answer. The in-process tier is an LRU dictionary. The
+optional shared tier is a SQLite file, so every worker process on a host can
+reuse results computed by the others.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+class ResultCache:
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_s: float = 3600,
+        shared_path: str | None = None,
+        max_shared_entries: int = 10000
+        ):
+        """
+        @param max_entries Largest number of results kept in process.
+        @param ttl_s Seconds a result stays valid in either tier.
+        @param shared_path Path of the SQLite file for the shared tier, or None
+               to only cache in process.
+        @param max_shared_entries Largest number of results kept in the shared tier.
+        """
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.shared_path = shared_path
+        self.max_shared_entries = max_shared_entries
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.shared_path is not None:
+            with self._connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS results "
+                    "(key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)"
+                )
+
+    @staticmethod
+    def make_key(data: bytes, *params) -> str:
+        """
+        @brief Builds a cache key from image bytes and the parameters used on them.
+
+        @param data Encoded image bytes.
+        @param params Values that change the result, such as marker size, marker
+               type and algorithm version.
+
+        @return Key identifying the result.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        return ":".join([digest, *(str(param) for param in params)])
+
+    def get(self, key: str):
+        'Return the cached value for key, or None on a miss.'
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+        value = self._get_shared(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            self._put_memory(key, value, now)
+        return value
+
+    def put(self, key: str, value):
+        'Store a JSON serializable value under key in every tier.'
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, value, now)
+
+        if self.shared_path is not None:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now + self.ttl_s, now)
+                )
+                connection.execute("DELETE FROM results WHERE expires <= ?", (now,))
+                connection.execute(
+                    "DELETE FROM results WHERE key IN "
+                    "(SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_shared_entries,)
+                )
+
+    def stats(self) -> dict:
+        'Return hit and miss counters for this process.'
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "entries": len(self._entries)
+            }
+
+    def _put_memory(self, key: str, value, now: float):
+        self._entries[key] = (now + self.ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_shared(self, key: str, now: float):
+        if self.shared_path is None:
+            return None
+
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM results WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    @contextmanager
+    def _connect(self):
+        # SQLite connections cannot be shared between threads, so open one per call.
+        connection = sqlite3.connect(self.shared_path, timeout=5)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
@@ -0,0 +1,85 @@
+"""
+Compare two result files written by test_marker_detectors.py, CSV or JSON Lines.
+
+Lists the images whose total time or accuracy changed the most between the two
+runs, and the images that only one of the runs measured. A change that makes
+find_windowpane faster on average can still make a few photos much slower or
+less accurate, and this is where it shows.
+
+Usage, from back_end/tests:
+    python compare_results.py old_results.csv test-images/results.csv [--top 10]
+"""
+
+import argparse
+import csv
+import json
+
+def read_results(filename):
+    """
+    Read a result file into {(id, method): row}, with numbers converted to floats
+    """
+    with open(filename, newline="") as f:
+        if str(filename).endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    results = {}
+    for row in rows:
+        for column, value in row.items():
+            if column not in ("id", "method") and value not in (None, ""):
+                row[column] = float(value)
+        results[(row["id"], row["method"])] = row
+    return results
+
+def compare(old, new, top=10):
+    """
+    Return the report comparing two results dictionaries as a list of lines
+    """
+    common = sorted(old.keys() & new.keys())
+    lines = []
+
+    timed = [key for key in common if "total_ms" in old[key] and "total_ms" in new[key]]
+    if timed:
+        lines.append(f"Largest changes in total_ms (of {len(timed)} images measured by both):")
+        latency = sorted(timed, key=lambda key: abs(new[key]["total_ms"] - old[key]["total_ms"]), reverse=True)
+        for key in latency[:top]:
+            before, after = old[key]["total_ms"], new[key]["total_ms"]
+            ratio = f"x{after / before:.2f}" if before else "new"
+            lines.append(f"  {key[0]:<16} {key[1]:<14} {before:>9.1f} -> {after:>9.1f} ms  {ratio}")
+        for method in sorted({key[1] for key in timed}):
+            keys = [key for key in timed if key[1] == method]
+            before = sum(old[key]["total_ms"] for key in keys) / len(keys)
+            after = sum(new[key]["total_ms"] for key in keys) / len(keys)
+            lines.append(f"  mean for {method}: {before:.1f} -> {after:.1f} ms")
+        lines.append("")
+
+    changed = [key for key in common if old[key]["accuracy_score"] != new[key]["accuracy_score"]]
+    lines.append(f"Largest changes in accuracy_score ({len(changed)} of {len(common)} images changed):")
+    changed.sort(key=lambda key: abs(new[key]["accuracy_score"] - old[key]["accuracy_score"]), reverse=True)
+    for key in changed[:top]:
+        before, after = old[key], new[key]
+        lines.append(
+            f"  {key[0]:<16} {key[1]:<14} {before['accuracy_score']:.2f} -> {after['accuracy_score']:.2f}"
+            f"  measured {before['measured_width']} x {before['measured_height']}"
+            f" -> {after['measured_width']} x {after['measured_height']}"
+        )
+    lines.append("")
+
+    for label, keys in (("Only measured in the old run:", old.keys() - new.keys()),
+                        ("Only measured in the new run:", new.keys() - old.keys())):
+        if keys:
+            lines.append(label)
+            lines.extend(f"  {image_id:<16} {method}" for image_id, method in sorted(keys))
+            lines.append("")
+
+    return lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two harness result files.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--top", type=int, default=10, help="number of images listed per change")
+    args = parser.parse_args()
+
+    print("\n".join(compare(read_results(args.old), read_results(args.new), args.top)))
@@ -0,0 +1,181 @@
+"""
+@file corpus.py
+@brief Index of the labelled photos in test-images and the detectors run on them.
+
+data.csv is read once into a list of CorpusImage entries. DETECTORS describes
+each detector the harness and the benchmarks run: which photos it applies to,
+how to decode them, and how to measure an already decoded frame, so callers
+decide when and how often a file is decoded.
+
+Set PAINFUL_PREP_IMAGE_CACHE_DIR to keep decoded photos in an image_cache
+directory, so later runs memory map them instead of decoding again.
+
+Usage:
+    for image in corpus.select(corpus.load_manifest(), marker_quantity=2):
+        frame = corpus.decode(image, corpus.DETECTORS["two_marker"])
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+import ast
+import csv
+import hashlib
+import os
+import sys
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import interfaces
+import image_cache
+import one_marker_detect
+import one_marker_detect_v2
+import two_marker_detect
+from image_io import load_image
+
+BACK_END = Path(__file__).resolve().parent.parent
+TEST_IMAGES = Path(__file__).resolve().parent / "test-images"
+DATA_CSV = TEST_IMAGES / "data.csv"
+
+# Decoded image cache shared by every run, disabled unless a directory is set.
+IMAGE_CACHE_DIR = os.environ.get("PAINFUL_PREP_IMAGE_CACHE_DIR")
+IMAGE_CACHE_MB = int(os.environ.get("PAINFUL_PREP_IMAGE_CACHE_MB", 2048))
+IMAGE_CACHE = image_cache.DecodedImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MB * 1024 ** 2) if IMAGE_CACHE_DIR else None
+
+@dataclass(frozen=True)
+class CorpusImage:
+    'One labelled photo from data.csv.'
+    image_id: str
+    path: Path
+    marker_type: str
+    marker_quantity: int
+    marker_size: int
+    window_height: float
+    window_width: float
+    ignore: bool
+
+@dataclass(frozen=True)
+class Detector:
+    'A detector together with the photos it applies to and how to run it.'
+    name: str
+    marker_quantity: int
+    decode_flags: int
+    measure: Callable[[np.ndarray, CorpusImage, interfaces.StageContext], tuple[float, float]]
+    # Modules measure calls into. Their source, and that of the back_end modules
+    # they import, decides whether an earlier result is still valid.
+    modules: tuple[str, ...]
+
+    def fingerprint(self) -> str:
+        'Return a hash of the source code this detector runs.'
+        return source_fingerprint(self.modules)
+
+DETECTORS = {
+    "demo_tool": Detector(
+        name="demo_tool",
+        marker_quantity=1,
+        decode_flags=cv.IMREAD_GRAYSCALE,
+        measure=lambda frame, image, context: one_marker_detect.measure_window(frame, context),
+        modules=("one_marker_detect",)
+    ),
+    "two_marker": Detector(
+        name="two_marker",
+        marker_quantity=2,
+        decode_flags=cv.IMREAD_COLOR_BGR,
+        measure=lambda frame, image, context: two_marker_detect.calculate_two_markers(
+            frame, image.marker_size, image.marker_type, context=context
+        ),
+        modules=("two_marker_detect",)
+    ),
+    "demo_tool_v2": Detector(
+        name="demo_tool_v2",
+        marker_quantity=1,
+        decode_flags=cv.IMREAD_GRAYSCALE,
+        measure=lambda frame, image, context: one_marker_detect_v2.measure_window(frame, None, context),
+        modules=("one_marker_detect_v2",)
+    ),
+}
+
+def source_fingerprint(module_names: tuple[str, ...]) -> str:
+    """
+    @brief Hashes the source of some back_end modules and of every back_end module they import.
+
+    Imports are found by parsing each file, so imports made inside functions
+    and names such as constants imported with "from x import y" are followed.
+
+    @param module_names Names of back_end modules.
+
+    @return Hex digest that changes whenever any of those source files does.
+    """
+    sources = {}
+    pending = list(module_names)
+    while pending:
+        name = pending.pop()
+        path = BACK_END / f"{name}.py"
+        if name in sources or not path.exists():
+            continue
+        sources[name] = path.read_bytes()
+        for node in ast.walk(ast.parse(sources[name])):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                pending.append(node.module)
+
+    digest = hashlib.sha256()
+    for name in sorted(sources):
+        digest.update(name.encode())
+        digest.update(sources[name])
+    return digest.hexdigest()[:16]
+
+def load_manifest(data_csv: str | Path = DATA_CSV, images_dir: str | Path | None = None) -> list[CorpusImage]:
+    """
+    @brief Reads data.csv into a list of photos.
+
+    @param data_csv Path to the label file.
+    @param images_dir Directory holding the photos, by default the one data_csv is in.
+
+    @return Photos in the order they are listed, including ignored and missing ones.
+    """
+    images_dir = Path(images_dir) if images_dir is not None else Path(data_csv).parent
+    with open(data_csv, newline='') as csvfile:
+        return [
+            CorpusImage(
+                image_id=row["id"],
+                path=images_dir / row["id"],
+                marker_type=row["marker_type"],
+                marker_quantity=int(row["marker_quantity"]),
+                marker_size=int(row["marker_size"]),
+                window_height=float(row["window_height"]),
+                window_width=float(row["window_width"]),
+                ignore=row["ignore"].strip().lower() == 'true'
+            )
+            for row in csv.DictReader(csvfile)
+        ]
+
+def select(
+        manifest: list[CorpusImage],
+        marker_quantity: int | None = None,
+        include_ignored: bool = False
+    ) -> list[CorpusImage]:
+    """
+    @brief Returns the photos a detector should be run on.
+
+    @param manifest Photos from load_manifest.
+    @param marker_quantity Only keep photos with this many markers, or None for all.
+    @param include_ignored Keep photos flagged as ignore in data.csv.
+
+    @return Photos that exist on disk and match, in manifest order.
+    """
+    return [
+        image for image in manifest
+        if (marker_quantity is None or image.marker_quantity == marker_quantity)
+        and (include_ignored or not image.ignore)
+        and image.path.exists()
+    ]
+
+def decode(image: CorpusImage, detector: Detector) -> np.ndarray:
+    'Decode a photo the way a detector expects it, through the image cache if it is enabled.'
+    if IMAGE_CACHE is not None:
+        return IMAGE_CACHE.load(image.path, detector.decode_flags)
+    return load_image(image.path, detector.decode_flags)
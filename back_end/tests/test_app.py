@@ -0,0 +1,62 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import io
+import time
+import numpy as np
+import cv2 as cv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import aruco_registry
+import app
+import workers
+
+def encoded(image):
+    return io.BytesIO(cv.imencode(".png", image)[1].tobytes())
+
+def one_marker_image():
+    'Draw a 1000 x 900 px window frame around a 200 px wide ArUco marker 0, which stands for 100 mm.'
+    dictionary = cv.aruco.getPredefinedDictionary(aruco_registry.DICTIONARIES["ArUco"])
+    border_bits = aruco_registry.PARAMETER_PROFILES[("ArUco", "default")].get("markerBorderBits", 1)
+
+    image = np.full((1512, 2016), 255, dtype=np.uint8)
+    cv.rectangle(image, (500, 300), (1500, 1200), 0, 12)
+    image[500:700, 700:900] = cv.aruco.generateImageMarker(dictionary, 0, 200, borderBits=border_bits)
+    return image
+
+def poll_job(client, location, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        body = client.get(location).get_json()
+        if body["status"] in ("done", "failed"):
+            return body
+        time.sleep(0.05)
+    raise TimeoutError(location)
+
+def test_detect_measures_with_the_given_marker_size():
+    client = app.app.test_client()
+    image = workers.synthetic_marker_image("AprilTag")
+
+    # Twice the marker size is twice the window, rounded to half inches.
+    for marker_size, expected in ((20, (5.0, 3.5)), (40, (9.5, 6.5))):
+        response = client.post("/detect", data={"marker_size": str(marker_size), "image": (encoded(image), "window.png")})
+        assert response.status_code == 200
+        assert (response.get_json()["width_in"], response.get_json()["height_in"]) == expected
+
+def test_one_marker_job_is_measured():
+    client = app.app.test_client()
+    response = client.post("/jobs", data={"method": "one_marker", "image": (encoded(one_marker_image()), "window.png")})
+    assert response.status_code == 202
+
+    body = poll_job(client, response.headers["Location"])
+    assert body["status"] == "done"
+    # 1000 x 900 px at half a millimetre per pixel, less the width of the frame lines.
+    assert abs(body["result"]["width_in"] - 19.7) < 1
+    assert abs(body["result"]["height_in"] - 17.7) < 1
+
+def test_unknown_job_method_is_refused():
+    client = app.app.test_client()
+    response = client.post("/jobs", data={"method": "three_marker", "image": (encoded(one_marker_image()), "window.png")})
+    assert response.status_code == 400
@@ -0,0 +1,65 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import pytest
+import numpy as np
+import cv2 as cv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import interfaces
+import artifact_sinks
+import custom_exceptions
+from two_marker_classes import TwoMarkerDetector
+
+def fail_to_render():
+    raise AssertionError("artifact rendered with debugging off")
+
+def test_disabled_context_does_not_render():
+    context = interfaces.StageContext()
+    context.add_artifact("image", fail_to_render)
+
+    results = interfaces.StageContext(debug_level=interfaces.DEBUG_RESULTS)
+    results.add_artifact("pass", fail_to_render, interfaces.DEBUG_PASSES)
+
+    assert context.images == {}
+    assert results.images == {}
+
+def test_artifacts_without_sink_are_kept_on_context():
+    context = interfaces.StageContext(debug_level=interfaces.DEBUG_RESULTS)
+    image = np.zeros((4, 4), dtype=np.uint8)
+
+    context.add_artifact("image", lambda: image)
+
+    assert context.images["image"] is image
+
+def test_directory_sink_writes_files(tmp_path):
+    sink = artifact_sinks.DirectorySink(tmp_path / "debug", ".png")
+    context = interfaces.StageContext(debug_level=interfaces.DEBUG_PASSES, sink=sink)
+    image = np.full((10, 20), 128, dtype=np.uint8)
+
+    context.add_artifact("pass", lambda: image, interfaces.DEBUG_PASSES)
+
+    assert np.array_equal(cv.imread(str(tmp_path / "debug" / "pass.png"), cv.IMREAD_GRAYSCALE), image)
+
+def test_preview_sink_downscales():
+    memory = artifact_sinks.MemorySink()
+    sink = artifact_sinks.PreviewSink(memory, max_side=100)
+
+    sink.write("large", np.zeros((300, 400, 3), dtype=np.uint8))
+    sink.write("small", np.zeros((30, 40), dtype=np.uint8))
+
+    assert memory.images["large"].shape == (75, 100, 3)
+    assert memory.images["small"].shape == (30, 40)
+
+def test_two_marker_detector_renders_debug_image_on_failure():
+    sink = artifact_sinks.MemorySink()
+    context = interfaces.StageContext(debug_level=interfaces.DEBUG_RESULTS, sink=sink)
+    image = np.full((200, 300), 255, dtype=np.uint8)
+
+    with pytest.raises(custom_exceptions.MarkerNotFoundError):
+        TwoMarkerDetector(20, "AprilTag", context).get_scale(image)
+
+    assert sink.images["debug_image"].shape == (200, 300, 3)
+    assert (image == 255).all()
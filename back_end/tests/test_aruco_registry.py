@@ -0,0 +1,43 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import numpy as np
+import cv2 as cv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import aruco_registry
+import workers
+
+def test_detector_is_built_once():
+    assert aruco_registry.get_detector("AprilTag") is aruco_registry.get_detector("AprilTag")
+    assert aruco_registry.get_detector("AprilTag") is not aruco_registry.get_detector("ArUco")
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        aruco_registry.get_detector("AprilTag", "missing")
+
+@pytest.mark.parametrize("marker_type", ["ArUco", "AprilTag"])
+def test_detector_is_shared_between_threads(marker_type):
+    image = workers.synthetic_marker_image(marker_type)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: aruco_registry.detect_markers(image, marker_type), range(8)))
+
+    for corners, ids, _ in results:
+        assert sorted(ids.flatten()) == [0, 1]
+        assert np.array_equal(corners[0], results[0][0][0])
+
+@pytest.mark.parametrize("marker_type", ["ArUco", "AprilTag"])
+def test_pyramid_detection_matches_full_resolution(marker_type):
+    image = cv.resize(workers.synthetic_marker_image(marker_type), None, fx=3, fy=3, interpolation=cv.INTER_NEAREST)
+
+    full_corners, full_ids, _ = aruco_registry.detect_markers(image, marker_type)
+    corners, ids, _ = aruco_registry.detect_markers_pyramid(image, marker_type, min_markers=2)
+
+    full = sorted(zip(full_ids.flatten(), [c.tolist() for c in full_corners]))
+    pyramid = sorted(zip(ids.flatten(), [c.tolist() for c in corners]))
+    assert pyramid == full
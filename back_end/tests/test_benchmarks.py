@@ -0,0 +1,88 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import shutil
+import cv2 as cv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "benchmarks")))
+
+import corpus
+import run_benchmarks
+
+def result(p50, throughput=2.0, rss=200.0, stages=None):
+    'Summary of a detector as benchmark_detector returns it.'
+    timing = {"p50_ms": p50, "p95_ms": p50, "max_ms": p50}
+    return {
+        "images": 1, "runs": 1, "failures": 0,
+        "total": timing,
+        "throughput_ips": throughput,
+        "peak_rss_mb": rss,
+        "stages": stages or {}
+    }
+
+def test_manifest_matches_data_csv():
+    manifest = corpus.load_manifest()
+    assert len(manifest) == 47
+    assert all(image.path.parent == corpus.TEST_IMAGES for image in manifest)
+
+    one_marker = corpus.select(manifest, marker_quantity=1)
+    assert one_marker and all(image.marker_quantity == 1 and not image.ignore for image in one_marker)
+    assert all(image.path.exists() for image in one_marker)
+    assert len(corpus.select(manifest, include_ignored=True)) >= len(corpus.select(manifest))
+
+def test_decode_uses_detector_flags():
+    image = corpus.select(corpus.load_manifest(), marker_quantity=1)[0]
+    assert corpus.decode(image, corpus.DETECTORS["demo_tool"]).ndim == 2
+    assert corpus.DETECTORS["two_marker"].decode_flags == cv.IMREAD_COLOR_BGR
+
+def test_fingerprints_follow_imports(tmp_path, monkeypatch):
+    for source in corpus.BACK_END.glob("*.py"):
+        shutil.copy(source, tmp_path)
+    monkeypatch.setattr(corpus, "BACK_END", tmp_path)
+    before = {name: detector.fingerprint() for name, detector in corpus.DETECTORS.items()}
+
+    with open(tmp_path / "line_finder.py", "a") as file:
+        file.write("# changed\n")
+    after = {name: detector.fingerprint() for name, detector in corpus.DETECTORS.items()}
+    assert after["demo_tool_v2"] != before["demo_tool_v2"]
+    assert after["two_marker"] == before["two_marker"]
+
+    # two_marker_detect only imports a constant from one_marker_detect.
+    with open(tmp_path / "one_marker_detect.py", "a") as file:
+        file.write("# changed\n")
+    assert corpus.DETECTORS["two_marker"].fingerprint() != before["two_marker"]
+
+def test_summarize_percentiles():
+    summary = run_benchmarks.summarize([float(value) for value in range(1, 101)])
+    assert summary["p50_ms"] == 50.5
+    assert summary["p95_ms"] == 95.05
+    assert summary["max_ms"] == 100.0
+
+def test_compare_flags_only_regressions_beyond_threshold():
+    thresholds = run_benchmarks.DEFAULT_THRESHOLDS
+    baseline = {"demo_tool": result(100.0, stages={"canny": {"p50_ms": 40.0, "p95_ms": 40.0, "max_ms": 40.0}})}
+
+    assert run_benchmarks.compare({"demo_tool": result(120.0)}, baseline, thresholds) == []
+    assert run_benchmarks.compare({"demo_tool": result(50.0, throughput=10.0, rss=100.0)}, baseline, thresholds) == []
+
+    regressions = run_benchmarks.compare({"demo_tool": result(200.0)}, baseline, thresholds)
+    assert len(regressions) == 3
+    assert all(line.startswith("demo_tool total") for line in regressions)
+
+    slower_stage = result(100.0, stages={"canny": {"p50_ms": 80.0, "p95_ms": 40.0, "max_ms": 40.0}})
+    assert run_benchmarks.compare({"demo_tool": slower_stage}, baseline, thresholds) == ["demo_tool canny p50_ms: 40.0 -> 80.0"]
+
+    assert len(run_benchmarks.compare({"demo_tool": result(100.0, throughput=1.0)}, baseline, thresholds)) == 1
+    assert len(run_benchmarks.compare({"demo_tool": result(100.0, rss=300.0)}, baseline, thresholds)) == 1
+
+def test_compare_ignores_small_absolute_changes():
+    baseline = {"two_marker": result(1.0)}
+    assert run_benchmarks.compare({"two_marker": result(4.0)}, baseline, run_benchmarks.DEFAULT_THRESHOLDS) == []
+
+def test_benchmark_detector_on_one_image():
+    summary = run_benchmarks.benchmark_detector("two_marker", limit=1)
+    assert summary["images"] == 1 and summary["runs"] == 1
+    assert "decode" in summary["stages"] and "detect_markers" in summary["stages"]
+    assert summary["peak_rss_mb"] > 0
@@ -0,0 +1,45 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import cv2 as cv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "benchmarks")))
+
+import concurrency
+import bench_thread_budget
+
+def test_tasks_are_split_between_server_processes(monkeypatch):
+    monkeypatch.setattr(concurrency, "PARALLEL_TASKS", 8)
+    monkeypatch.setattr(concurrency, "_server_processes", 1)
+    assert concurrency.process_tasks() == 8
+
+    concurrency.share_between(3)
+    assert concurrency.process_tasks() == 2
+
+    # Every process may run at least one detection.
+    concurrency.share_between(16)
+    assert concurrency.process_tasks() == 1
+
+def test_set_opencv_threads():
+    before = cv.getNumThreads()
+    try:
+        concurrency.set_opencv_threads(1)
+        assert cv.getNumThreads() == 1
+    finally:
+        cv.setNumThreads(before)
+
+def test_splits_use_every_core():
+    assert bench_thread_budget.splits(8) == [(8, 1), (4, 2), (2, 4), (1, 8)]
+    assert bench_thread_budget.splits(6) == [(6, 1), (3, 2), (2, 3), (1, 6)]
+
+def test_detection_slots_follow_the_process_share(monkeypatch):
+    monkeypatch.setattr(concurrency, "PARALLEL_TASKS", 4)
+    monkeypatch.setattr(concurrency, "_server_processes", 2)
+    monkeypatch.setattr(concurrency, "_slots", None)
+
+    slots = concurrency.detection_slots()
+    assert slots is concurrency.detection_slots()
+    assert slots.acquire(blocking=False) and slots.acquire(blocking=False)
+    assert not slots.acquire(blocking=False)
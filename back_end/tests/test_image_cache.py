@@ -0,0 +1,60 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from image_cache import DecodedImageCache
+
+def write_photo(path, seed=0, size=(120, 160)):
+    'Write a random colour PNG and return its path.'
+    image = np.random.default_rng(seed).integers(0, 256, (*size, 3), dtype=np.uint8)
+    cv.imwrite(str(path), image)
+    return path
+
+def test_hit_is_a_read_only_memory_map(tmp_path):
+    photo = write_photo(tmp_path / "photo.png")
+    cache = DecodedImageCache(tmp_path / "cache")
+
+    first = cache.load(photo, cv.IMREAD_COLOR_BGR)
+    second = cache.load(photo, cv.IMREAD_COLOR_BGR)
+
+    assert isinstance(second, np.memmap) and not second.flags.writeable
+    assert np.array_equal(first, second)
+    assert np.array_equal(second, cv.imread(str(photo)))
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+def test_decode_modes_and_contents_are_separate_entries(tmp_path):
+    photo = write_photo(tmp_path / "photo.png")
+    cache = DecodedImageCache(tmp_path / "cache")
+
+    assert cache.load(photo, cv.IMREAD_COLOR_BGR).ndim == 3
+    assert cache.load(photo, cv.IMREAD_GRAYSCALE).ndim == 2
+
+    # Rewriting the file under the same name must not return the old pixels.
+    write_photo(photo, seed=1)
+    assert np.array_equal(cache.load(photo, cv.IMREAD_GRAYSCALE), cv.imread(str(photo), cv.IMREAD_GRAYSCALE))
+    assert cache.stats() == {"hits": 0, "misses": 3}
+    assert len(list((tmp_path / "cache").glob("*.npy"))) == 3
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    photos = [write_photo(tmp_path / f"photo_{i}.png", seed=i) for i in range(3)]
+    entry_bytes = 120 * 160 * 3 + 128
+    cache = DecodedImageCache(tmp_path / "cache", max_bytes=2 * entry_bytes)
+
+    cache.load(photos[0])
+    cache.load(photos[1])
+    # Age both entries, then make photo 0 the most recently used before photo 2
+    # forces an eviction.
+    for entry in (tmp_path / "cache").glob("*.npy"):
+        os.utime(entry, (1, 1))
+    cache.load(photos[0])
+    cache.load(photos[2])
+
+    assert len(list((tmp_path / "cache").glob("*.npy"))) == 2
+    cache.load(photos[0])
+    cache.load(photos[1])
+    assert cache.stats() == {"hits": 2, "misses": 4}
@@ -0,0 +1,45 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import pytest
+import numpy as np
+import cv2 as cv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import image_io
+
+def test_decode_image_round_trip():
+    image = np.zeros((20, 30, 3), dtype=np.uint8)
+    image[5:15, 10:20] = 255
+    _, encoded = cv.imencode(".png", image)
+
+    decoded = image_io.decode_image(encoded.tobytes())
+
+    assert np.array_equal(decoded, image)
+
+@pytest.mark.parametrize("data", [b"", b"not an image"])
+def test_decode_image_rejects_invalid_bytes(data):
+    with pytest.raises(ValueError):
+        image_io.decode_image(data)
+
+def test_load_image_passes_arrays_through():
+    image = np.zeros((4, 4), dtype=np.uint8)
+    assert image_io.load_image(image) is image
+
+def test_jpeg_size_reads_header():
+    image = np.zeros((30, 50), dtype=np.uint8)
+    _, encoded = cv.imencode(".jpg", image)
+
+    assert image_io.jpeg_size(encoded.tobytes()) == (50, 30)
+    assert image_io.jpeg_size(cv.imencode(".png", image)[1].tobytes()) is None
+
+def test_read_grayscale_at_size(tmp_path):
+    path = tmp_path / "image.jpg"
+    cv.imwrite(str(path), np.zeros((1200, 1600), dtype=np.uint8))
+
+    image, factor = image_io.read_grayscale_at_size(path, 300)
+
+    assert image.shape == (225, 300)
+    assert factor == pytest.approx(1600 / 300)
@@ -0,0 +1,126 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import threading
+import time
+import pytest
+import multiprocessing
+import sqlite3
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import jobs
+
+def wait_for(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job.status in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(job_id)
+
+def test_job_result_is_returned():
+    queue = jobs.JobQueue(max_workers=1)
+    job = queue.submit(lambda x: {"value": x}, 3)
+    assert wait_for(queue, job.job_id).to_dict() == {"job_id": job.job_id, "status": "done", "result": {"value": 3}}
+    queue.shutdown()
+
+def test_job_error_is_recorded():
+    def fail():
+        raise ValueError("no markers")
+
+    queue = jobs.JobQueue(max_workers=1)
+    job = wait_for(queue, queue.submit(fail).job_id)
+    assert job.status == "failed"
+    assert job.error == "no markers"
+    queue.shutdown()
+
+def test_queue_refuses_work_when_full():
+    release = threading.Event()
+    queue = jobs.JobQueue(max_workers=1, max_pending=2)
+    queue.submit(lambda: release.wait() and {})
+    queue.submit(lambda: {})
+
+    with pytest.raises(jobs.JobQueueFull):
+        queue.submit(lambda: {})
+
+    release.set()
+    queue.shutdown()
+
+def test_unknown_job_is_none():
+    assert jobs.JobQueue().get("missing") is None
+
+def poll(path, job_id):
+    'Poll a job the way another worker process would, from a queue of its own.'
+    job = jobs.JobQueue(max_workers=1, shared_path=path).get(job_id)
+    return job.to_dict() if job is not None else None
+
+def poll_in_other_process(path, job_id):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(poll, path, job_id).result()
+
+def test_job_can_be_polled_from_another_process(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    release = threading.Event()
+    queue = jobs.JobQueue(max_workers=1, shared_path=path)
+
+    running = queue.submit(lambda: release.wait() and {"value": 1})
+    failing = queue.submit(lambda: 1 / 0)
+    assert poll_in_other_process(path, failing.job_id)["status"] == "queued"
+
+    release.set()
+    wait_for(queue, running.job_id)
+    wait_for(queue, failing.job_id)
+    assert poll_in_other_process(path, running.job_id) == {"job_id": running.job_id, "status": "done", "result": {"value": 1}}
+    assert poll_in_other_process(path, failing.job_id)["status"] == "failed"
+    assert poll_in_other_process(path, "missing") is None
+    queue.shutdown()
+
+def test_unfinished_jobs_of_an_earlier_run_are_cleared(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    release = threading.Event()
+    queue = jobs.JobQueue(max_workers=1, shared_path=path)
+    started = threading.Event()
+    done = wait_for(queue, queue.submit(lambda: {}).job_id)
+    stuck = queue.submit(lambda: started.set() or release.wait() and {})
+    # Clear once the job has written that it is running, as a restart would.
+    started.wait()
+
+    jobs.clear_unfinished(path)
+    other = jobs.JobQueue(shared_path=path)
+    assert other.get(stuck.job_id) is None
+    assert other.get(done.job_id).status == "done"
+    release.set()
+    queue.shutdown()
+
+def test_job_of_a_dead_process_is_failed(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    queue = jobs.JobQueue(shared_path=path)
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("INSERT INTO jobs (job_id, status, pid) VALUES ('lost', 'running', ?)", (process.pid,))
+    connection.close()
+
+    job = queue.get("lost")
+    assert (job.status, job.error) == ("failed", jobs.WORKER_DIED_ERROR)
+    assert queue.get("lost").status == "failed"
+
+def test_job_that_could_not_be_shared_is_not_pending(tmp_path, monkeypatch):
+    queue = jobs.JobQueue(max_workers=1, max_pending=1, shared_path=str(tmp_path / "jobs.sqlite"))
+
+    def locked(job):
+        raise sqlite3.OperationalError("database is locked")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(queue, "_share", locked)
+        with pytest.raises(sqlite3.OperationalError):
+            queue.submit(lambda: {})
+
+    assert wait_for(queue, queue.submit(lambda: {}).job_id).status == "done"
+    queue.shutdown()
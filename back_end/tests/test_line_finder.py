@@ -0,0 +1,171 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import math
+from collections import Counter
+import pytest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import line_finder
+
+# Line by line implementations that the vectorized line_finder must match exactly.
+
+def reference_filter_lines_by_angle(lines, angle_ref, tolerance=5):
+    filtered = []
+    for line in lines:
+        ang = line_finder.line_angle(line)
+        diff1 = min(abs(ang - angle_ref), 180 - abs(ang - angle_ref))
+        diff2 = min(abs(ang - (angle_ref + 90) % 180), 180 - abs(ang - (angle_ref + 90) % 180))
+        if diff1 <= tolerance or diff2 <= tolerance:
+            filtered.append(line)
+    return filtered
+
+def reference_get_intersections(lines):
+    intersections = []
+    for i in range(len(lines)):
+        for j in range(i + 1, len(lines)):
+            pt = line_finder.line_intersection(lines[i], lines[j])
+            if pt is not None:
+                intersections.append(pt)
+    return np.array(intersections)
+
+def reference_get_four_intersections(intersections, image_shape):
+    if len(intersections) < 4:
+        return None
+    h, w = image_shape[:2]
+    intersections = [
+        (x, y) for (x, y) in intersections
+        if -w * 0.1 <= x <= w * 1.1 and -h * 0.1 <= y <= h * 1.1
+    ]
+    cx = sum(p[0] for p in intersections) / len(intersections)
+    cy = sum(p[1] for p in intersections) / len(intersections)
+    quadrants = {"tl": [], "tr": [], "br": [], "bl": []}
+    for x, y in intersections:
+        if x < cx and y < cy:
+            quadrants["tl"].append((x, y))
+        elif x >= cx and y < cy:
+            quadrants["tr"].append((x, y))
+        elif x >= cx and y >= cy:
+            quadrants["br"].append((x, y))
+        elif x < cx and y >= cy:
+            quadrants["bl"].append((x, y))
+    selected_points = []
+    for key in ["tl", "tr", "br", "bl"]:
+        points = quadrants[key]
+        if not points:
+            return None
+        selected_points.append(min(points, key=lambda p: (p[0] - cx)**2 + (p[1] - cy)**2))
+    return selected_points
+
+def reference_average_line_midpoint(lines, length_thresh=100):
+    mids = []
+    for l in lines:
+        x1, y1, x2, y2 = l[0]
+        if math.hypot(x2 - x1, y2 - y1) < length_thresh:
+            continue
+        mids.append(line_finder.line_midpoint((x1, y1, x2, y2)))
+    if not mids:
+        return None
+    return sum(p[0] for p in mids) / len(mids), sum(p[1] for p in mids) / len(mids)
+
+def reference_select_window_edges(lines, image, length_thresh=100, angle_tolerance=45):
+    h, w = image.shape
+    cx, cy = reference_average_line_midpoint(lines, length_thresh)
+    regions = {"top": [], "right": [], "bottom": [], "left": []}
+    for l in lines:
+        x1, y1, x2, y2 = l[0]
+        mp = line_finder.line_midpoint((x1, y1, x2, y2))
+        ang = line_finder.line_angle((x1, y1, x2, y2))
+        if y1 < cy and y2 < cy:
+            regions["top"].append((l[0], ang, mp))
+        if x1 > cx and x2 > cx:
+            regions["right"].append((l[0], ang, mp))
+        if y1 > cy and y2 > cy:
+            regions["bottom"].append((l[0], ang, mp))
+        if x1 < cx and x2 < cx:
+            regions["left"].append((l[0], ang, mp))
+    selected = {}
+    for region, items in regions.items():
+        expected = 0 if region in ("top", "bottom") else 90
+        items = [itm for itm in items if line_finder.angular_distance(itm[1], expected) <= angle_tolerance]
+        selected[region] = None
+        if items:
+            mode_angle = Counter([int(round(a)) for (_, a, _) in items]).most_common(1)[0][0]
+            candidates = [(l, mp) for (l, a, mp) in items if abs(int(round(a)) - mode_angle) <= 1]
+            if region in ("top", "bottom"):
+                selected[region] = max(candidates, key=lambda t: abs(t[1][1] - cy))[0]
+            else:
+                selected[region] = max(candidates, key=lambda t: abs(t[1][0] - cx))[0]
+    for region, line in selected.items():
+        if line is None:
+            opposite = {"top": "bottom", "bottom": "top", "left": "right", "right": "left"}[region]
+            opposite_line = selected.get(opposite)
+            if opposite_line is None:
+                return None
+            ox1, oy1, ox2, oy2 = opposite_line
+            if region in ("top", "bottom"):
+                selected[region] = [ox2, h - oy2, ox1, h - oy1]
+            else:
+                selected[region] = [w - ox2, oy2, w - ox1, oy1]
+    lines = [np.array([selected[r]], dtype=np.int32) for r in ("top", "right", "bottom", "left")]
+    return (cx, cy), lines
+
+def random_lines(seed, count, size=4000):
+    rng = np.random.default_rng(seed)
+    lines = rng.integers(0, size, size=(count, 1, 4)).astype(np.int32)
+    # Add near horizontal and vertical segments, and exact parallels, like HoughLinesP gives.
+    lines[::3, 0, 3] = lines[::3, 0, 1] + rng.integers(-20, 20, size=len(lines[::3]))
+    lines[1::3, 0, 2] = lines[1::3, 0, 0] + rng.integers(-20, 20, size=len(lines[1::3]))
+    lines[2::9] = lines[0::9][:len(lines[2::9])] + 7
+    return lines
+
+@pytest.mark.parametrize("seed", range(10))
+def test_filter_lines_by_angle_matches_reference(seed):
+    lines = random_lines(seed, 300)
+    ref_angle = line_finder.line_angle(lines[0])
+    expected = reference_filter_lines_by_angle(lines, ref_angle, tolerance=12)
+    result = line_finder.filter_lines_by_angle(lines, ref_angle, tolerance=12)
+    assert len(result) == len(expected)
+    assert all(np.array_equal(a, b) for a, b in zip(result, expected))
+
+@pytest.mark.parametrize("seed", range(10))
+def test_get_intersections_matches_reference(seed):
+    lines = list(random_lines(seed, 60))
+    result = line_finder.get_intersections(lines)
+    expected = reference_get_intersections(lines)
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+
+@pytest.mark.parametrize("chunk_pairs", [1, 7, 59, 60, 61])
+def test_get_intersections_in_chunks_matches_reference(chunk_pairs, monkeypatch):
+    monkeypatch.setattr(line_finder, "INTERSECTION_CHUNK_PAIRS", chunk_pairs)
+    lines = list(random_lines(3, 60))
+    assert np.array_equal(line_finder.get_intersections(lines), reference_get_intersections(lines))
+
+def test_get_intersections_of_parallel_lines_is_empty():
+    lines = [np.array([[0, 0, 10, 0]]), np.array([[0, 5, 10, 5]])]
+    assert np.array_equal(line_finder.get_intersections(lines), reference_get_intersections(lines))
+
+@pytest.mark.parametrize("seed", range(10))
+def test_get_four_intersections_matches_reference(seed):
+    intersections = line_finder.get_intersections(list(random_lines(seed, 40)))
+    result = line_finder.get_four_intersections(intersections, (3000, 4000))
+    expected = reference_get_four_intersections(intersections, (3000, 4000))
+    assert result == expected
+
+@pytest.mark.parametrize("seed", range(10))
+def test_average_line_midpoint_matches_reference(seed):
+    lines = random_lines(seed, 300)
+    assert line_finder.average_line_midpoint(lines, 800) == reference_average_line_midpoint(lines, 800)
+
+@pytest.mark.parametrize("seed", range(10))
+def test_select_window_edges_matches_reference(seed):
+    lines = list(random_lines(seed, 300))
+    image = np.zeros((3000, 4000), dtype=np.uint8)
+    result = line_finder.select_window_edges(lines, image, length_thresh=800)
+    expected = reference_select_window_edges(lines, image, length_thresh=800)
+    assert result[0] == expected[0]
+    assert all(np.array_equal(a, b) for a, b in zip(result[1], expected[1]))
@@ -1,289 +1,282 @@
 import os
 import sys
 import csv
-import numpy as np
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import cv2 as cv
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-import one_marker_detect as one_marker_detect
-import one_marker_detect_v2 as one_marker_detect_v2
-import two_marker_detect
-
-# paths to the images folder, data.csv and results.csv
-test_images = "test-images"
-data_csv = "test-images/data.csv"
-results_csv = "test-images/results.csv"
-
-# finding the expected width and height from data.csv
-expected_data = {}
-with open(data_csv, newline='') as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        expected_data[row["id"]] = {
-            'width': float(row["window_width"]),
-            'height': float(row["window_height"])
-        }
-
-# creating the results list to be put into the csv file later
-results = []
-accuracy_scores = []
-one_marker_accuracies = []
-two_marker_accuracies = []
-one_marker_v2_accuracies = []
-one_marker_attempts = 0
-two_marker_attempts = 0
-one_marker_v2_attempts = 0
-one_marker_success = 0
-two_marker_success = 0
-one_marker_v2_success = 0
-
-def run_demo_tool():
+import concurrency
+import corpus
+import compare_results
+import interfaces
+from image_cache import file_digest
+from result_cache import ResultCache
+
+# path to results.csv
+results_csv = os.path.join(corpus.TEST_IMAGES, "results.csv")
+
+# number of processes the images are spread over, one per detection the thread budget allows
+HARNESS_WORKERS = int(os.environ.get("PAINFUL_PREP_HARNESS_WORKERS", concurrency.PARALLEL_TASKS))
+
+# SQLite file keeping every detector result between runs, so only detectors whose
+# source changed are run again. Set to an empty string to always run everything.
+RESULT_STORE = os.environ.get("PAINFUL_PREP_RESULT_STORE", os.path.join(os.path.dirname(__file__), ".harness_results.sqlite"))
+
+# detectors in the order they are reported
+METHODS = ("demo_tool", "two_marker", "demo_tool_v2")
+
+# columns of results.csv
+HEADER = [
+    "id",
+    "measured_width",
+    "measured_height",
+    "expected_width",
+    "expected_height",
+    "diff_width",
+    "diff_height",
+    "accuracy_score",
+    "method"
+]
+
+# timing columns of results.csv, in milliseconds, and the StageContext spans that add up to each.
+# geometry_ms is whatever part of total_ms the other columns do not cover.
+STAGE_COLUMNS = {
+    "decode_ms": ("decode", "load_image", "find_windowpane.decode"),
+    "marker_ms": ("detect_markers", "get_window_dimensions"),
+    "edges_ms": ("find_windowpane.canny", "find_windowpane.dog", "find_windowpane.mask"),
+    "hough_ms": ("find_windowpane.hough", "process_lines.hough")
+}
+TIMING_COLUMNS = [*STAGE_COLUMNS, "geometry_ms", "total_ms"]
+HEADER += TIMING_COLUMNS
+
+# bumped whenever the stored outcomes change shape, so older entries are not reused
+RESULT_FORMAT = 2
+
+def init_worker():
     """
-    Run the one marker detection demo tool on all images with one marker and a false ignore flag in data.csv
+    Each worker process handles one image at a time. OpenCV gets the threads
+    the budget in concurrency.py gives one detection, so together the workers
+    fill the cores without competing for them.
     """
+    concurrency.set_opencv_threads()
 
-    #global variables
-    global one_marker_attempts, one_marker_success, one_marker_accuracies, accuracy_scores, results
-
-    print("Results for one marker deteciton using demo_tool: ")
-    for filename in os.listdir(test_images):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            img_path = os.path.join(test_images, filename)
-            img_id = filename
-
-            # error if the file name does not match the id in data.csv
-            if img_id not in expected_data:
-                print(f"Warning: {img_id} not found in data.csv")
-                continue
+def result_row(image, raw_width, raw_height, method, timings=None):
+    """
+    Build the results.csv row of one measured image, with the timing columns if timings are given
+    """
+    measured_width = round(raw_width, 2)
+    measured_height = round(raw_height, 2)
 
-            # gets the marker quantity per img_id
-            with open(data_csv, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    if img_id == row["id"]:
-                        marker_quantity = int(row["marker_quantity"])
-                        ignore_flag = row["ignore"].strip().lower() == 'true'
-                        break
+    #finds the percent error for the width and height per window
+    width_error = abs((measured_width - image.window_width) / image.window_width) * 100
+    height_error = abs((measured_height - image.window_height) / image.window_height) * 100
+    average_error = (width_error + height_error) / 2
 
-            # run demo_tool only if there is one marker and ignore flag is false
-            if marker_quantity == 1 and not ignore_flag:
-                one_marker_attempts += 1
-                try:
-                    #find corners of the windowpane
-                    corners_array = one_marker_detect.find_windowpane(img_path)
+    #calculates accuracy score
+    accuracy_score = round(max(0.0, 1 - (average_error / 100)), 2)
 
-                    #gets width and height of the windowpane
-                    raw_width, raw_height = one_marker_detect.get_window_dimensions(img_path, corners_array)
+    #calculate the difference between expected and measured values
+    diff_width = round(measured_width - image.window_width, 2)
+    diff_height = round(measured_height - image.window_height, 2)
 
-                    measured_width = round(raw_width, 2)
-                    measured_height = round(raw_height, 2)
+    row = [image.image_id, measured_width, measured_height, image.window_width, image.window_height, diff_width, diff_height, accuracy_score, method]
+    if timings is not None:
+        row += [timings[column] for column in TIMING_COLUMNS]
+    return row
 
-                    #finds the expected width and height from data.csv
-                    expected_width = expected_data[img_id]['width']
-                    expected_height = expected_data[img_id]['height']
+def stage_times(spans, decode_ms, measure_ms):
+    """
+    Group the span timings of one measurement into the timing columns.
+    decode_ms is the time spent decoding the file, which is counted even when the
+    frame was decoded earlier for another detector.
+    """
+    times = {column: sum(spans[name]["wall_ms"] for name in names if name in spans) for column, names in STAGE_COLUMNS.items()}
+    times["decode_ms"] += decode_ms
+    times["total_ms"] = decode_ms + measure_ms
+    times["geometry_ms"] = max(0.0, times["total_ms"] - sum(times[column] for column in STAGE_COLUMNS))
+    return {column: round(value, 1) for column, value in times.items()}
 
-                    #finds the percent error for the width and height per window
-                    width_error = abs((measured_width - expected_width) / expected_width) * 100
-                    height_error = abs((measured_height - expected_height) / expected_height) * 100
-                    average_error = (width_error + height_error) / 2
+def evaluate_image(image, methods):
+    """
+    Measure one image with every detector in methods. Runs in a worker process.
+    The image is decoded once per decode mode and the frame is shared by the detectors that use it.
+    Returns {method: outcome}, where outcome holds the raw width and height or the error message,
+    and the stage timings.
+    """
+    frames = {}
+    decode_ms = {}
+    outcomes = {}
+    for method in methods:
+        detector = corpus.DETECTORS[method]
+        context = interfaces.StageContext(record_timings=True)
+        measurement, error = None, None
+        start = time.perf_counter()
+        try:
+            if detector.decode_flags not in frames:
+                frames[detector.decode_flags] = corpus.decode(image, detector)
+                decode_ms[detector.decode_flags] = (time.perf_counter() - start) * 1000
+                start = time.perf_counter()
+            raw_width, raw_height = detector.measure(frames[detector.decode_flags], image, context)
+            measurement = [float(raw_width), float(raw_height)]
+        except Exception as e:
+            error = f"Error processing {image.image_id} with {method}: {e}"
+        measure_ms = (time.perf_counter() - start) * 1000
+        timings = stage_times(context.timings, decode_ms.get(detector.decode_flags, 0.0), measure_ms)
+        outcomes[method] = {"measurement": measurement, "error": error, "timings": timings}
+    return outcomes
+
+def open_result_store(path=RESULT_STORE):
+    """
+    Open the persistent store of detector outcomes, or return None if it is disabled.
+    Entries never expire; the least recently used are dropped once there are too many.
+    """
+    if not path:
+        return None
+    return ResultCache(max_entries=0, ttl_s=float("inf"), shared_path=path)
 
-                    #calculates accuracy score
-                    accuracy_score = round(max(0.0, 1-(average_error / 100)), 2)
+def result_key(digest, image, method, fingerprints):
+    """
+    Key of one detector outcome. Expected sizes are left out, since rows are
+    rebuilt from the stored measurement whenever data.csv changes. Reused outcomes
+    keep the timings of the run that computed them.
+    """
+    detector = corpus.DETECTORS[method]
+    return ":".join([
+        digest, method, fingerprints[method], str(image.marker_size), image.marker_type,
+        str(detector.decode_flags), cv.__version__, str(RESULT_FORMAT)
+    ])
 
-                    one_marker_accuracies.append(accuracy_score)
-                    accuracy_scores.append(accuracy_score)
-                    one_marker_success += 1
+class ResultWriter:
+    """
+    Write result rows to a CSV file, or a JSON Lines file if the name ends in .jsonl,
+    as soon as each one is known
+    """
 
-                    #calculate the difference between expected and measured values
-                    diff_width = round(measured_width - expected_width, 2)
-                    diff_height = round(measured_height - expected_height, 2)
+    def __init__(self, filename):
+        self.jsonl = str(filename).endswith(".jsonl")
+        self.file = open(filename, mode="w", newline="")
+        self.writer = None if self.jsonl else csv.writer(self.file)
+        if self.writer:
+            self.writer.writerow(HEADER)
 
-                    #appends the results to the results list
-                    results.append([img_id, measured_width, measured_height, expected_width, expected_height, diff_width, diff_height, accuracy_score, "demo_tool"])
+    def write(self, row):
+        if self.jsonl:
+            self.file.write(json.dumps(dict(zip(HEADER, row))) + "\n")
+        else:
+            self.writer.writerow(row)
+        self.file.flush()
 
-                except Exception as e:
-                    print(f"Error processing {img_id}: {e}")
+    def close(self):
+        self.file.close()
 
-    if one_marker_attempts:
-        average_accuracy = round((sum(one_marker_accuracies) / len(one_marker_accuracies)) * 100, 2) if one_marker_accuracies else 0.0
-        reliability = round((one_marker_success / one_marker_attempts) * 100, 2)
-        print(f"Average accuracy for one marker detection using demo_tool: {average_accuracy}% | Reliability for one marker detection using demo_tool: {reliability}%\n")
-    else:
-        print("No one marker images processed.")
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *exc):
+        self.close()
 
-def run_two_marker_detect():
+class Summary:
     """
-    Run the two marker detection on all images with two markers and a false ignore flag in data.csv
-    This function also separates which marker type is used in the image.
+    Running totals of the results, so the report does not need every row kept in memory
     """
-    print("Results for two marker detection using two_marker_detect: ")
-
-    #global variables
-    global two_marker_attempts, two_marker_success, two_marker_accuracies, accuracy_scores, results
-
-    for filename in os.listdir(test_images):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            img_path = os.path.join(test_images, filename)
-            img_id = filename
 
-            # error if the file name does not match the id in data.csv
-            if img_id not in expected_data:
-                print(f"Warning: {img_id} not found in data.csv")
-                continue
-
-            # gets the marker quantity per img_id
-            with open(data_csv, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    if img_id == row["id"]:
-                        marker_quantity = int(row["marker_quantity"])
-                        ignore_flag = row["ignore"].strip().lower() == 'true'
-                        break
-
-            # run demo_tool only if there is one marker and ignore flag is false
-            if marker_quantity == 2 and not ignore_flag:
-                two_marker_attempts += 1
-                try:
-                    #get the marker size from data.csv
-                    with open(data_csv, newline='') as csvfile:
-                        reader = csv.DictReader(csvfile)
-                        for row in reader:
-                            if img_id == row["id"]:
-                                marker_size = int(row["marker_size"])
-                                marker_type = row["marker_type"]
-                                break
-
-                    #calculate the width and height of the windowpane
-                    raw_width, raw_height = two_marker_detect.calculate_two_markers(img_path, marker_size, marker_type)
-
-                    measured_width = round(raw_width, 2)
-                    measured_height = round(raw_height, 2)
-
-                    #checks if the actual width and height are None if the image is not detected
-                    if measured_width is None or measured_height is None:
-                        print(f"Error: Unable to calculate dimensions for {img_id}")
-                        continue
-
-                    #find expected width and height from data.csv
-                    expected_width = expected_data[img_id]['width']
-                    expected_height = expected_data[img_id]['height']
-
-                    #find the percent error for the width and height per window
-                    width_error = abs((measured_width - expected_width) / expected_width) * 100
-                    height_error = abs((measured_height - expected_height) / expected_height) * 100
-                    average_error = (width_error + height_error) / 2
-
-                    #generate accuracy of the window detection
-                    accuracy = round(max(0.0, 1 - (average_error / 100)), 2)
-
-                    two_marker_accuracies.append(accuracy)
-                    accuracy_scores.append(accuracy)
-                    two_marker_success += 1
-
-                    #calculate the difference between expected and measured values
-                    diff_width = round(measured_width - expected_width, 2)
-                    diff_height = round(measured_height - expected_height, 2)
-
-                    results.append([img_id, measured_width, measured_height, expected_width, expected_height, diff_width, diff_height, accuracy, "two_marker"])
-
-                except Exception as e:
-                    print(f"Error processing {img_id}: {e}")
-
-    if two_marker_attempts:
-        average_accuracy = round(sum(two_marker_accuracies) / len(two_marker_accuracies) * 100, 2) if two_marker_accuracies else 0.0
-        reliability = round((two_marker_success / two_marker_attempts) * 100, 2)
-        print(f"Average accuracy for two marker detection: {average_accuracy}% | Reliability for two marker detection: {reliability}%\n")
-    else:
-        print("No two marker images processed.")
-
-def run_demo_tool_v2():
+    def __init__(self, methods=METHODS):
+        self.methods = methods
+        self.attempts = dict.fromkeys(methods, 0)
+        self.successes = dict.fromkeys(methods, 0)
+        self.accuracy_sums = dict.fromkeys(methods, 0.0)
+        self.best_case = None
+        self.worst_case = None
+
+    def add(self, method, row):
+        self.attempts[method] += 1
+        if row is None:
+            return
+        self.successes[method] += 1
+        self.accuracy_sums[method] += row[7]
+        if self.best_case is None or total_diff(row) < total_diff(self.best_case):
+            self.best_case = row
+        if self.worst_case is None or total_diff(row) > total_diff(self.worst_case):
+            self.worst_case = row
+
+    def report(self):
+        for method in self.methods:
+            if self.attempts[method]:
+                average_accuracy = round(self.accuracy_sums[method] / self.successes[method] * 100, 2) if self.successes[method] else 0.0
+                reliability = round(self.successes[method] / self.attempts[method] * 100, 2)
+                print(f"Average accuracy for {method}: {average_accuracy}% | Reliability for {method}: {reliability}%")
+            else:
+                print(f"No images processed for {method}.")
+        report_best_and_worst_results(self.best_case, self.worst_case)
+
+def run_corpus(manifest, writer, methods=METHODS, workers=HARNESS_WORKERS, store=None):
     """
-    Run the one marker detection v2 on all images with one marker and a false ignore flag in data.csv
+    Run every applicable detector on each image with a false ignore flag in data.csv, in one pass.
+    Outcomes already in the store are reused, and only the missing ones are computed.
+    Images are spread over a process pool with at most a few per worker in flight, and rows
+    are written in manifest order as soon as the images before them are done.
     """
-    print("Results for one marker detection using demo_tool_v2:")
-
-    #global variables
-    global one_marker_v2_attempts, one_marker_v2_success, one_marker_v2_accuracies, accuracy_scores, results
-
-    for filename in os.listdir(test_images):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            img_path = os.path.join(test_images, filename)
-            img_id = filename
-
-            # error if the file name does not match the id in data.csv
-            if img_id not in expected_data:
-                print(f"Warning: {img_id} not found in data.csv")
+    summary = Summary(methods)
+    fingerprints = {method: corpus.DETECTORS[method].fingerprint() for method in methods}
+    jobs = []
+    for image in corpus.select(manifest):
+        image_methods = [method for method in methods if corpus.DETECTORS[method].marker_quantity == image.marker_quantity]
+        if image_methods:
+            jobs.append((image, image_methods))
+
+    def record(image, image_methods, keys, stored, future):
+        outcomes = dict(stored)
+        if future is not None:
+            computed = future.result()
+            outcomes.update(computed)
+            if store is not None:
+                for method, outcome in computed.items():
+                    store.put(keys[method], outcome)
+        for method in image_methods:
+            outcome = outcomes[method]
+            if outcome["error"]:
+                summary.add(method, None)
+                print(outcome["error"])
                 continue
-
-            # gets the marker quantity per img_id
-            with open(data_csv, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    if img_id == row["id"]:
-                        marker_quantity = int(row["marker_quantity"])
-                        ignore_flag = row["ignore"].strip().lower() == 'true'
-                        break
-
-            # run demo_tool only if there is one marker and ignore flag is false
-            if marker_quantity == 1 and not ignore_flag:
-                one_marker_v2_attempts += 1
-                try:
-                    #find corners of the windowpane
-                    corners_array = one_marker_detect_v2.find_windowpane(img_path)
-
-                    #gets width and height of the windowpane
-                    raw_width, raw_height = one_marker_detect_v2.get_window_dimensions(img_path, corners_array)
-
-                    measured_width = round(raw_width, 2)
-                    measured_height = round(raw_height, 2)
-
-                    #finds the expected width and height from data.csv
-                    expected_width = expected_data[img_id]['width']
-                    expected_height = expected_data[img_id]['height']
-
-                    #finds the percent error for the width and height per window
-                    width_error = abs((measured_width - expected_width) / expected_width) * 100
-                    height_error = abs((measured_height - expected_height) / expected_height) * 100
-                    average_error = (width_error + height_error) / 2
-
-                    #calculates accuracy score
-                    accuracy_score = round(max(0.0, 1-(average_error / 100)), 2)
-
-                    one_marker_v2_accuracies.append(accuracy_score)
-                    accuracy_scores.append(accuracy_score)
-                    one_marker_v2_success += 1
-                    
-                    #calculate the difference between expected and measured values
-                    diff_width = round(measured_width - expected_width, 2)
-                    diff_height = round(measured_height - expected_height, 2)
-
-                    #appends the results to the results list
-                    results.append([img_id, measured_width, measured_height, expected_width, expected_height, diff_width, diff_height, accuracy_score, "demo_tool_v2"])
-
-                except Exception as e:
-                    print(f"Error processing {img_id}: {e}")
-
-    if one_marker_attempts:
-        average_accuracy = round((sum(one_marker_v2_accuracies) / len(one_marker_v2_accuracies)) * 100, 2) if one_marker_v2_accuracies else 0.0
-        reliability = round((one_marker_v2_success / one_marker_v2_attempts) * 100, 2)
-        print(f"Average accuracy for one marker detection using demo_tool: {average_accuracy}% | Reliability for demo_tool_v2: {reliability}%\n")
-    else:
-        print("No one marker images processed.")
-
-def report_best_and_worst_results(results):
+            row = result_row(image, *outcome["measurement"], method, outcome["timings"])
+            summary.add(method, row)
+            writer.write(row)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        pending = deque()
+        for image, image_methods in jobs:
+            keys, stored = {}, {}
+            if store is not None:
+                digest = file_digest(image.path)
+                for method in image_methods:
+                    keys[method] = result_key(digest, image, method, fingerprints)
+                    outcome = store.get(keys[method])
+                    if outcome is not None:
+                        stored[method] = outcome
+            stale = [method for method in image_methods if method not in stored]
+            future = executor.submit(evaluate_image, image, stale) if stale else None
+            pending.append((image, image_methods, keys, stored, future))
+            if len(pending) >= 2 * workers:
+                record(*pending.popleft())
+        while pending:
+            record(*pending.popleft())
+
+    return summary
+
+def total_diff(result):
+    return abs(result[5]) + abs(result[6])
+
+def report_best_and_worst_results(best_case, worst_case):
     """
     Report the best case (image with the smallest absolute sum of diff_width and diff_height)
-    and the worst case (image with the largest absolute sum of diff_width and diff_height) 
+    and the worst case (image with the largest absolute sum of diff_width and diff_height)
     """
-    if not results:
+    if best_case is None:
         print("No results to report.")
         return
-    
-    def total_diff(result):
-        return abs(result[5]) + abs(result[6])
-    
-    best_case = min(results, key=total_diff)
-    worst_case = max(results, key=total_diff)
 
     print("\nBest Case (lowest total difference):")
     print(f"  ID: {best_case[0]} | Method: {best_case[8]}")
@@ -296,30 +289,76 @@ def report_best_and_worst_results(results):
     print(f"  Diffs => Height: {worst_case[5]}, Width: {worst_case[6]} | Accuracy: {worst_case[7]*100:.2f}%")
 
 
-def save_results(filename, data):
-    """
-    Save the results to a CSV file
-    """
-    header = [
-        "id", 
-        "measured_width",
-        "measured_height",
-        "expected_width",
-        "expected_height",
-        "diff_width",
-        "diff_height",
-        "accuracy_score",
-        "method"
+def test_result_row_scores_percent_error():
+    image = corpus.CorpusImage("img.jpg", corpus.TEST_IMAGES / "img.jpg", "ArUco", 1, 50, 40.0, 20.0, False)
+    row = result_row(image, 22.004, 36.0, "demo_tool")
+    # 10% error in both directions
+    assert row == ["img.jpg", 22.0, 36.0, 20.0, 40.0, 2.0, -4.0, 0.9, "demo_tool"]
+
+def test_writer_and_summary_stream_rows(tmp_path):
+    rows = [
+        ["a.jpg", 10.0, 10.0, 10.0, 10.0, 0.0, 0.0, 1.0, "demo_tool"],
+        ["b.jpg", 12.0, 10.0, 10.0, 10.0, 2.0, 0.0, 0.9, "demo_tool"]
     ]
-    with open(filename, mode="w", newline="" ) as f:
-        writer = csv.writer(f)
-        writer.writerow(header)
-        writer.writerows(data)
+    summary = Summary(("demo_tool", "two_marker"))
+    with ResultWriter(tmp_path / "results.jsonl") as jsonl, ResultWriter(tmp_path / "results.csv") as csv_writer:
+        for row in rows:
+            summary.add("demo_tool", row)
+            jsonl.write(row)
+            csv_writer.write(row)
+        summary.add("two_marker", None)
+
+    lines = (tmp_path / "results.jsonl").read_text().splitlines()
+    assert [json.loads(line)["accuracy_score"] for line in lines] == [1.0, 0.9]
+    assert (tmp_path / "results.csv").read_text().splitlines()[0] == ",".join(HEADER)
+    assert summary.successes == {"demo_tool": 2, "two_marker": 0}
+    assert summary.attempts == {"demo_tool": 2, "two_marker": 1}
+    assert summary.best_case is rows[0] and summary.worst_case is rows[1]
+
+def test_stage_times_cover_the_total():
+    spans = {
+        "find_windowpane.canny": {"wall_ms": 10.0},
+        "find_windowpane.process_lines": {"wall_ms": 50.0},
+        "process_lines.hough": {"wall_ms": 40.0},
+        "get_window_dimensions": {"wall_ms": 30.0}
+    }
+    times = stage_times(spans, decode_ms=20.0, measure_ms=100.0)
+    assert times == {"decode_ms": 20.0, "marker_ms": 30.0, "edges_ms": 10.0, "hough_ms": 40.0, "geometry_ms": 20.0, "total_ms": 120.0}
+
+def test_compare_lists_largest_changes(tmp_path):
+    image = corpus.CorpusImage("img.jpg", corpus.TEST_IMAGES / "img.jpg", "ArUco", 1, 50, 40.0, 20.0, False)
+    timings = dict.fromkeys(TIMING_COLUMNS, 100.0)
+    with ResultWriter(tmp_path / "old.csv") as writer:
+        writer.write(result_row(image, 20.0, 40.0, "demo_tool", timings))
+        writer.write(result_row(image, 20.0, 40.0, "demo_tool_v2", timings))
+    with ResultWriter(tmp_path / "new.jsonl") as writer:
+        writer.write(result_row(image, 22.0, 36.0, "demo_tool", {**timings, "total_ms": 400.0}))
+
+    lines = compare_results.compare(compare_results.read_results(tmp_path / "old.csv"), compare_results.read_results(tmp_path / "new.jsonl"))
+    assert "100.0 ->     400.0 ms  x4.00" in lines[1]
+    assert any("1.00 -> 0.90" in line for line in lines)
+    assert lines[lines.index("Only measured in the old run:") + 1].split() == ["img.jpg", "demo_tool_v2"]
+
+def test_run_corpus_reuses_stored_results(tmp_path):
+    manifest = corpus.select(corpus.load_manifest(), marker_quantity=2)[:1]
+    store = open_result_store(str(tmp_path / "store.sqlite"))
+
+    for _ in range(2):
+        with ResultWriter(tmp_path / "results.csv") as writer:
+            summary = run_corpus(manifest, writer, methods=("two_marker",), workers=1, store=store)
+        assert summary.attempts == {"two_marker": 1}
+
+    assert store.stats()["misses"] == 1 and store.stats()["shared_hits"] == 1
+    assert len((tmp_path / "results.csv").read_text().splitlines()) == 1 + summary.successes["two_marker"]
 
 
 if __name__ == "__main__":
-    run_demo_tool()
-    run_two_marker_detect()
-    run_demo_tool_v2()
-    report_best_and_worst_results(results)
-    save_results("test-images/results.csv", results)
+    # optional path to write the results to, ending in .csv or .jsonl
+    output = sys.argv[1] if len(sys.argv) > 1 else results_csv
+    store = open_result_store()
+    with ResultWriter(output) as writer:
+        summary = run_corpus(corpus.load_manifest(), writer, store=store)
+    if store is not None:
+        stats = store.stats()
+        print(f"Reused {stats['shared_hits']} stored results, computed {stats['misses']}.\n")
+    summary.report()
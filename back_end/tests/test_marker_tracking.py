@@ -0,0 +1,59 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import cv2 as cv
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import interfaces
+import marker_tracking
+import workers
+from two_marker_detect import calculate_two_markers
+
+def shifted(image, dx, dy):
+    'Return image moved by dx, dy pixels, padded with white.'
+    motion = np.float32([[1, 0, dx], [0, 1, dy]])
+    return cv.warpAffine(image, motion, (image.shape[1], image.shape[0]), borderValue=255)
+
+@pytest.fixture(scope="module")
+def marker_image():
+    # Pad the markers with white so that they can move a long way.
+    return cv.copyMakeBorder(workers.synthetic_marker_image("AprilTag"), 300, 300, 300, 300, cv.BORDER_CONSTANT, value=255)
+
+def test_markers_are_tracked_after_one_detection(marker_image):
+    tracker = marker_tracking.MarkerTracker(20, "AprilTag")
+    results = [tracker.process(shifted(marker_image, 4 * i, 3 * i)) for i in range(10)]
+
+    assert tracker.detections == 1
+    assert not results[0]["tracked"] and all(result["tracked"] for result in results[1:])
+    expected = calculate_two_markers(marker_image, 20, "AprilTag")
+    for result in results:
+        assert (result["width_in"], result["height_in"]) == expected
+        assert result["confidence"] == 1.0
+
+def test_large_jump_and_lost_markers_fall_back_to_detection(marker_image):
+    tracker = marker_tracking.MarkerTracker(20, "AprilTag")
+    context = interfaces.StageContext(record_timings=True)
+
+    tracker.process(marker_image, context)
+    # Further than the optical flow can follow.
+    jumped = tracker.process(shifted(marker_image, 280, -250), context)
+    assert not jumped["tracked"] and "width_in" in jumped
+
+    lost = tracker.process(np.full_like(marker_image, 255), context)
+    assert "error" in lost and lost["confidence"] == 0.0
+    found = tracker.process(marker_image, context)
+    assert not found["tracked"] and "width_in" in found
+
+    assert tracker.detections == 4
+    assert context.timings["detect_markers"]["count"] == 4
+    # Tracking was tried, and failed, on the jumped and the blank frame.
+    assert context.timings["track_markers"]["count"] == 2
+
+def test_detection_is_repeated_after_redetect_interval(marker_image):
+    tracker = marker_tracking.MarkerTracker(20, "AprilTag", redetect_interval=3)
+    results = [tracker.process(shifted(marker_image, i, 0)) for i in range(8)]
+    assert [result["tracked"] for result in results] == [False, True, True, True, False, True, True, True]
@@ -0,0 +1,73 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import multiprocessing
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from metrics import MetricsRegistry
+
+def record_in_other_process(directory):
+    registry = MetricsRegistry(directory=directory)
+    registry.inc("painful_prep_requests_total", {"endpoint": "/detect", "outcome": "success"}, 2)
+    registry.inc("painful_prep_requests_in_flight", {"endpoint": "/detect"})
+    registry.observe("painful_prep_request_duration_seconds", {"endpoint": "/detect"}, 0.3)
+    registry.flush()
+
+def test_render_counters_and_histograms():
+    registry = MetricsRegistry()
+    registry.inc("painful_prep_requests_total", {"endpoint": "/detect", "outcome": "ValueError"})
+    registry.observe("painful_prep_request_duration_seconds", {"endpoint": "/detect"}, 0.2)
+    registry.observe("painful_prep_image_bytes", None, 100000)
+
+    text = registry.render()
+
+    assert "# TYPE painful_prep_requests_total counter" in text
+    assert 'painful_prep_requests_total{endpoint="/detect",outcome="ValueError"} 1' in text
+    assert 'painful_prep_request_duration_seconds_bucket{endpoint="/detect",le="0.1"} 0' in text
+    assert 'painful_prep_request_duration_seconds_bucket{endpoint="/detect",le="0.25"} 1' in text
+    assert 'painful_prep_request_duration_seconds_bucket{endpoint="/detect",le="+Inf"} 1' in text
+    assert 'painful_prep_request_duration_seconds_sum{endpoint="/detect"} 0.2' in text
+    assert 'painful_prep_image_bytes_bucket{le="131072"} 1' in text
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.inc("painful_prep_requests_total", {"endpoint": 'a"b\\c', "outcome": "x"})
+
+    assert 'endpoint="a\\"b\\\\c"' in registry.render()
+
+def test_processes_are_added_together(tmp_path):
+    directory = str(tmp_path)
+    process = multiprocessing.get_context("spawn").Process(target=record_in_other_process, args=(directory,))
+    process.start()
+    process.join()
+
+    registry = MetricsRegistry(directory=directory)
+    registry.inc("painful_prep_requests_total", {"endpoint": "/detect", "outcome": "success"})
+    registry.inc("painful_prep_requests_in_flight", {"endpoint": "/detect"})
+    registry.observe("painful_prep_request_duration_seconds", {"endpoint": "/detect"}, 0.3)
+    text = registry.render()
+
+    assert 'painful_prep_requests_total{endpoint="/detect",outcome="success"} 3' in text
+    assert 'painful_prep_request_duration_seconds_count{endpoint="/detect"} 2' in text
+    # The other process has exited, so only this one is still in flight.
+    assert 'painful_prep_requests_in_flight{endpoint="/detect"} 1' in text
+
+def test_flushes_are_throttled(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval_s=0.2)
+    path = tmp_path / f"{os.getpid()}.json"
+
+    registry.inc("painful_prep_requests_total", {"endpoint": "/detect", "outcome": "success"})
+    registry.flush()
+    written = path.read_text()
+
+    registry.inc("painful_prep_requests_total", {"endpoint": "/detect", "outcome": "success"})
+    registry.flush()
+    assert path.read_text() == written
+
+    # The skipped flush is done once the interval has passed.
+    time.sleep(0.4)
+    assert path.read_text() != written
+    assert '"endpoint=\\"/detect\\",outcome=\\"success\\"": 2' in path.read_text()
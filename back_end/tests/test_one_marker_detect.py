@@ -0,0 +1,41 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import pytest
+import numpy as np
+import cv2 as cv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import one_marker_detect
+import one_marker_detect_v2
+import workers
+
+QUAD = np.array([[0, 0], [800, 0], [800, 400], [0, 400]], dtype=np.int32).reshape(-1, 1, 2)
+
+@pytest.mark.parametrize("module", [one_marker_detect, one_marker_detect_v2])
+def test_get_window_dimensions_accepts_path_or_array(module, tmp_path):
+    # Marker 0 is 200 px wide, so each pixel is half a millimetre.
+    image = workers.synthetic_marker_image("ArUco")
+    path = tmp_path / "image.png"
+    cv.imwrite(str(path), image)
+
+    from_array = module.get_window_dimensions(image, QUAD)
+    from_path = module.get_window_dimensions(str(path), QUAD)
+
+    assert from_array == from_path
+    assert from_array == pytest.approx((400 / 25.4, 200 / 25.4), rel=0.01)
+
+def test_find_windowpane_resizes_arrays_to_working_size(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    image = np.full((1512, 2016), 255, dtype=np.uint8)
+    cv.rectangle(image, (500, 300), (1500, 1200), 0, 12)
+    path = tmp_path / "image.png"
+    cv.imwrite(str(path), image)
+
+    from_array = one_marker_detect_v2.find_windowpane(image, 1008)
+    from_path = one_marker_detect_v2.find_windowpane(str(path), 1008)
+
+    assert from_array is not None
+    assert np.array_equal(from_array, from_path)
@@ -0,0 +1,108 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import interfaces
+import pipeline
+import workers
+from two_marker_classes import TwoMarkerDetector
+
+class Stages:
+    'Fake marker and window detectors that record the order they ran in.'
+
+    def __init__(self, stage_dependencies=None):
+        if stage_dependencies is not None:
+            self.stage_dependencies = stage_dependencies
+        self.context = None
+        self.scale_mm = None
+        self.calls = []
+        self.marker_started = threading.Event()
+        self.window_started = threading.Event()
+
+    def get_scale(self, image):
+        self.marker_started.set()
+        self.calls.append("marker_detector")
+        # Only finishes if the window stage is running at the same time.
+        self.overlapped = self.window_started.wait(timeout=0.5)
+        return 2.0
+
+    def detect(self, image):
+        self.window_started.set()
+        self.calls.append("window_detector")
+        return [10.0, 20.0]
+
+    def calculate(self, corners):
+        return corners[0] * self.scale_mm, corners[1] * self.scale_mm
+
+def test_independent_stages_overlap_when_concurrent():
+    stages = Stages()
+
+    # The shared pool may have a single thread on a machine with one core.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        result = pipeline.Pipeline(stages, stages, stages, concurrent=True, executor=executor).run(None)
+
+    assert result == (20.0, 40.0)
+    assert stages.overlapped
+
+def test_sequential_run_keeps_stage_order():
+    stages = Stages()
+
+    assert pipeline.Pipeline(stages, stages, stages).run(None) == (20.0, 40.0)
+    assert stages.calls == ["marker_detector", "window_detector"]
+
+def test_declared_dependencies_are_respected_when_concurrent():
+    stages = Stages({"marker_detector": ("window_detector",)})
+
+    pipeline.Pipeline(stages, stages, stages, concurrent=True).run(None)
+
+    assert stages.calls == ["window_detector", "marker_detector"]
+
+def test_run_stages_rejects_cycles_and_unknown_stages():
+    stages = {"a": lambda: 1, "b": lambda: 2}
+
+    with pytest.raises(ValueError):
+        pipeline.run_stages(stages, {"a": ("b",), "b": ("a",)})
+    with pytest.raises(ValueError):
+        pipeline.run_stages(stages, {"a": ("c",)})
+
+def test_run_stages_raises_stage_errors():
+    def fail():
+        raise RuntimeError("stage failed")
+
+    with pytest.raises(RuntimeError):
+        pipeline.run_stages({"a": fail, "b": lambda: 2}, {}, pipeline.get_executor())
+
+def test_two_marker_detector_runs_concurrently():
+    image = workers.synthetic_marker_image("AprilTag")
+    detector = TwoMarkerDetector(20, "AprilTag", interfaces.StageContext())
+
+    assert pipeline.Pipeline(detector, detector, detector, concurrent=True).run(image) == (5.0, 3.5)
+
+def test_spans_do_nothing_when_timings_are_off():
+    context = interfaces.StageContext()
+
+    with context.span("stage"):
+        pass
+
+    assert context.timings == {}
+    assert context.span("a") is context.span("b")
+
+def test_pipeline_records_stage_timings():
+    image = workers.synthetic_marker_image("AprilTag")
+    detector = TwoMarkerDetector(20, "AprilTag", interfaces.StageContext())
+    stages = pipeline.Pipeline(detector, detector, detector, timings=True)
+
+    stages.run(image)
+    timings = stages.stage_timings()
+
+    assert set(timings["marker_detector"]) == {"get_scale"}
+    assert set(timings["window_detector"]) == {"detect"}
+    assert set(timings["dimension_calculator"]) == {"calculate"}
+    assert timings["marker_detector"]["get_scale"]["wall_ms"] > 0
+    assert timings["marker_detector"]["get_scale"]["count"] == 1
@@ -0,0 +1,47 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from result_cache import ResultCache
+
+def test_key_depends_on_bytes_and_params():
+    key = ResultCache.make_key(b"image", 20, "AprilTag", 1)
+    assert key == ResultCache.make_key(b"image", 20, "AprilTag", 1)
+    assert key != ResultCache.make_key(b"image", 20, "AprilTag", 2)
+    assert key != ResultCache.make_key(b"other", 20, "AprilTag", 1)
+
+def test_memory_tier_counts_hits_and_misses():
+    cache = ResultCache()
+    assert cache.get("a") is None
+    cache.put("a", [7.5, 9.5])
+    assert cache.get("a") == [7.5, 9.5]
+    assert cache.stats() == {"memory_hits": 1, "shared_hits": 0, "misses": 1, "entries": 1}
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+def test_expired_entry_is_a_miss():
+    cache = ResultCache(ttl_s=0.01)
+    cache.put("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+def test_shared_tier_is_visible_to_other_caches(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ResultCache(shared_path=path).put("a", [1.0, 2.0])
+
+    other = ResultCache(shared_path=path)
+    assert other.get("a") == [1.0, 2.0]
+    assert other.get("a") == [1.0, 2.0]
+    assert other.stats()["shared_hits"] == 1
+    assert other.stats()["memory_hits"] == 1
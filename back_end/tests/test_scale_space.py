@@ -0,0 +1,50 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import pytest
+import numpy as np
+import cv2 as cv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import scale_space
+import one_marker_detect_v2
+
+def window_image():
+    'Noisy photo-like frame with a window outline in it.'
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 255, size=(750, 1000)).astype(np.float32)
+    image = cv.GaussianBlur(noise, (0, 0), 3) * 0.5 + 64
+    cv.rectangle(image, (250, 150), (750, 600), 220, 15)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+@pytest.mark.parametrize("sigma", [1.5, 4.0, 7.0, 20.0, 25.0])
+def test_blur_matches_gaussian_blur(sigma):
+    image = window_image()
+    expected = cv.GaussianBlur(image, (0, 0), sigma).astype(int)
+
+    diff = np.abs(scale_space.ScaleSpace(image).blur(sigma).astype(int) - expected)
+
+    assert diff.max() <= 8
+    assert diff.mean() < 0.5
+
+def test_blurs_are_cached_and_built_incrementally():
+    space = scale_space.ScaleSpace(window_image())
+
+    first = space.blur(20.0)
+    level_count = len(space._levels)
+    space.blur(25.0)
+
+    assert space.blur(20.0) is first
+    assert len(space._levels) == level_count + 1
+
+def test_dog_edge_map_matches_exact_blurs():
+    image = window_image()
+    exact = one_marker_detect_v2.apply_dog(image, 4.0, 7.0)
+    shared = one_marker_detect_v2.apply_dog(image, 4.0, 7.0, space=scale_space.ScaleSpace(image))
+
+    _, exact_edges = cv.threshold(exact, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
+    _, shared_edges = cv.threshold(shared, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
+
+    assert np.mean(exact_edges != shared_edges) < 0.02
@@ -3,10 +3,12 @@
 import sys
 import os
 import pytest
+import cv2 as cv
 import numpy as np
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import aruco_registry
 import two_marker_detect
 
 @pytest.mark.parametrize(
@@ -38,3 +40,63 @@ def test_get_scale(marker_corners, expected):
 )
 def test_get_diff_two_markers_px(corner_coords, orientation, expected):
     assert two_marker_detect.get_diff_two_markers_px(corner_coords, orientation) == expected
+
+def square(x, y, side):
+    'Corners of a marker as cv.aruco detectors return them.'
+    return np.array([[[x, y], [x + side, y], [x + side, y + side], [x, y + side]]], dtype=np.float32)
+
+def test_window_sizes_match_one_pair_at_a_time():
+    rng = np.random.default_rng(0)
+    pairs = rng.uniform(0, 3000, (200, 2, 4, 2)).astype(np.float32)
+    # Whole pixel corners give equal coordinates, which get_diff_two_markers_px breaks by order.
+    pairs[::3] = np.round(pairs[::3] / 100) * 100
+
+    widths, heights = two_marker_detect.window_sizes_from_corners(pairs, 20, 0.125)
+    for pair, width, height in zip(pairs, widths, heights):
+        corners = (pair[0].reshape(1, 4, 2), pair[1].reshape(1, 4, 2))
+        assert two_marker_detect.window_size_from_corners(corners, 20, 0.125) == (width, height)
+
+def test_pair_markers_by_id_then_proximity():
+    corners = (
+        square(0, 0, 50), square(2000, 1500, 50),
+        square(3000, 0, 50), square(3300, 200, 50),
+        square(0, 2000, 50), square(200, 2100, 50)
+    )
+    # 2 and 3 are a pair by ID however far apart. 7 and 9 appear twice, so
+    # those markers are paired by proximity.
+    ids = np.array([[2], [3], [7], [7], [9], [9]])
+    assert two_marker_detect.pair_markers(corners, ids) == [(0, 1), (4, 5), (2, 3)]
+    assert two_marker_detect.pair_markers(corners[:3], ids[:3]) == [(0, 1)]
+
+def draw_marker(image, marker_id, x, y, side):
+    'Draw an AprilTag with its top left corner at x, y.'
+    dictionary = cv.aruco.getPredefinedDictionary(aruco_registry.DICTIONARIES["AprilTag"])
+    border_bits = aruco_registry.PARAMETER_PROFILES[("AprilTag", "default")].get("markerBorderBits", 1)
+    image[y:y + side, x:x + side] = cv.aruco.generateImageMarker(dictionary, marker_id, side, borderBits=border_bits)
+
+def test_calculate_windows_measures_every_pair():
+    image = np.full((1000, 2800), 255, dtype=np.uint8)
+    for window in range(2):
+        left = 1400 * window
+        draw_marker(image, 2 * window, left + 100, 100, 200)
+        draw_marker(image, 2 * window + 1, left + 1100, 700, 200)
+
+    windows = two_marker_detect.calculate_windows(image, 20, "AprilTag")
+    assert [window["marker_ids"] for window in windows] == [[0, 1], [2, 3]]
+    assert [window["centre_px"] for window in windows] == [[700, 500], [2100, 500]]
+    assert all((window["width_in"], window["height_in"]) == (5.0, 3.5) for window in windows)
+
+    with pytest.raises(ValueError):
+        two_marker_detect.calculate_windows(image[:, :1000], 20, "AprilTag")
+
+def test_calculate_windows_keeps_small_markers_next_to_large_ones():
+    # A far away window's markers are too small for the coarse pyramid level of
+    # a 6000 px wide photo, while a near window's markers are found there.
+    image = np.full((1200, 6000), 255, dtype=np.uint8)
+    draw_marker(image, 0, 100, 100, 200)
+    draw_marker(image, 1, 1100, 900, 200)
+    draw_marker(image, 2, 2500, 200, 60)
+    draw_marker(image, 3, 2900, 500, 60)
+
+    windows = two_marker_detect.calculate_windows(image, 20, "AprilTag")
+    assert [window["marker_ids"] for window in windows] == [[0, 1], [2, 3]]
@@ -0,0 +1,98 @@
+'To run tests, go to back_end/tests directory, and run pytest from there.'
+
+import sys
+import os
+import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2 as cv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import concurrency
+import workers
+
+@pytest.mark.parametrize("marker_type", ["ArUco", "AprilTag"])
+def test_detect_task_measures_synthetic_image(marker_type):
+    _, encoded = cv.imencode(".png", workers.synthetic_marker_image(marker_type))
+    result = workers.detect_task(encoded.tobytes(), 20, marker_type)
+    assert result == {"width_in": 5.0, "height_in": 3.5}
+
+def test_detect_task_returns_errors():
+    assert "error" in workers.detect_task(b"not an image", 20, "AprilTag")
+
+def encoded(image, extension=".png"):
+    return cv.imencode(extension, image)[1].tobytes()
+
+def test_burst_stops_once_frames_agree():
+    good = encoded(workers.synthetic_marker_image("AprilTag"))
+    blank = encoded(workers.synthetic_marker_image("AprilTag") * 0 + 255)
+    frames = [blank, good, good, good, good, good]
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        result = workers.measure_burst(frames, 20, "AprilTag", executor=executor, max_in_flight=1)
+
+    assert (result["width_in"], result["height_in"]) == (5.0, 3.5)
+    assert result["converged"] and result["frames_used"] == 3
+    assert "error" in result["frames"][0]
+    assert [frame.get("skipped", False) for frame in result["frames"]] == [False] * 4 + [True] * 2
+
+def test_burst_reports_error_when_no_frame_measures():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        result = workers.measure_burst([b"not an image"] * 2, 20, "AprilTag", executor=executor)
+    assert "error" in result and len(result["frames"]) == 2
+
+def test_fused_measurement_ignores_an_outlier():
+    results = [
+        {"width_in": 30.0, "height_in": 20.0},
+        {"width_in": 30.5, "height_in": 20.0},
+        {"width_in": 41.0, "height_in": 12.5},
+        {"width_in": 30.0, "height_in": 20.5}
+    ]
+    assert workers.fuse_measurements(results) == (30.5, 20.0)
+    assert workers.count_agreeing(results) == 3
+
+def crash_on_request(data, marker_size_mm, marker_type="AprilTag"):
+    'Stand-in for detect_task whose process dies on b"crash", as on an OpenCV segfault.'
+    if data == b"crash":
+        os._exit(1)
+    return {"width_in": 5.0, "height_in": 3.5}
+
+@pytest.fixture
+def crashing_pool(monkeypatch):
+    # The patched detect_task is sent to the worker processes by name, which import it from this module.
+    monkeypatch.setattr(workers, "detect_task", crash_on_request)
+    monkeypatch.setattr(workers, "BATCH_WORKERS", 1)
+    workers.shutdown_pool()
+    yield
+    workers.shutdown_pool()
+
+def test_dead_worker_is_reported_and_pool_replaced(crashing_pool):
+    pool = workers.get_pool()
+    futures = [workers.submit_detect(pool, data, 20) for data in (b"crash", b"image")]
+    assert [workers.task_result(future) for future in futures] == [{"error": workers.WORKER_DIED_ERROR}] * 2
+    assert workers.task_result(workers.submit_detect(pool, b"image", 20)) == {"error": workers.WORKER_DIED_ERROR}
+
+    replacement = workers.get_pool()
+    assert replacement is not pool
+    assert workers.task_result(workers.submit_detect(replacement, b"image", 20)) == {"width_in": 5.0, "height_in": 3.5}
+
+def test_burst_survives_a_dead_worker(crashing_pool):
+    result = workers.measure_burst([b"crash"], 20)
+    assert result["error"] == workers.WORKER_DIED_ERROR
+
+    result = workers.measure_burst([b"image"] * 3, 20)
+    assert (result["width_in"], result["height_in"]) == (5.0, 3.5) and result["converged"]
+
+def test_pool_work_holds_a_detection_slot_until_done(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(workers, "detect_task", lambda *args: release.wait() and {"width_in": 5.0, "height_in": 3.5})
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(concurrency, "_slots", slots)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future = workers.submit_detect(executor, b"image", 20)
+        assert not slots.acquire(blocking=False)
+        release.set()
+        future.result()
+    assert slots.acquire(blocking=False)
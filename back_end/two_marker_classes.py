@@ -18,12 +18,47 @@ import cv2 as cv
 import numpy as np
 import interfaces
 import custom_exceptions
+import aruco_registry
 import two_marker_detect
 import pipeline
 import math
+from image_io import ImageSource, load_image
+
+def draw_detections(image: np.ndarray, corners, ids, failed) -> np.ndarray:
+    """
+    @brief Draws detected markers in green and rejected candidates in red.
+
+    @param image Image the markers were searched for in.
+    @param corners Corners of the detected markers.
+    @param ids Ids of the detected markers, or None if there are none.
+    @param failed Corners of the rejected candidates.
+
+    @return BGR copy of image with the markers drawn on it.
+    """
+    if len(image.shape) == 2:
+        debug_image = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    else:
+        debug_image = image.copy()
+
+    if ids is not None:
+        debug_image = cv.aruco.drawDetectedMarkers(
+            image       =debug_image,
+            corners     =corners,
+            ids         =ids,
+            borderColor =(0, 255, 0)
+            )
+
+    return cv.aruco.drawDetectedMarkers(
+        image=debug_image,
+        corners=failed,
+        borderColor=(0, 0, 255)
+    )
 
 class TwoMarkerDetector():
-    def __init__(self, marker_size_mm, marker_type, context: interfaces.StageContext):
+    # The window corners are the marker corners found while computing the scale.
+    stage_dependencies = {"window_detector": ("marker_detector",)}
+
+    def __init__(self, marker_size_mm, marker_type, context: interfaces.StageContext, pyramid: bool = False):
         self.marker_size_mm = marker_size_mm
         self.marker_quantity = 2
         self.marker_type: Literal["ArUco", "AprilTag"] = marker_type
@@ -32,80 +67,45 @@ class TwoMarkerDetector():
         self.MM_IN_RATIO = 25.4
         self.scale_mm: float | None = None
         self._border_size_in = 0.125
+        self.pyramid = pyramid
     
-    def get_scale(self, image: np.ndarray) -> float:
+    def get_scale(self, image: ImageSource) -> float:
         """
         @brief Computes the pixel scale from an ArUco marker.
 
         Given an image, this function calculates the scale in millimeters of the markers in the image.
 
-        @param image An opencv image.
+        @param image An opencv image or a path to an image file.
 
         @return The average scale of the markers in the image.
         """
+        image = load_image(image, cv.IMREAD_COLOR_BGR)
+
         if len(image.shape) == 3 and image.shape[2] == 3:
             reload_image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
         else:
             reload_image = image
         
         # Find markers.
-        if self.marker_type == "ArUco":
-            corners, ids, failed = cv.aruco.detectMarkers(
-            image       =reload_image,
-            dictionary  =cv.aruco.getPredefinedDictionary(cv.aruco.DICT_4X4_50)
-            )
-        elif self.marker_type == "AprilTag":
-            dictionary = cv.aruco.getPredefinedDictionary(cv.aruco.DICT_APRILTAG_16H5)
-            params = cv.aruco.DetectorParameters()
-            params.markerBorderBits = 2
-            params.adaptiveThreshWinSizeStep = 1
-
-            corners, ids, failed = cv.aruco.detectMarkers(
-                image       = reload_image,
-                dictionary  = dictionary,
-                parameters  = params
+        if self.pyramid:
+            corners, ids, failed = aruco_registry.detect_markers_pyramid(
+                reload_image, self.marker_type, min_markers=self.marker_quantity
             )
+        else:
+            corners, ids, failed = aruco_registry.detect_markers(reload_image, self.marker_type)
         
-         # Exit if there are too few or too many markers.
-        if ids is None:
-            debug_image = cv.aruco.drawDetectedMarkers(
-                image=detected_image,
-                corners=failed,
-                borderColor=(0, 0, 255)
-            )
-            
-            self.context.images["debug_image"] = debug_image
-
-            raise custom_exceptions.MarkerNotFoundError(
-                message=f"expected {self.marker_quantity} markers but found 0 markers",
-                errors=custom_exceptions.MarkerDetectionErrorDetails(
-                    expected_quantity=self.marker_quantity,
-                    detected_quantity=0,
-                    detected_ids=None
-                )
+        # Exit if there are too few or too many markers.
+        if ids is None or len(ids) != self.marker_quantity:
+            self.context.add_artifact(
+                "debug_image",
+                lambda: draw_detections(image, corners, ids, failed)
             )
 
-        elif len(ids) != self.marker_quantity:
-            detected_image = cv.aruco.drawDetectedMarkers(
-                image       =image,
-                corners     =corners,
-                ids         =ids,
-                borderColor =(0, 255, 0)
-                )
-            
-            debug_image = cv.aruco.drawDetectedMarkers(
-                image=detected_image,
-                corners=failed,
-                borderColor=(0, 0, 255)
-            )
-
-            self.context.images["debug_image"] = debug_image
-
             raise custom_exceptions.MarkerNotFoundError(
-                message=f"expected {self.marker_quantity} markers but found 0 markers",
+                message=f"expected {self.marker_quantity} markers but found {0 if ids is None else len(ids)} markers",
                 errors=custom_exceptions.MarkerDetectionErrorDetails(
                     expected_quantity=self.marker_quantity,
-                    detected_quantity=len(ids),
+                    detected_quantity=0 if ids is None else len(ids),
                     detected_ids=ids
                 )
             )
@@ -116,7 +116,7 @@ class TwoMarkerDetector():
         scale_mm = self.marker_size_mm / scale_px
         return scale_mm
     
-    def detect(self, image: np.ndarray) -> np.ndarray:
+    def detect(self, image: ImageSource) -> np.ndarray:
         if not self._corners:
             self.get_scale(image)
         return self._corners
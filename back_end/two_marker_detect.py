@@ -3,7 +3,9 @@
 @brief Gets dimensions of a window in an image containing two markers in opposing corners.
 
 This script detects two ArUco markers in an image and calculates the width and height 
-of a window using the known size of the markers.
+of a window using the known size of the markers. calculate_windows measures every
+marked window in a photo with a single detection, pairing markers by ID or by
+proximity.
 
 Usage:
     python two_marker_detect.py <filepath> <marker_size>
@@ -13,19 +15,27 @@ Usage:
 
 import cv2 as cv
 import numpy as np
-import math
 import sys
 import os
 from pathlib import Path
 from typing import Literal
 
 from one_marker_detect import MM_IN_RATIO
+import aruco_registry
+import interfaces
+from image_io import ImageSource, load_image
+
+# Bump when a change alters the dimensions calculate_two_markers returns, so
+# cached results from the old algorithm are not reused.
+ALGORITHM_VERSION = 2
 
 def calculate_two_markers(
-        path: Path, 
+        path: ImageSource, 
         marker_size_mm: int,
         marker_type: Literal["ArUco", "AprilTag"]="ArUco",
-        border_offset_in: float = 0
+        border_offset_in: float = 0,
+        pyramid: bool = False,
+        context: interfaces.StageContext | None = None
     ) -> tuple[int, int]:
     """
     @brief Finds the width and height of a window using two ArUco markers.
@@ -38,7 +48,7 @@ def calculate_two_markers(
     camera angles, the final computed dimension is rounded up to the nearest half 
     inch.
 
-    @param path Path to the image file.
+    @param path Path to the image file, or an already decoded BGR or grayscale image.
     @param marker_size_mm Known size of the marker in millimeters.
     @param marker_type Defines the specific markers in the image. Has to be a literal
            value either "ArUco" or "AprilTag". Defaults to ArUco markers. 
@@ -46,63 +56,122 @@ def calculate_two_markers(
            White borders help in improving detection of markers and the border size is
            used for calculating the dimensions of the window. Defaults to 0. Border size
            has to be provided in inches.
+    @param pyramid Find markers on a downscaled copy of the image first and only search
+           small windows around them at full resolution. Much faster on large photos.
+    @param context StageContext to record the time of each step in, if it records timings.
 
     @return Tuple (width, height) of the window in inches. Returns None if the number 
             of markers detected is not exactly two.
     """
-    image = cv.imread(path, cv.IMREAD_COLOR_BGR)
+    context = context or interfaces.StageContext()
+
+    with context.span("load_image"):
+        image = load_image(path, cv.IMREAD_COLOR_BGR)
 
     # Find markers.
-    if marker_type == "ArUco":
-        corners, ids, _ = cv.aruco.detectMarkers(
-            image       =image,
-            dictionary  =cv.aruco.getPredefinedDictionary(cv.aruco.DICT_4X4_50)
-        )
-    elif marker_type == "AprilTag":
-        dictionary = cv.aruco.getPredefinedDictionary(cv.aruco.DICT_APRILTAG_16H5)
-        params = cv.aruco.DetectorParameters()
-        params.markerBorderBits = 2
-        params.adaptiveThreshWinSizeStep = 1
-
-        corners, ids, _ = cv.aruco.detectMarkers(
-            image       = image,
-            dictionary  = dictionary,
-            parameters  = params
-        )
+    with context.span("detect_markers"):
+        if pyramid:
+            corners, ids, _ = aruco_registry.detect_markers_pyramid(image, marker_type, min_markers=2)
+        else:
+            corners, ids, _ = aruco_registry.detect_markers(image, marker_type)
 
     # Exit if there are too few or too many markers.
     if ids is None or len(ids) != 2:
         raise ValueError("Unable to detect two markers, please take or upload another image.")
 
+    with context.span("geometry"):
+        return window_size_from_corners(corners, marker_size_mm, border_offset_in)
+
+def window_size_from_corners(
+        corners,
+        marker_size_mm: int,
+        border_offset_in: float = 0
+    ) -> tuple[float, float]:
+    """
+    @brief Finds the width and height of a window from the corners of its two markers.
+
+    @param corners Corners of exactly two markers in the format returned by
+           cv.aruco detectors, a sequence of two 1x4x2 arrays.
+    @param marker_size_mm Known size of the marker in millimeters.
+    @param border_offset_in Size of the white border around each marker in inches.
+
+    @return Tuple (width, height) of the window in inches, rounded up to the
+            nearest half inch.
+    """
+    widths, heights = window_sizes_from_corners(np.stack(corners).reshape(1, 2, 4, 2), marker_size_mm, border_offset_in)
+    return float(widths[0]), float(heights[0])
+
+def window_sizes_from_corners(
+        pairs: np.ndarray,
+        marker_size_mm: int,
+        border_offset_in: float = 0
+    ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    @brief Finds the width and height of many windows at once from the corners of their markers.
+
+    Does the same calculation as get_scale and get_diff_two_markers_px for every
+    pair at once. The scale of each window is the average side length of its two
+    markers. The diagonal is the one the two markers sit on: top left to bottom
+    right if the marker further left is also higher. Its ends are the outermost
+    corners of the markers on that diagonal.
+
+    @param pairs Array of shape (N, 2, 4, 2) with the four corners of both markers
+           of N windows, as cv.aruco detectors return them.
+    @param marker_size_mm Known size of the markers in millimeters.
+    @param border_offset_in Size of the white border around each marker in inches.
+
+    @return Tuple (widths, heights) of arrays of N dimensions in inches, rounded
+            up to the nearest half inch.
+    """
+    pairs = np.asarray(pairs)
+    if not np.issubdtype(pairs.dtype, np.floating):
+        pairs = pairs.astype(np.float32)
+    pairs = pairs.reshape(-1, 2, 4, 2)
+    rows = np.arange(len(pairs))
+
     # Get the average scale.
-    scale_px = (get_scale(corners[0][0]) + get_scale(corners[1][0])) / 2
+    sides = np.linalg.norm(pairs - np.roll(pairs, -1, axis=2), axis=-1)
+    scale_px = (sides[:, 0].mean(axis=-1) + sides[:, 1].mean(axis=-1)) / 2
 
     # Clean corner coordinates.
-    corners = [arr.squeeze() for arr in corners]
-    corners = [[[round(x) for x in row] for row in marker] for marker in corners]
-    corner_coords = np.concatenate(corners)
-
-    # Find which marker is the top marker. OpenCV image
-    # coordinate origin (0, 0) is the top left corner of images. 
-    if corners[0][0][0] < corners[1][0][0]:
-        top_marker_coords = corners[0]
-        bottom_marker_coords = corners[1] 
-    else:
-        top_marker_coords = corners[1]
-        bottom_marker_coords = corners[0]
-    
-    is_top_marker_left = top_marker_coords[0][1] < bottom_marker_coords[0][1]
-
-    # Top left, bottom right diagonal case.
-    if is_top_marker_left:
-        t_coord_x, t_coord_y, b_coord_x, b_coord_y = get_diff_two_markers_px(corner_coords, "TLBR")
-    # Top right, bottom left diagonal case.
-    else:
-        t_coord_x, t_coord_y, b_coord_x, b_coord_y = get_diff_two_markers_px(corner_coords, "TRBL")
-    
+    corners = np.rint(pairs).astype(np.int64)
+
+    # Find which marker is further left, and whether it is also the higher one.
+    # OpenCV image coordinate origin (0, 0) is the top left corner of images.
+    left = np.where(corners[:, 0, 0, 0] < corners[:, 1, 0, 0], 0, 1)
+    is_top_marker_left = corners[rows, left, 0, 1] < corners[rows, 1 - left, 0, 1]
+
+    points = corners.reshape(-1, 8, 2)
+    x, y = points[..., 0], points[..., 1]
+
+    # The two highest and the two lowest corners. Equal coordinates resolve to
+    # the first corner, as in get_diff_two_markers_px.
+    ascending = np.argsort(y, axis=1, kind="stable")
+    descending = np.argsort(-y, axis=1, kind="stable")
+    y_ascending = np.take_along_axis(y, ascending, axis=1)
+    y_descending = np.take_along_axis(y, descending, axis=1)
+    top_1 = ascending[:, 0]
+    top_2 = np.where(y_ascending[:, 1] == y_ascending[:, 0], top_1, ascending[:, 1])
+    bottom_1 = descending[:, 0]
+    bottom_2 = np.where(y_descending[:, 1] == y_descending[:, 0], bottom_1, descending[:, 1])
+
+    # Pick the left or right one of each, depending on the diagonal.
+    top_x_1, top_x_2 = x[rows, top_1], x[rows, top_2]
+    bottom_x_1, bottom_x_2 = x[rows, bottom_1], x[rows, bottom_2]
+    top = np.where(
+        is_top_marker_left,
+        np.where(top_x_1 < top_x_2, top_1, top_2),
+        np.where(top_x_1 > top_x_2, top_1, top_2)
+    )
+    bottom = np.where(
+        is_top_marker_left,
+        np.where(bottom_x_1 > bottom_x_2, bottom_1, bottom_2),
+        np.where(bottom_x_1 < bottom_x_2, bottom_1, bottom_2)
+    )
+
     # Get width and height in pixels.
-    h_px = abs(t_coord_x - b_coord_x)
-    w_px = abs(t_coord_y - b_coord_y)
+    h_px = np.abs(x[rows, top] - x[rows, bottom]).astype(scale_px.dtype)
+    w_px = np.abs(y[rows, top] - y[rows, bottom]).astype(scale_px.dtype)
 
     # Convert width and height to inches.
     scale_mm = marker_size_mm / scale_px
@@ -111,10 +180,100 @@ def calculate_two_markers(
     w_in = (w_px * scale_mm) / MM_IN_RATIO + border_offset_in * 2
 
     # Always round up to the nearest half inch.
-    h_in = math.ceil(h_in * 2) / 2
-    w_in = math.ceil(w_in * 2) / 2
+    return np.ceil(h_in * 2) / 2, np.ceil(w_in * 2) / 2
+
+def pair_markers(corners, ids: np.ndarray) -> list[tuple[int, int]]:
+    """
+    @brief Groups detected markers into the two markers of each window.
+
+    By convention the markers with IDs 2k and 2k + 1 mark window k. Markers
+    whose partner by ID is missing, or whose ID appears more than once, are
+    paired with each other by proximity, closest centres first.
+
+    @param corners Corners of the markers as returned by cv.aruco detectors.
+    @param ids IDs of the markers as returned by cv.aruco detectors.
+
+    @return List of (index, index) pairs into corners, ordered by window ID
+            first and then by proximity. Markers left without a partner are
+            not included.
+    """
+    ids = np.asarray(ids).ravel()
+    unique, counts = np.unique(ids, return_counts=True)
+    single = set(unique[counts == 1].tolist())
+    index_of = {int(marker_id): index for index, marker_id in enumerate(ids)}
+
+    pairs = []
+    for marker_id in sorted(single):
+        if marker_id % 2 == 0 and marker_id + 1 in single:
+            pairs.append((index_of[marker_id], index_of[marker_id + 1]))
+
+    paired = {index for pair in pairs for index in pair}
+    remaining = [index for index in range(len(ids)) if index not in paired]
+    if len(remaining) >= 2:
+        centres = np.array([np.asarray(corners[index]).reshape(4, 2).mean(axis=0) for index in remaining])
+        distances = np.linalg.norm(centres[:, None] - centres[None], axis=-1)
+        distances[np.diag_indices(len(remaining))] = np.inf
+        for _ in range(len(remaining) // 2):
+            i, j = np.unravel_index(np.argmin(distances), distances.shape)
+            pairs.append(tuple(sorted((remaining[i], remaining[j]))))
+            distances[[i, j], :] = np.inf
+            distances[:, [i, j]] = np.inf
+
+    return pairs
+
+def calculate_windows(
+        path: ImageSource,
+        marker_size_mm: int,
+        marker_type: Literal["ArUco", "AprilTag"] = "ArUco",
+        border_offset_in: float = 0,
+        context: interfaces.StageContext | None = None
+    ) -> list[dict]:
+    """
+    @brief Finds the width and height of every marked window in an image.
+
+    Decodes the image and detects markers once, pairs the markers with
+    pair_markers and measures all pairs with window_sizes_from_corners.
+    Markers are always searched at full resolution. The coarse level of
+    aruco_registry.detect_markers_pyramid misses markers of far away windows,
+    and as long as two other markers are found nothing would show they are gone.
+
+    @param path Path to the image file, or an already decoded BGR or grayscale image.
+    @param marker_size_mm Known size of the markers in millimeters.
+    @param marker_type Marker family in the image, "ArUco" or "AprilTag".
+    @param border_offset_in Size of the white border around each marker in inches.
+    @param context StageContext to record the time of each step in, if it records timings.
+
+    @return List with a dictionary per window holding the IDs of its markers,
+            the centre of the window in pixels, and width_in and height_in.
+    """
+    context = context or interfaces.StageContext()
+
+    with context.span("load_image"):
+        image = load_image(path, cv.IMREAD_COLOR_BGR)
+
+    with context.span("detect_markers"):
+        corners, ids, _ = aruco_registry.detect_markers(image, marker_type)
+
+    pairs = pair_markers(corners, ids) if ids is not None else []
+    if not pairs:
+        raise ValueError("Unable to detect two markers, please take or upload another image.")
 
-    return h_in, w_in
+    with context.span("geometry"):
+        marker_corners = np.stack([np.asarray(marker).reshape(4, 2) for marker in corners])
+        pair_corners = marker_corners[np.array(pairs)]
+        widths, heights = window_sizes_from_corners(pair_corners, marker_size_mm, border_offset_in)
+        centres = pair_corners.reshape(len(pairs), 8, 2).mean(axis=1)
+
+    ids = ids.ravel()
+    return [
+        {
+            "marker_ids": [int(ids[first]), int(ids[second])],
+            "centre_px": [round(float(x)), round(float(y))],
+            "width_in": float(width),
+            "height_in": float(height)
+        }
+        for (first, second), (x, y), width, height in zip(pairs, centres, widths, heights)
+    ]
 
 def get_scale(corners: np.ndarray) -> float:
     """
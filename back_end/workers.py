@@ -0,0 +1,251 @@
+"""
+@file workers.py
+@brief Process pool used to run marker detection outside of the request thread.
+
+Detection is CPU bound, so requests that carry several images hand them to a
+pool of worker processes. Each worker imports OpenCV and runs one synthetic
+detection when it starts so the first real image does not pay for start up.
+The pool has one process per detection the server process may run at once, and
+each process uses the OpenCV threads of the budget in concurrency.py.
+"""
+
+from concurrent.futures import Executor, FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Literal
+import multiprocessing
+import os
+import statistics
+import threading
+import cv2 as cv
+import numpy as np
+
+from image_io import decode_image
+import aruco_registry
+import concurrency
+from two_marker_detect import calculate_two_markers
+
+# Number of worker processes in the batch pool.
+BATCH_WORKERS = int(os.environ.get("PAINFUL_PREP_BATCH_WORKERS", concurrency.process_tasks()))
+
+# A burst stops once this many frames agree, within the half inch that
+# calculate_two_markers rounds to.
+BURST_AGREEING_FRAMES = int(os.environ.get("PAINFUL_PREP_BURST_AGREEING_FRAMES", 3))
+BURST_TOLERANCE_IN = 0.5
+
+# Result of an image whose worker process died, for example when it ran out of
+# memory or OpenCV crashed on the upload.
+WORKER_DIED_ERROR = "The worker measuring this image stopped, please try again."
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+# Set once a task of the shared pool reports that a worker process died. Such a
+# pool refuses all further work, so get_pool replaces it.
+_pool_broken = False
+
+def synthetic_marker_image(marker_type: Literal["ArUco", "AprilTag"] = "AprilTag") -> np.ndarray:
+    """
+    @brief Draws two markers in opposing corners of a blank grayscale image.
+
+    The image is small, but goes through the same code path as a real photo.
+    With a 20 mm marker it measures 5.0 x 3.5 inches.
+
+    @param marker_type Marker family to draw.
+
+    @return Grayscale image containing two markers.
+    """
+    dictionary = cv.aruco.getPredefinedDictionary(aruco_registry.DICTIONARIES[marker_type])
+    border_bits = aruco_registry.PARAMETER_PROFILES[(marker_type, "default")].get("markerBorderBits", 1)
+
+    image = np.full((1000, 1400), 255, dtype=np.uint8)
+    image[100:300, 100:300] = cv.aruco.generateImageMarker(dictionary, 0, 200, borderBits=border_bits)
+    image[700:900, 1100:1300] = cv.aruco.generateImageMarker(dictionary, 1, 200, borderBits=border_bits)
+    return image
+
+def warm_up():
+    'Set the OpenCV thread budget and run one detection per marker type, so that a fresh process is ready for real work.'
+    concurrency.set_opencv_threads()
+    for marker_type in ("ArUco", "AprilTag"):
+        calculate_two_markers(synthetic_marker_image(marker_type), 20, marker_type, pyramid=True)
+
+def detect_task(
+        data: bytes,
+        marker_size_mm: int,
+        marker_type: Literal["ArUco", "AprilTag"] = "AprilTag"
+    ) -> dict:
+    """
+    @brief Decodes an encoded image and measures the window in it.
+
+    Errors are returned rather than raised so that one bad image does not take
+    down the rest of a batch.
+
+    @param data Encoded image bytes.
+    @param marker_size_mm Known size of the markers in millimeters.
+    @param marker_type Marker family in the image.
+
+    @return Dictionary with width_in and height_in, or error.
+    """
+    try:
+        image = decode_image(data)
+        width, height = calculate_two_markers(image, marker_size_mm, marker_type, pyramid=True)
+        return {
+            "width_in": round(width, 2),
+            "height_in": round(height, 2)
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+def submit_detect(executor: Executor, *args) -> Future:
+    """
+    @brief Submits detect_task once a detection slot of this process is free.
+
+    The slot, see concurrency.detection_slots, is held until the task has
+    finished or was cancelled, so work in the pool counts against the same
+    budget as detections run in request threads.
+
+    @param executor Pool to run detect_task on.
+    @param args Arguments of detect_task.
+
+    @return Future of the task, already finished with an error if the pool is broken.
+    """
+    global _pool_broken
+    slots = concurrency.detection_slots()
+    slots.acquire()
+    try:
+        future = executor.submit(detect_task, *args)
+    except BrokenProcessPool:
+        _pool_broken = True
+        future = Future()
+        future.set_result({"error": WORKER_DIED_ERROR})
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+def task_result(future: Future) -> dict:
+    'Return the result of a detect_task future, or an error if its worker process died.'
+    global _pool_broken
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        _pool_broken = True
+        return {"error": WORKER_DIED_ERROR}
+
+def fuse_measurements(results: list[dict]) -> tuple[float, float]:
+    """
+    @brief Combines the measurements of several frames of the same window.
+
+    The upper median is used, so a single bad frame cannot pull the result and
+    the result stays on the half inch grid of the frames.
+
+    @param results Successful detect_task results.
+
+    @return Tuple (width, height) in inches.
+    """
+    return (
+        statistics.median_high(result["width_in"] for result in results),
+        statistics.median_high(result["height_in"] for result in results)
+    )
+
+def count_agreeing(results: list[dict], tolerance: float = BURST_TOLERANCE_IN) -> int:
+    'Return how many results are within tolerance of the fused width and height.'
+    if not results:
+        return 0
+    width, height = fuse_measurements(results)
+    return sum(
+        abs(result["width_in"] - width) <= tolerance and abs(result["height_in"] - height) <= tolerance
+        for result in results
+    )
+
+def measure_burst(
+        frames: list[bytes],
+        marker_size_mm: int,
+        marker_type: Literal["ArUco", "AprilTag"] = "AprilTag",
+        executor: Executor | None = None,
+        max_in_flight: int = BATCH_WORKERS,
+        agreeing_frames: int = BURST_AGREEING_FRAMES
+    ) -> dict:
+    """
+    @brief Measures a window from several frames, stopping once enough of them agree.
+
+    Frames are measured concurrently, at most max_in_flight at a time, in the
+    order they were given. As soon as agreeing_frames successful frames agree
+    with the fused result, frames that have not started are cancelled and
+    results of frames still running are ignored.
+
+    @param frames Encoded images of the same window.
+    @param marker_size_mm Known size of the markers in millimeters.
+    @param marker_type Marker family in the images.
+    @param executor Pool to run detect_task on. Defaults to the shared worker pool.
+    @param max_in_flight Largest number of frames submitted at once.
+    @param agreeing_frames Number of agreeing frames after which the rest are skipped.
+
+    @return Dictionary with the fused width_in and height_in, whether the frames
+            converged, and the result of every frame, or error if no frame could
+            be measured.
+    """
+    executor = executor or get_pool()
+    results: list[dict | None] = [None] * len(frames)
+    pending = {}
+    next_frame = 0
+    converged = False
+
+    while True:
+        while next_frame < len(frames) and len(pending) < max_in_flight:
+            pending[submit_detect(executor, frames[next_frame], marker_size_mm, marker_type)] = next_frame
+            next_frame += 1
+        if not pending:
+            break
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[pending.pop(future)] = task_result(future)
+
+        successes = [result for result in results if result is not None and "error" not in result]
+        if count_agreeing(successes) >= min(agreeing_frames, len(frames)):
+            converged = True
+            break
+
+    for future in pending:
+        future.cancel()
+
+    summary = [
+        {"index": index, **(result if result is not None else {"skipped": True})}
+        for index, result in enumerate(results)
+    ]
+    successes = [result for result in results if result is not None and "error" not in result]
+    if not successes:
+        errors = [result["error"] for result in results if result is not None]
+        return {"error": errors[0] if errors else "No frames to measure.", "frames": summary}
+
+    width, height = fuse_measurements(successes)
+    return {
+        "width_in": width,
+        "height_in": height,
+        "converged": converged,
+        "frames_used": len(successes),
+        "frames": summary
+    }
+
+def get_pool() -> ProcessPoolExecutor:
+    'Return the shared worker pool, starting it on first use and again after a worker process died.'
+    global _pool, _pool_broken
+    with _pool_lock:
+        if _pool is not None and _pool_broken:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        _pool_broken = False
+        if _pool is None:
+            # The server process runs request, job and timer threads. A forked
+            # child would inherit the locks they hold, so workers start from a
+            # clean process instead.
+            context = multiprocessing.get_context("forkserver")
+            _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=context, initializer=warm_up)
+        return _pool
+
+def shutdown_pool():
+    'Stop the shared worker pool if it was started.'
+    global _pool, _pool_broken
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+        _pool_broken = False